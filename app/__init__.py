@@ -6,6 +6,15 @@ def create_app(config_class=config.Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    from app.utils.logging_utils import configure_logging
+    configure_logging()
+
+    from app.services import diagram_service
+    diagram_service.warm_up()
+
+    from app.services.asset_service import asset_url
+    app.jinja_env.globals['asset_url'] = asset_url
+
     from app.api.routes import main
     app.register_blueprint(main)
 
@@ -0,0 +1,84 @@
+import os
+from fastapi import APIRouter, Request
+from fastapi.responses import Response, StreamingResponse
+from fastapi.templating import Jinja2Templates
+from app.services import diagram_service
+from app.services.asset_service import asset_url
+from app.services.diagram_service import ServiceResponse
+from app.services.metrics_service import render_metrics
+
+router = APIRouter()
+
+templates = Jinja2Templates(directory=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates'))
+templates.env.globals['asset_url'] = asset_url
+
+
+def to_asgi(response: ServiceResponse) -> Response:
+    """
+    Turns a service response into a Starlette response. Streams run on the server's
+    event loop.
+    """
+    if response.lines is not None:
+        return StreamingResponse(response.lines, status_code=response.status,
+                                 media_type='application/x-ndjson', headers=response.headers)
+    return Response(response.body, status_code=response.status, media_type=response.media_type,
+                    headers=response.headers)
+
+
+async def _json(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+@router.get('/')
+async def index(request: Request):
+    return templates.TemplateResponse(request, 'index.html', diagram_service.index_context())
+
+
+@router.get('/api/models')
+async def get_models(provider: str = None):
+    return to_asgi(diagram_service.list_models(provider))
+
+
+@router.get('/api/stats')
+async def get_stats():
+    return to_asgi(diagram_service.stats())
+
+
+@router.get('/metrics')
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+
+@router.get('/assets/{name:path}')
+def get_asset(name: str, request: Request):
+    return to_asgi(diagram_service.get_asset(name, request.headers))
+
+
+@router.get('/d/{name}')
+def get_artifact(name: str, request: Request):
+    # Reads from disk, so it runs in the threadpool
+    return to_asgi(diagram_service.get_artifact(name, request.headers))
+
+
+@router.post('/api/ask')
+async def handler(request: Request):
+    return to_asgi(await diagram_service.ask(await _json(request), request.headers, request.query_params))
+
+
+@router.post('/api/ask/stream')
+async def stream_handler(request: Request):
+    return to_asgi(diagram_service.ask_stream(await _json(request)))
+
+
+@router.post('/api/ask/multi')
+async def multi_handler(request: Request):
+    return to_asgi(await diagram_service.ask_multi(await _json(request)))
+
+
+@router.post('/api/ask/batch')
+async def batch_handler(request: Request):
+    return to_asgi(diagram_service.ask_batch(await _json(request)))
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Literal, Optional
+from app.utils.template_utils import TemplateEnum
 
 class DiagramRequest(BaseModel):
     input: str
@@ -9,6 +10,29 @@ class DiagramRequest(BaseModel):
     temperature: float = Field(0.7, ge=0, le=1)
     maxTokens: int = Field(4096, gt=0)
     apiKey: Optional[str] = None
+    format: Literal['mermaid', 'svg'] = 'mermaid'
 
 class DiagramResponse(BaseModel):
     text: str
+
+class MultiDiagramRequest(BaseModel):
+    input: str
+    selectedTemplates: List[TemplateEnum] = Field(..., min_length=1)
+    provider: str
+    model: str
+    temperature: float = Field(0.7, ge=0, le=1)
+    maxTokens: int = Field(4096, gt=0)
+    apiKey: Optional[str] = None
+
+    @field_validator('selectedTemplates', mode='before')
+    @classmethod
+    def unique_templates(cls, value):
+        # Template names are case-insensitive and each is generated once
+        if not isinstance(value, list):
+            return value
+        templates = []
+        for template in value:
+            template = template.upper() if isinstance(template, str) else template
+            if template not in templates:
+                templates.append(template)
+        return templates
@@ -1,78 +1,73 @@
-from flask import Blueprint, render_template, request, jsonify
-from app.utils.llm_utils import set_llm, get_available_llms
-from app.utils.mermaid_utils import render_mermaid
-from app.utils.template_utils import get_templates
-from app.utils.template_utils import TemplateEnum
-from app.utils.mermaid_utils import generate
-import app.utils.error_handling as error_handling
+from flask import Blueprint, Response, render_template, request, stream_with_context
+from app.utils.async_utils import iterate_async
+from app.services import diagram_service
+from app.services.diagram_service import ServiceResponse
+from app.services.metrics_service import render_metrics
 
 import logging
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 main = Blueprint('main', __name__)
 
+
+def to_flask(response: ServiceResponse) -> Response:
+    """
+    Turns a service response into a Flask response. Streams are driven on a private
+    event loop of the request's thread.
+    """
+    if response.lines is not None:
+        return Response(stream_with_context(iterate_async(response.lines)), status=response.status,
+                        mimetype='application/x-ndjson', headers=response.headers)
+    return Response(response.body, status=response.status, mimetype=response.media_type, headers=response.headers)
+
+
 @main.route('/')
 def index():
-    templates = get_templates()
-    available_llms = get_available_llms()
-    return render_template('index.html', templates=templates, available_llms=available_llms)
+    return render_template('index.html', **diagram_service.index_context())
 
 
 @main.route('/api/models')
 def get_models():
-    provider = request.args.get('provider')
-    
-    if provider == 'openai':
-        models = [
-            {"value": "gpt-3.5-turbo", "label": "GPT-3.5 Turbo"},
-            {"value": "gpt-4", "label": "GPT-4"},
-            {"value": "gpt-4-turbo", "label": "GPT-4 Turbo"},
-        ]
-        return jsonify(models)
-    
-    elif provider == 'gemini':
-        models = [
-            {"value": "gemini-1.5-pro", "label": "Gemini 1.5 Pro"},
-            {"value": "gemini-1.5-flash", "label": "Gemini 1.5 Flash"},
-            {"value": "gemini-1.0-pro", "label": "Gemini 1.0 Pro"},
-        ]
-        return jsonify(models)
-    
-    elif provider in ['huggingface', 'ollama']:
-        return jsonify({"type": "text_input"})
-    
-    else:
-        return jsonify({"error": "Unknown provider"}), 400
+    return to_flask(diagram_service.list_models(request.args.get('provider')))
+
+
+@main.route('/api/stats')
+def get_stats():
+    return to_flask(diagram_service.stats())
+
+
+@main.route('/metrics')
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
+@main.route('/assets/<path:name>')
+def get_asset(name):
+    return to_flask(diagram_service.get_asset(name, request.headers))
+
+
+@main.route('/d/<name>')
+def get_artifact(name):
+    return to_flask(diagram_service.get_artifact(name, request.headers))
 
 
 @main.route('/api/ask', methods=['POST'])
 async def handler():
-    
-    data = request.json
-    input_text = data.get('input')
-    selected_template = data.get('selectedTemplate', TemplateEnum.FLOWCHART.value)
-    selected_provider = data.get('provider', '').strip()
-    selected_model = data.get('model', '').strip()
-    temperature = float(data.get('temperature', 0.7))
-    max_tokens = int(data.get('maxTokens', 4096))
-    api_key = data.get('apiKey', '').strip()
-
-    try:
-        llm = set_llm(selected_provider, selected_model, api_key)
-        if llm is None:
-            return jsonify({"error": f"Failed to initialize LLM for provider: {selected_provider}, model: {selected_model}"}), 400
-
-        result = await generate(input_text, selected_template, llm, selected_model, temperature, max_tokens)
-        
-        mermaid_code = result['text']
-        rendered_chart = render_mermaid(mermaid_code)
-        return jsonify({"text": rendered_chart})
-
-    except Exception as e:
-        return error_handling.handle_llm_error(e)
-
-    
-if __name__ == '__main__':
-    main.run(debug=True)
\ No newline at end of file
+    return to_flask(await diagram_service.ask(request.json, request.headers, request.args))
+
+
+@main.route('/api/ask/stream', methods=['POST'])
+def stream_handler():
+    return to_flask(diagram_service.ask_stream(request.json))
+
+
+@main.route('/api/ask/multi', methods=['POST'])
+async def multi_handler():
+    return to_flask(await diagram_service.ask_multi(request.json))
+
+
+@main.route('/api/ask/batch', methods=['POST'])
+def batch_handler():
+    return to_flask(diagram_service.ask_batch(request.json))
@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 load_dotenv()
 
@@ -11,6 +11,75 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: Optional[str] = None
     GEMINI_API_KEY: Optional[str] = None
     HF_API_KEY: Optional[str] = None
+    HOST: str = "127.0.0.1"
+    PORT: int = 8000
+    WORKERS: int = 1
+    RESULT_CACHE_ENABLED: bool = False
+    RESULT_CACHE_MAXSIZE: int = 1024
+    RESULT_CACHE_TTL: int = 3600
+    COALESCE_ENABLED: bool = True
+    PROMPT_TOKEN_BUDGET: int = 600
+    PROMPT_MAX_EXAMPLES: int = 4
+    LLM_CLIENT_POOL_SIZE: int = 32
+    LLM_CLIENT_IDLE_TIMEOUT: float = 600
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 60
+    LLM_TIMEOUT: float = 120
+    LLM_RETRY_MAX_ATTEMPTS: int = 3
+    LLM_RETRY_BASE_DELAY: float = 1.0
+    LLM_RETRY_MAX_DELAY: float = 8.0
+    LLM_EXTRA_BODY: Dict[str, Dict[str, Any]] = {}
+    OLLAMA_KEEP_ALIVE: Optional[str] = "30m"
+    LATENCY_WINDOW: int = 200
+    HEDGE_ROUTES: Dict[str, str] = {}
+    HEDGE_PERCENTILE: float = 0.95
+    HEDGE_MIN_SAMPLES: int = 20
+    HEDGE_DEFAULT_DELAY: float = 10
+    HEDGE_MIN_DELAY: float = 1.0
+    HEDGE_MAX_EXTRA_LOAD: float = 0.1
+    ROUTING_FALLBACKS: Dict[str, List[str]] = {}
+    CIRCUIT_ERROR_THRESHOLD: float = 0.5
+    CIRCUIT_MIN_CALLS: int = 5
+    CIRCUIT_WINDOW_SECONDS: float = 60
+    CIRCUIT_OPEN_SECONDS: float = 30
+    CIRCUIT_HALF_OPEN_PROBES: int = 1
+    RATE_LIMITS: Dict[str, Dict[str, float]] = {}
+    RATE_LIMIT_BURST_SECONDS: float = 6
+    RATE_LIMIT_MAX_WAIT: float = 10
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+    LOG_MAX_PAYLOAD_CHARS: int = 2000
+    LOG_PAYLOAD_SAMPLE_RATE: float = 1.0
+    PROFILING_ENABLED: bool = False
+    PROFILING_DIR: str = "profiles"
+    REPAIR_ENABLED: bool = True
+    REPAIR_MAX_ATTEMPTS: int = 1
+    REPAIR_MAX_LINES: int = 20
+    REPAIR_MAX_TOKENS: int = 512
+    RENDER_CACHE_ENABLED: bool = True
+    RENDER_CACHE_MAXSIZE: int = 256
+    RENDER_CACHE_TTL: int = 86400
+    ARTIFACTS_ENABLED: bool = True
+    ARTIFACTS_DIR: str = "artifacts"
+    ARTIFACTS_MAX_BYTES: int = 256 * 1024 * 1024
+    ASSETS_DIR: str = "build/assets"
+    ASSETS_CDN_FALLBACK: bool = False
+    BATCH_MAX_ITEMS: int = 100
+    BATCH_CONCURRENCY: int = 4
+    BATCH_PROVIDER_CONCURRENCY: Dict[str, int] = {}
+    SIMULATED_ENABLED: bool = False
+    SIMULATED_LATENCY_DISTRIBUTION: str = "lognormal"
+    SIMULATED_LATENCY_MEAN: float = 0.8
+    SIMULATED_LATENCY_STDDEV: float = 0.4
+    SIMULATED_TOKENS_PER_SECOND: float = 60
+    SIMULATED_STREAMING: bool = True
+    SIMULATED_RATE_LIMIT_RATE: float = 0.0
+    SIMULATED_BAD_REQUEST_RATE: float = 0.0
+    SIMULATED_TIMEOUT_RATE: float = 0.0
+    SIMULATED_TIMEOUT_SECONDS: float = 30
+    SIMULATED_REPLAY_DIR: Optional[str] = None
+    SIMULATED_SEED: Optional[int] = None
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from app.config import settings
+from app.llm.latency_tracker import LatencyTracker, Route, latency_tracker
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# The number of hedges a route can save up while it is not slow
+HEDGE_BUDGET_BURST = 5.0
+
+
+def parse_route(route: str) -> Route:
+    """
+    Splits a "provider:model" route. Only the first colon separates the two, since model
+    names may contain colons (e.g. "ollama:llama3:8b").
+    """
+    provider, _, model = route.partition(':')
+    return provider.strip().lower(), model.strip()
+
+
+class HedgePolicy:
+    """
+    Sends a backup request to another provider/model when the primary one is slow.
+
+    Routes are configured in `HEDGE_ROUTES`, mapping "provider:model" (or "provider" for
+    all its models) of the primary to the "provider:model" of the backup. If the primary
+    has not answered after the `HEDGE_PERCENTILE` of its recent latencies (or
+    `HEDGE_DEFAULT_DELAY` until `HEDGE_MIN_SAMPLES` calls were recorded, and never before
+    `HEDGE_MIN_DELAY`), the backup is started and the first acceptable response of the two
+    wins; the other call is cancelled.
+
+    The extra load is capped per route: every primary call earns `HEDGE_MAX_EXTRA_LOAD`
+    of a hedge (up to a small burst) and every hedge spends one, so at most that fraction
+    of the calls is sent twice.
+
+    Args:
+        tracker (LatencyTracker): The latencies the hedge delay is derived from.
+    """
+
+    def __init__(self, tracker: LatencyTracker):
+        self.tracker = tracker
+        self._budgets: Dict[Route, float] = {}
+        self._lock = threading.Lock()
+        self.hedged = 0
+        self.backup_wins = 0
+        self.budget_exhausted = 0
+
+    def backup_for(self, provider: str, model: str) -> Optional[Route]:
+        """
+        Returns the backup route of a primary, or None if it is not hedged.
+        """
+        routes = settings.HEDGE_ROUTES
+        backup = routes.get(f"{provider}:{model}") or routes.get(provider)
+        return parse_route(backup) if backup else None
+
+    def delay(self, provider: str, model: str) -> float:
+        """
+        Returns how long to wait for the primary before sending the backup request.
+        """
+        observed = self.tracker.percentile(provider, model, settings.HEDGE_PERCENTILE,
+                                           min_samples=settings.HEDGE_MIN_SAMPLES)
+        delay = settings.HEDGE_DEFAULT_DELAY if observed is None else observed
+        return max(delay, settings.HEDGE_MIN_DELAY)
+
+    def _earn(self, route: Route) -> None:
+        with self._lock:
+            # A new route starts with one hedge available
+            balance = self._budgets.get(route, 1.0)
+            self._budgets[route] = min(balance + settings.HEDGE_MAX_EXTRA_LOAD, HEDGE_BUDGET_BURST)
+
+    def _spend(self, route: Route) -> bool:
+        with self._lock:
+            if self._budgets.get(route, 1.0) < 1:
+                self.budget_exhausted += 1
+                return False
+            self._budgets[route] = self._budgets.get(route, 1.0) - 1
+            self.hedged += 1
+            return True
+
+    async def call(self, route: Route, primary: Callable[[], Awaitable[T]], backup: Callable[[], Awaitable[T]],
+                   accept: Callable[[T], bool]) -> T:
+        """
+        Calls the primary and, if it is slow and the budget allows, the backup.
+
+        The first result that `accept` approves is returned and the other call is
+        cancelled. A call that fails or returns an unacceptable result leaves the other one
+        running. If neither result is acceptable, the primary's outcome is returned (or
+        raised), or the backup's if the primary failed and the backup did not.
+
+        Args:
+            route (Route): The (provider, model) of the primary.
+            primary (Callable[[], Awaitable[T]]): Starts the primary call.
+            backup (Callable[[], Awaitable[T]]): Starts the backup call.
+            accept (Callable[[T], bool]): Whether a result is good enough to win.
+
+        Returns:
+            T: The winning result.
+        """
+        self._earn(route)
+        primary_task = asyncio.ensure_future(primary())
+        backup_task: Optional[asyncio.Future] = None
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=self.delay(*route))
+            if done or not self._spend(route):
+                return await primary_task
+
+            logger.info("Hedging slow call to %s:%s", *route)
+            backup_task = asyncio.ensure_future(backup())
+            pending = {primary_task, backup_task}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # The primary wins a tie
+                for task in sorted(done, key=lambda task: task is not primary_task):
+                    if task.cancelled() or task.exception() is not None or not accept(task.result()):
+                        continue
+                    if task is backup_task:
+                        with self._lock:
+                            self.backup_wins += 1
+                    return task.result()
+
+            if primary_task.exception() is None or backup_task.exception() is not None:
+                return primary_task.result()
+            return backup_task.result()
+        finally:
+            for task in (primary_task, backup_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hedged": self.hedged,
+                "backup_wins": self.backup_wins,
+                "budget_exhausted": self.budget_exhausted,
+            }
+
+
+hedge_policy = HedgePolicy(latency_tracker)
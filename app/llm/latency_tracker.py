@@ -0,0 +1,120 @@
+import math
+import time
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app.config import settings
+
+Route = Tuple[str, str]
+
+
+def _nearest_rank(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the most recent successful calls and the outcomes of the most
+    recent calls per (provider, model).
+
+    Args:
+        window (Optional[int]): The number of calls kept per route. Defaults to
+            `settings.LATENCY_WINDOW`.
+    """
+
+    def __init__(self, window: Optional[int] = None):
+        self.window = window or settings.LATENCY_WINDOW
+        self._latencies: Dict[Route, Deque[float]] = {}
+        # (monotonic time, failed, rate limited) per call
+        self._outcomes: Dict[Route, Deque[Tuple[float, bool, bool]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, model: str, seconds: float) -> None:
+        """
+        Records the latency of a successful call.
+        """
+        with self._lock:
+            latencies = self._latencies.get((provider, model))
+            if latencies is None:
+                latencies = self._latencies[(provider, model)] = deque(maxlen=self.window)
+            latencies.append(seconds)
+
+    def record_outcome(self, provider: str, model: str, failed: bool, rate_limited: bool = False) -> None:
+        """
+        Records whether a call succeeded, and whether it failed because of a rate limit.
+        """
+        with self._lock:
+            outcomes = self._outcomes.get((provider, model))
+            if outcomes is None:
+                outcomes = self._outcomes[(provider, model)] = deque(maxlen=self.window)
+            outcomes.append((time.monotonic(), failed, rate_limited))
+
+    def reset_outcomes(self, provider: str, model: str) -> None:
+        """
+        Forgets the recorded outcomes of a route, e.g. once it recovered.
+        """
+        with self._lock:
+            self._outcomes.pop((provider, model), None)
+
+    def health(self, provider: str, model: str, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Summarizes the recorded outcomes of a route.
+
+        Args:
+            provider (str): The provider name.
+            model (str): The model name.
+            max_age (Optional[float]): Only count calls of the last this many seconds.
+
+        Returns:
+            Dict[str, Any]: {"calls": ..., "failures": ..., "rate_limited": ..., "error_rate": ...}
+        """
+        since = time.monotonic() - max_age if max_age is not None else float('-inf')
+        with self._lock:
+            outcomes = [outcome for outcome in self._outcomes.get((provider, model), ()) if outcome[0] >= since]
+        failures = sum(1 for _, failed, _ in outcomes if failed)
+        return {
+            "calls": len(outcomes),
+            "failures": failures,
+            "rate_limited": sum(1 for _, _, rate_limited in outcomes if rate_limited),
+            "error_rate": round(failures / len(outcomes), 3) if outcomes else 0.0,
+        }
+
+    def samples(self, provider: str, model: str) -> int:
+        with self._lock:
+            return len(self._latencies.get((provider, model), ()))
+
+    def percentile(self, provider: str, model: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """
+        Returns a percentile of the recorded latencies of a route.
+
+        Args:
+            provider (str): The provider name.
+            model (str): The model name.
+            q (float): The percentile as a fraction, e.g. 0.95.
+            min_samples (int): The number of recorded calls below which None is returned.
+
+        Returns:
+            Optional[float]: The latency in seconds (nearest rank), or None without enough samples.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get((provider, model), ()))
+        if not latencies or len(latencies) < min_samples:
+            return None
+        return _nearest_rank(latencies, q)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            routes = {route: sorted(latencies) for route, latencies in self._latencies.items()}
+        return {
+            f"{provider}:{model}": {
+                "samples": len(latencies),
+                "p50": round(_nearest_rank(latencies, 0.5), 3),
+                "p95": round(_nearest_rank(latencies, 0.95), 3),
+                "max": round(latencies[-1], 3),
+            }
+            for (provider, model), latencies in routes.items() if latencies
+        }
+
+
+latency_tracker = LatencyTracker()
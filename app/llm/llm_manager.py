@@ -1,11 +1,35 @@
-from typing import Any, Optional
+import os
+import re
+import math
+import time
+import random
+import asyncio
+import weakref
+import hashlib
+import inspect
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Dict, FrozenSet, Hashable, List, Optional, Tuple, Union
 from abc import ABC, abstractmethod
-from openai import OpenAI
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from openai import APITimeoutError, BadRequestError, RateLimitError
 import google.generativeai as genai
 from google.generativeai import GenerationConfig
-from huggingface_hub import InferenceClient
+from google.ai import generativelanguage as glm
+from huggingface_hub import InferenceClient, AsyncInferenceClient
 from PIL import Image
 
+from app.config import settings
+from app.llm.prompt import Prompt, completion_tokens, prompt_cache_stats, prompt_messages, prompt_text, usage_tokens
+from app.llm.rate_limiter import rate_limiter, report_usage
+from app.services.metrics_service import record_token_usage
+from app.services.template_service import template_registry
+
+logger = logging.getLogger(__name__)
+
 class LLMConfig:
     """
     Represents the configuration for the LLM (Language Model) service.
@@ -21,6 +45,8 @@ class LLMConfig:
         provider (str): The provider of the language model.
         model (str): The specific language model to use.
         api_key (Optional[str]): The API key to authenticate the requests.
+        user_supplied_key (bool): Whether the API key was passed in, e.g. from the request,
+            rather than taken from the server's environment.
         base_url (str): The base URL for the API endpoint.
         params (dict): Additional parameters that can be passed to the language model.
 
@@ -32,28 +58,29 @@ class LLMConfig:
         self.provider = provider.lower()
         self.model = model
         self.api_key = api_key or self._get_api_key()
+        self.user_supplied_key = bool(api_key)
         # if not self.api_key and self.provider != "ollama":
         #     raise ValueError(f"API key for {self.provider} is not set. Please set the appropriate environment variable.")
         self.base_url = base_url or self._get_base_url()
         self.params = kwargs
 
-    # def _get_api_key(self) -> Optional[str]:
-    #     """
-    #     Retrieves the API key from environment variables based on the provider.
-
-    #     Returns:
-    #         Optional[str]: The API key if found, None otherwise.
-    #     """
-    #     env_var_map = {
-    #         "openai": "OPENAI_API_KEY",
-    #         "huggingface": "HF_TOKEN",
-    #         "huggingface-openai": "HF_TOKEN",
-    #         "huggingface-text": "HF_TOKEN",
-    #         "gemini": "GENAI_API_KEY",
-    #         "sdxl": "HF_TOKEN",
-    #     }
-    #     env_var = env_var_map.get(self.provider)
-    #     return os.environ.get(env_var) if env_var else None
+    def _get_api_key(self) -> Optional[str]:
+        """
+        Retrieves the API key from environment variables based on the provider.
+
+        Returns:
+            Optional[str]: The API key if found, None otherwise.
+        """
+        env_var_map = {
+            "openai": "OPENAI_API_KEY",
+            "huggingface": "HF_TOKEN",
+            "huggingface-openai": "HF_TOKEN",
+            "huggingface-text": "HF_TOKEN",
+            "gemini": "GEMINI_API_KEY",
+            "sdxl": "HF_TOKEN",
+        }
+        env_var = env_var_map.get(self.provider)
+        return os.environ.get(env_var) if env_var else None
 
     def _get_base_url(self) -> Optional[str]:
         """
@@ -67,6 +94,189 @@ class LLMConfig:
         return None
 
 
+def hash_api_key(api_key: Optional[str]) -> str:
+    """
+    Returns a short, non-reversible fingerprint of an API key for use in pool keys and logs.
+    """
+    if not api_key:
+        return ""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+class ClientPool:
+    """
+    A bounded pool of provider clients shared across requests.
+
+    Clients are keyed by provider, model, base URL and a hash of the API key, so each
+    distinct credential gets its own client (and its own keep-alive connections) while
+    repeated requests reuse the same one instead of opening new TCP/TLS connections.
+
+    Args:
+        max_size (int): The maximum number of pooled clients. The least recently used
+            client is dropped when the pool is full.
+        idle_timeout (float): The number of seconds after which an unused client is closed.
+
+    Attributes:
+        hits (int): The number of lookups served by an existing client.
+        misses (int): The number of lookups that created a new client.
+        evictions (int): The number of clients dropped for size or idleness.
+    """
+
+    def __init__(self, max_size: int = 32, idle_timeout: float = 600):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._clients: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Returns the pooled client for a key, creating it with `factory` if needed.
+
+        Args:
+            key (Hashable): The pool key.
+            factory (Callable[[], Any]): Creates a new client.
+
+        Returns:
+            Any: The pooled client.
+        """
+        now = time.monotonic()
+        with self._lock:
+            idle = self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                self._clients[key] = (entry[0], now)
+                self._clients.move_to_end(key)
+                self.hits += 1
+                client = entry[0]
+            else:
+                client = None
+        self._close_all(idle)
+        if client is not None:
+            return client
+
+        created = factory()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                # Another thread created the client first; keep the pooled one
+                self.hits += 1
+                discarded, client = created, entry[0]
+            else:
+                self.misses += 1
+                discarded, client = None, created
+                self._clients[key] = (created, now)
+                while len(self._clients) > self.max_size:
+                    # Size-evicted clients may still be in use by a running request,
+                    # so they are left to be closed by garbage collection
+                    self._clients.popitem(last=False)
+                    self.evictions += 1
+        if discarded is not None:
+            self._close_all([discarded])
+        return client
+
+    def _evict_idle(self, now: float) -> list:
+        idle = []
+        while self._clients:
+            key, (client, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            del self._clients[key]
+            self.evictions += 1
+            idle.append(client)
+        return idle
+
+    @staticmethod
+    def _close_all(clients) -> None:
+        for client in clients:
+            close = getattr(client, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    logger.debug("Error closing pooled client", exc_info=True)
+
+    def close_all(self) -> None:
+        """Closes and removes every pooled client."""
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+        self._close_all(clients)
+
+    async def aclose_all(self) -> None:
+        """Closes and removes every pooled client, awaiting the `close` of async clients."""
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+        for client in clients:
+            close = getattr(client, "close", None)
+            if not callable(close):
+                continue
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.debug("Error closing pooled client", exc_info=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+client_pool = ClientPool(max_size=settings.LLM_CLIENT_POOL_SIZE,
+                         idle_timeout=settings.LLM_CLIENT_IDLE_TIMEOUT)
+
+
+# Async clients hold connections bound to the event loop they were created on,
+# so each running loop gets its own pool.
+_async_client_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ClientPool]" = weakref.WeakKeyDictionary()
+
+
+def async_client_pool() -> ClientPool:
+    """
+    Returns the async client pool for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _async_client_pools.get(loop)
+    if pool is None:
+        pool = ClientPool(max_size=settings.LLM_CLIENT_POOL_SIZE,
+                          idle_timeout=settings.LLM_CLIENT_IDLE_TIMEOUT)
+        _async_client_pools[loop] = pool
+    return pool
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+    )
+
+
+def _http_client() -> httpx.Client:
+    """
+    Creates the httpx client used by pooled OpenAI-compatible clients, sized to keep
+    warm connections to the provider between requests.
+    """
+    return DefaultHttpxClient(limits=_http_limits())
+
+
+def _async_http_client() -> httpx.AsyncClient:
+    """
+    Creates the async counterpart of `_http_client`.
+    """
+    return DefaultAsyncHttpxClient(limits=_http_limits())
+
+
 class BaseLLM(ABC):
     """
     Base class for LLM (Language Model) implementations.
@@ -76,22 +286,113 @@ class BaseLLM(ABC):
 
     Attributes:
         config (LLMConfig): The configuration object for the LLM.
-        client: The client object for the LLM.
+        client: The client object for the LLM, shared through the client pool.
+        supported_params (FrozenSet[str]): The generation parameters (`temperature`,
+            `max_tokens`) that `get_response` and `aget_response` accept.
+        supports_streaming (bool): Whether `astream_response` streams from the provider
+            instead of yielding the whole response at once.
 
     """
 
+    supported_params: FrozenSet[str] = frozenset()
+    supports_streaming: bool = False
+
     def __init__(self, config: LLMConfig):
         self.config = config
-        self.client = self._create_client()
+        self.client = client_pool.get(self._client_key(), self._create_client)
+
+    def _client_key(self) -> Hashable:
+        """
+        Returns the key under which this LLM's client is pooled.
+        """
+        return (self.config.provider, self.config.model, self.config.base_url,
+                hash_api_key(self.config.api_key))
 
     @abstractmethod
     def _create_client(self):
         pass
 
+    def _create_async_client(self):
+        """
+        Creates the async client for the LLM. Providers without a native async client
+        return None and `aget_response` falls back to a worker thread.
+        """
+        return None
+
+    @property
+    def aclient(self):
+        """
+        The async client for the LLM, shared through the pool of the running event loop.
+        """
+        return async_client_pool().get(self._client_key(), self._create_async_client)
+
+    def _extra_body(self) -> Optional[dict]:
+        """
+        Returns the provider-specific request fields from `LLM_EXTRA_BODY`, sent as the
+        `extra_body` of OpenAI-compatible requests.
+        """
+        return dict(settings.LLM_EXTRA_BODY.get(self.config.provider, {})) or None
+
+    def rate_limit_key(self) -> Tuple[str, str, str]:
+        """
+        Returns the key under which this LLM's calls are rate limited: provider, model and
+        a hash of the API key.
+        """
+        return (self.config.provider, self.config.model, hash_api_key(self.config.api_key))
+
+    def _observe_rate_limits(self, headers: Any) -> None:
+        """
+        Corrects the client-side rate limits from the `x-ratelimit-*` headers of a response.
+        """
+        rate_limiter.observe(self.rate_limit_key(), headers)
+
+    def _record_usage(self, usage: Any) -> None:
+        """
+        Records the prompt and cached prompt token counts of a response, if it reports them,
+        and settles the call's rate limit reservation with them.
+        """
+        prompt_cache_stats.record(self.config.provider, usage)
+        record_token_usage(self.config.provider, self.config.model, usage)
+        prompt_tokens, completion = usage_tokens(usage)[0], completion_tokens(usage)
+        if prompt_tokens is not None and completion is not None:
+            report_usage(prompt_tokens + completion)
+
     @abstractmethod
-    def get_response(self, prompt: str) -> Any:
+    def get_response(self, prompt: Union[str, Prompt]) -> Any:
         pass
 
+    async def aget_response(self, prompt: Union[str, Prompt], **kwargs) -> Any:
+        """
+        Generates a response without blocking the event loop.
+
+        The default implementation runs `get_response` in a worker thread; providers with
+        an async client override it.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response. Chat
+                providers send a `Prompt` as a system and a user message, the others as text.
+            **kwargs: Generation parameters listed in `supported_params`.
+
+        Returns:
+            Any: The generated response.
+        """
+        return await asyncio.to_thread(self.get_response, prompt, **kwargs)
+
+    async def astream_response(self, prompt: Union[str, Prompt], **kwargs) -> AsyncIterator[str]:
+        """
+        Generates a response, yielding text chunks as the provider produces them.
+
+        The default implementation yields the complete `aget_response` result as a single chunk.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            **kwargs: Generation parameters listed in `supported_params`.
+
+        Yields:
+            str: Chunks of the generated response.
+        """
+        yield await self.aget_response(prompt, **kwargs)
+
 class OpenAILLM(BaseLLM):
     """
     A class representing an OpenAI Language Model.
@@ -104,9 +405,14 @@ class OpenAILLM(BaseLLM):
     Methods:
         _create_client: Creates an OpenAI client using the configuration settings.
         get_response: Generates a response from the language model given a prompt.
+        aget_response: Asynchronously generates a response using the AsyncOpenAI client.
+        astream_response: Streams a response using the AsyncOpenAI client.
 
     """
 
+    supported_params = frozenset({'temperature', 'max_tokens'})
+    supports_streaming = True
+
     def _create_client(self):
         """
         Creates an OpenAI client using the configuration settings.
@@ -115,26 +421,96 @@ class OpenAILLM(BaseLLM):
             OpenAI: An instance of the OpenAI client.
 
         """
-        return OpenAI(api_key=self.config.api_key, base_url=self.config.base_url)
+        return OpenAI(api_key=self.config.api_key, base_url=self.config.base_url, max_retries=0, http_client=_http_client())
 
-    def get_response(self, prompt: str) -> str:
+    def _create_async_client(self):
+        return AsyncOpenAI(api_key=self.config.api_key, base_url=self.config.base_url, max_retries=0, http_client=_async_http_client())
+
+    def _request_params(self, temperature: float = None, max_tokens: int = None) -> dict:
+        params = dict(self.config.params)
+        if temperature is not None:
+            params['temperature'] = temperature
+        if max_tokens is not None:
+            params['max_tokens'] = max_tokens
+        extra_body = self._extra_body()
+        if extra_body:
+            params['extra_body'] = extra_body
+        return params
+
+    def get_response(self, prompt: Union[str, Prompt], temperature: float = None, max_tokens: int = None) -> str:
         """
         Generates a response from the language model given a prompt.
 
         Args:
-            prompt (str): The prompt for generating the response.
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            temperature (float, optional): The temperature for response generation.
+            max_tokens (int, optional): The maximum number of tokens to generate.
 
         Returns:
             str: The generated response from the language model.
 
         """
-        response = self.client.chat.completions.create(
+        # The raw response carries the rate limit headers
+        raw_response = self.client.chat.completions.with_raw_response.create(
             model=self.config.model,
-            messages=[{"role": "system", "content": prompt}],
-            **self.config.params
+            messages=prompt_messages(prompt, role="system"),
+            **self._request_params(temperature, max_tokens)
+        )
+        self._observe_rate_limits(raw_response.headers)
+        response = raw_response.parse()
+        self._record_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def aget_response(self, prompt: Union[str, Prompt], temperature: float = None, max_tokens: int = None) -> str:
+        """
+        Asynchronously generates a response from the language model given a prompt.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            temperature (float, optional): The temperature for response generation.
+            max_tokens (int, optional): The maximum number of tokens to generate.
+
+        Returns:
+            str: The generated response from the language model.
+        """
+        raw_response = await self.aclient.chat.completions.with_raw_response.create(
+            model=self.config.model,
+            messages=prompt_messages(prompt, role="system"),
+            **self._request_params(temperature, max_tokens)
         )
+        self._observe_rate_limits(raw_response.headers)
+        response = raw_response.parse()
+        self._record_usage(response.usage)
         return response.choices[0].message.content
 
+    async def astream_response(self, prompt: Union[str, Prompt], temperature: float = None, max_tokens: int = None) -> AsyncIterator[str]:
+        """
+        Streams a response from the language model given a prompt.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            temperature (float, optional): The temperature for response generation.
+            max_tokens (int, optional): The maximum number of tokens to generate.
+
+        Yields:
+            str: Chunks of the generated response.
+        """
+        raw_response = await self.aclient.chat.completions.with_raw_response.create(
+            model=self.config.model,
+            messages=prompt_messages(prompt, role="system"),
+            stream=True,
+            # The usage, including cached prompt tokens, arrives in a final chunk without choices
+            stream_options={"include_usage": True},
+            **self._request_params(temperature, max_tokens)
+        )
+        self._observe_rate_limits(raw_response.headers)
+        stream = raw_response.parse()
+        async for chunk in stream:
+            if chunk.usage:
+                self._record_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
 class GeminiLLM(BaseLLM):
     """
     A class representing a Gemini Language Model.
@@ -149,30 +525,54 @@ class GeminiLLM(BaseLLM):
     Methods:
         _create_client(): Creates a Gemini Language Model client.
         get_response(prompt: str) -> str: Generates a response based on the given prompt.
+        aget_response(prompt: str) -> str: Asynchronously generates a response based on the given prompt.
+        astream_response(prompt: str): Streams a response based on the given prompt.
     """
 
+    supported_params = frozenset({'temperature', 'max_tokens'})
+    supports_streaming = True
+
+    def _api_key(self) -> Optional[str]:
+        return self.config.api_key or settings.GEMINI_API_KEY
+
+    @staticmethod
+    def _bind_client(model: genai.GenerativeModel, attribute: str, client) -> genai.GenerativeModel:
+        # GenerativeModel cannot be given a client, so its private `_client` and `_async_client`
+        # attributes are set instead. Checked against google-generativeai 0.7.2 (requirements.txt);
+        # fail loudly rather than silently fall back to the process-wide key if a release renames them.
+        if not hasattr(model, attribute):
+            raise RuntimeError(f"google-generativeai {getattr(genai, '__version__', '?')} has no "
+                               f"GenerativeModel.{attribute}; update GeminiLLM._bind_client for this version")
+        setattr(model, attribute, client)
+        return model
+
     def _create_client(self):
         """
         Creates a Gemini Language Model client.
 
+        The model gets its own service client bound to this config's API key instead of
+        using `genai.configure`, which sets the key process-wide and would leak between
+        concurrent requests made with different keys.
+
         Returns:
             GenerativeModel: The Gemini Language Model client.
         """
-        genai.configure(api_key=self.config.api_key)
-        return genai.GenerativeModel(model_name=self.config.model)
+        model = genai.GenerativeModel(model_name=self.config.model)
+        return self._bind_client(model, '_client',
+                                 glm.GenerativeServiceClient(client_options={"api_key": self._api_key()}))
 
-    def get_response(self, prompt: str, temperature: float = None, max_tokens: int = None) -> str:
+    def _create_async_client(self):
         """
-        Generates a response based on the given prompt.
-
-        Args:
-            prompt (str): The prompt for generating the response.
-            temperature (float, optional): The temperature for response generation.
-            max_tokens (int, optional): The maximum number of tokens to generate.
+        Creates a Gemini Language Model bound to an async service client for the running loop.
 
         Returns:
-            str: The generated response.
+            GenerativeModel: The Gemini Language Model client.
         """
+        model = genai.GenerativeModel(model_name=self.config.model)
+        return self._bind_client(model, '_async_client',
+                                 glm.GenerativeServiceAsyncClient(client_options={"api_key": self._api_key()}))
+
+    def _generation_config(self, temperature: float = None, max_tokens: int = None) -> GenerationConfig:
         # Define Gemini-specific parameters
         generation_params = {}
         if temperature is not None:
@@ -185,14 +585,68 @@ class GeminiLLM(BaseLLM):
             generation_params['top_k'] = self.config.params['top_k']
         
         # Create GenerationConfig with non-None parameters
-        generation_config = GenerationConfig(**generation_params)
-        
+        return GenerationConfig(**generation_params)
+
+    def get_response(self, prompt: Union[str, Prompt], temperature: float = None, max_tokens: int = None) -> str:
+        """
+        Generates a response based on the given prompt.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            temperature (float, optional): The temperature for response generation.
+            max_tokens (int, optional): The maximum number of tokens to generate.
+
+        Returns:
+            str: The generated response.
+        """
+        generation_config = self._generation_config(temperature, max_tokens)
         try:
-            response = self.client.generate_content(prompt, generation_config=generation_config)
+            response = self.client.generate_content(prompt_text(prompt), generation_config=generation_config)
             response.resolve()
+            self._record_usage(getattr(response, 'usage_metadata', None))
             return response.text
         except Exception as e:
-            raise ValueError(f"Error generating content with Gemini: {str(e)}")
+            raise ValueError(f"Error generating content with Gemini: {str(e)}") from e
+
+    async def aget_response(self, prompt: Union[str, Prompt], temperature: float = None, max_tokens: int = None) -> str:
+        """
+        Asynchronously generates a response based on the given prompt.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            temperature (float, optional): The temperature for response generation.
+            max_tokens (int, optional): The maximum number of tokens to generate.
+
+        Returns:
+            str: The generated response.
+        """
+        generation_config = self._generation_config(temperature, max_tokens)
+        try:
+            response = await self.aclient.generate_content_async(prompt_text(prompt), generation_config=generation_config)
+            self._record_usage(getattr(response, 'usage_metadata', None))
+            return response.text
+        except Exception as e:
+            raise ValueError(f"Error generating content with Gemini: {str(e)}") from e
+
+    async def astream_response(self, prompt: Union[str, Prompt], temperature: float = None, max_tokens: int = None) -> AsyncIterator[str]:
+        """
+        Streams a response based on the given prompt.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            temperature (float, optional): The temperature for response generation.
+            max_tokens (int, optional): The maximum number of tokens to generate.
+
+        Yields:
+            str: Chunks of the generated response.
+        """
+        generation_config = self._generation_config(temperature, max_tokens)
+        try:
+            response = await self.aclient.generate_content_async(prompt_text(prompt), generation_config=generation_config, stream=True)
+            async for chunk in response:
+                yield chunk.text
+        except Exception as e:
+            raise ValueError(f"Error generating content with Gemini: {str(e)}") from e
 
 class SDXLLLM(BaseLLM):
     """
@@ -243,22 +697,60 @@ class HFOpenAIAPILLM(BaseLLM):
     Methods:
         _create_client: Creates a client object for making API requests.
         get_response: Gets a response from the language model given a prompt.
+        aget_response: Asynchronously gets a response using the AsyncOpenAI client.
+        astream_response: Streams a response using the AsyncOpenAI client.
     """
 
+    supported_params = frozenset({'temperature', 'max_tokens'})
+    supports_streaming = True
+
+    def _base_url(self) -> str:
+        return f"https://api-inference.huggingface.co/models/{self.config.model}/v1/"
+
     def _create_client(self):
-        base_url = f"https://api-inference.huggingface.co/models/{self.config.model}/v1/"
-        return OpenAI(base_url=base_url, api_key=self.config.api_key)
+        return OpenAI(base_url=self._base_url(), api_key=self.config.api_key, max_retries=0, http_client=_http_client())
 
-    def get_response(self, prompt: str, temperature: float = 0.7, max_tokens: int = 4096) -> str:
+    def _create_async_client(self):
+        return AsyncOpenAI(base_url=self._base_url(), api_key=self.config.api_key, max_retries=0, http_client=_async_http_client())
+
+    def get_response(self, prompt: Union[str, Prompt], temperature: float = 0.7, max_tokens: int = 4096) -> str:
         response = self.client.chat.completions.create(
             model=self.config.model,
-            messages=[{"role": "user", "content": prompt}],
+            messages=prompt_messages(prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            extra_body=self._extra_body(),
+            **self.config.params
+        )
+        self._record_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def aget_response(self, prompt: Union[str, Prompt], temperature: float = 0.7, max_tokens: int = 4096) -> str:
+        response = await self.aclient.chat.completions.create(
+            model=self.config.model,
+            messages=prompt_messages(prompt),
             temperature=temperature,
             max_tokens=max_tokens,
+            extra_body=self._extra_body(),
             **self.config.params
         )
+        self._record_usage(response.usage)
         return response.choices[0].message.content
 
+    async def astream_response(self, prompt: Union[str, Prompt], temperature: float = 0.7, max_tokens: int = 4096) -> AsyncIterator[str]:
+        stream = await self.aclient.chat.completions.create(
+            model=self.config.model,
+            messages=prompt_messages(prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            extra_body=self._extra_body(),
+            stream=True,
+            **self.config.params
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
     
 class OllamaLLM(BaseLLM):
     """
@@ -272,8 +764,13 @@ class OllamaLLM(BaseLLM):
     Methods:
         _create_client: Creates an Ollama client using the configuration settings.
         get_response: Generates a response from the language model given a prompt.
+        aget_response: Asynchronously generates a response using the AsyncOpenAI client.
+        astream_response: Streams a response using the AsyncOpenAI client.
     """
 
+    supported_params = frozenset({'temperature', 'max_tokens'})
+    supports_streaming = True
+
     def _create_client(self):
         """
         Creates an Ollama client using the configuration settings.
@@ -281,14 +778,33 @@ class OllamaLLM(BaseLLM):
         Returns:
             OpenAI: An instance of the OpenAI client configured for Ollama.
         """
-        return OpenAI(base_url=self.config.base_url, api_key="ollama")
+        return OpenAI(base_url=self.config.base_url, api_key="ollama", max_retries=0, http_client=_http_client())
 
-    def get_response(self, prompt: str, temperature: float = 0.7, max_tokens: int = 4096) -> str:
+    def _create_async_client(self):
+        """
+        Creates an async Ollama client using the configuration settings.
+
+        Returns:
+            AsyncOpenAI: An instance of the AsyncOpenAI client configured for Ollama.
+        """
+        return AsyncOpenAI(base_url=self.config.base_url, api_key="ollama", max_retries=0, http_client=_async_http_client())
+
+    def _extra_body(self) -> Optional[dict]:
+        """
+        Adds `keep_alive` to the request, so the model and its KV cache stay loaded
+        between requests and a shared prompt prefix is not evaluated again.
+        """
+        extra_body = super()._extra_body() or {}
+        if settings.OLLAMA_KEEP_ALIVE:
+            extra_body.setdefault('keep_alive', settings.OLLAMA_KEEP_ALIVE)
+        return extra_body or None
+
+    def get_response(self, prompt: Union[str, Prompt], temperature: float = 0.7, max_tokens: int = 4096) -> str:
         """
         Generates a response from the language model given a prompt.
 
         Args:
-            prompt (str): The prompt for generating the response.
+            prompt (Union[str, Prompt]): The prompt for generating the response.
             temperature (float): The temperature for response generation.
             max_tokens (int): The maximum number of tokens to generate.
 
@@ -297,12 +813,62 @@ class OllamaLLM(BaseLLM):
         """
         response = self.client.chat.completions.create(
             model=self.config.model,
-            messages=[{"role": "user", "content": prompt}],
+            messages=prompt_messages(prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            extra_body=self._extra_body(),
+            **self.config.params
+        )
+        self._record_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def aget_response(self, prompt: Union[str, Prompt], temperature: float = 0.7, max_tokens: int = 4096) -> str:
+        """
+        Asynchronously generates a response from the language model given a prompt.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            temperature (float): The temperature for response generation.
+            max_tokens (int): The maximum number of tokens to generate.
+
+        Returns:
+            str: The generated response from the language model.
+        """
+        response = await self.aclient.chat.completions.create(
+            model=self.config.model,
+            messages=prompt_messages(prompt),
             temperature=temperature,
             max_tokens=max_tokens,
+            extra_body=self._extra_body(),
             **self.config.params
         )
+        self._record_usage(response.usage)
         return response.choices[0].message.content
+
+    async def astream_response(self, prompt: Union[str, Prompt], temperature: float = 0.7, max_tokens: int = 4096) -> AsyncIterator[str]:
+        """
+        Streams a response from the language model given a prompt.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            temperature (float): The temperature for response generation.
+            max_tokens (int): The maximum number of tokens to generate.
+
+        Yields:
+            str: Chunks of the generated response.
+        """
+        stream = await self.aclient.chat.completions.create(
+            model=self.config.model,
+            messages=prompt_messages(prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            extra_body=self._extra_body(),
+            stream=True,
+            **self.config.params
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
     
 class HFTextLLM(BaseLLM):
     """
@@ -316,7 +882,12 @@ class HFTextLLM(BaseLLM):
     Methods:
         _create_client: Creates a Hugging Face Inference client using the configuration settings.
         get_response: Generates a response from the language model given a prompt.
+        aget_response: Asynchronously generates a response using the AsyncInferenceClient.
+        astream_response: Streams a response using the AsyncInferenceClient.
     """
+
+    supported_params = frozenset({'temperature', 'max_tokens'})
+    supports_streaming = True
     
     def _create_client(self):
         """
@@ -327,19 +898,16 @@ class HFTextLLM(BaseLLM):
         """
         return InferenceClient(model=self.config.model, token=self.config.api_key)
 
-    def get_response(self, prompt: str, model: str = None, temperature: float = None, max_tokens: int = None) -> str:
+    def _create_async_client(self):
         """
-        Generates a response from the language model given a prompt.
-
-        Args:
-            prompt (str): The prompt for generating the response.
-            model (str, optional): The model to use. If provided, it overrides the default model.
-            temperature (float, optional): The temperature for response generation.
-            max_tokens (int, optional): The maximum number of tokens to generate.
+        Creates an async Hugging Face Inference client using the configuration settings.
 
         Returns:
-            str: The generated response from the language model.
+            AsyncInferenceClient: An instance of the async Hugging Face Inference client.
         """
+        return AsyncInferenceClient(model=self.config.model, token=self.config.api_key)
+
+    def _parameters(self, model: str = None, temperature: float = None, max_tokens: int = None) -> dict:
         parameters = {}
         if temperature is not None:
             parameters['temperature'] = temperature
@@ -350,17 +918,290 @@ class HFTextLLM(BaseLLM):
         if 'top_k' in self.config.params:
             parameters['top_k'] = self.config.params['top_k']
 
-        client = self._create_client()
         if model:
-            client.model = model
+            parameters['model'] = model
+        return parameters
+
+    def get_response(self, prompt: Union[str, Prompt], model: str = None, temperature: float = None, max_tokens: int = None) -> str:
+        """
+        Generates a response from the language model given a prompt.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            model (str, optional): The model to use. If provided, it overrides the default model.
+            temperature (float, optional): The temperature for response generation.
+            max_tokens (int, optional): The maximum number of tokens to generate.
 
-        response = client.text_generation(
-            prompt,
-            **parameters
+        Returns:
+            str: The generated response from the language model.
+        """
+        response = self.client.text_generation(
+            prompt_text(prompt),
+            **self._parameters(model, temperature, max_tokens)
         )
 
         return response
 
+    async def aget_response(self, prompt: Union[str, Prompt], model: str = None, temperature: float = None, max_tokens: int = None) -> str:
+        """
+        Asynchronously generates a response from the language model given a prompt.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            model (str, optional): The model to use. If provided, it overrides the default model.
+            temperature (float, optional): The temperature for response generation.
+            max_tokens (int, optional): The maximum number of tokens to generate.
+
+        Returns:
+            str: The generated response from the language model.
+        """
+        return await self.aclient.text_generation(
+            prompt_text(prompt),
+            **self._parameters(model, temperature, max_tokens)
+        )
+
+    async def astream_response(self, prompt: Union[str, Prompt], model: str = None, temperature: float = None, max_tokens: int = None) -> AsyncIterator[str]:
+        """
+        Streams a response from the language model given a prompt.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            model (str, optional): The model to use. If provided, it overrides the default model.
+            temperature (float, optional): The temperature for response generation.
+            max_tokens (int, optional): The maximum number of tokens to generate.
+
+        Yields:
+            str: Chunks of the generated response.
+        """
+        stream = await self.aclient.text_generation(
+            prompt_text(prompt),
+            stream=True,
+            **self._parameters(model, temperature, max_tokens)
+        )
+        async for token in stream:
+            yield token
+
+TEMPLATE_IN_PROMPT_PATTERN = re.compile(r'Create a (\w+) diagram')
+SIMULATED_CHARS_PER_TOKEN = 4
+SIMULATED_TOKENS_PER_CHUNK = 4
+
+
+@lru_cache(maxsize=8)
+def _load_replay_responses(replay_dir: str) -> Dict[str, List[str]]:
+    """
+    Loads recorded responses from `<template>[.<anything>].txt` files in a directory.
+
+    Args:
+        replay_dir (str): The directory containing the recorded responses.
+
+    Returns:
+        Dict[str, List[str]]: The responses per upper-case template name.
+    """
+    responses: Dict[str, List[str]] = {}
+    for file in sorted(os.listdir(replay_dir)):
+        if not file.endswith('.txt'):
+            continue
+        with open(os.path.join(replay_dir, file), 'r', encoding='utf-8') as f:
+            responses.setdefault(file.split('.', 1)[0].upper(), []).append(f.read())
+    return responses
+
+
+class SimulatedLLM(BaseLLM):
+    """
+    A simulated Language Model for load and capacity testing without calling a provider.
+
+    Responses are replayed from `SIMULATED_REPLAY_DIR` (files named `<template>*.txt`,
+    e.g. the benchmark corpus) or, without one, canned from the first example of the
+    requested template's syntax document. The template is read from the prompt.
+
+    Each call waits for a time-to-first-token drawn from `SIMULATED_LATENCY_DISTRIBUTION`
+    ("fixed", "uniform", "normal", "lognormal" or "exponential", with
+    `SIMULATED_LATENCY_MEAN` and `SIMULATED_LATENCY_STDDEV` in seconds) plus the time
+    to produce the response at `SIMULATED_TOKENS_PER_SECOND`. Responses are cut off at
+    `max_tokens`. `SIMULATED_RATE_LIMIT_RATE`, `SIMULATED_BAD_REQUEST_RATE` and
+    `SIMULATED_TIMEOUT_RATE` are the probabilities of raising the matching OpenAI errors;
+    a timeout is raised after `SIMULATED_TIMEOUT_SECONDS`. Prompt usage is recorded as if
+    the provider cached the system part of a `Prompt` after its first use.
+
+    Attributes:
+        config (LLMConfig): The configuration object for the language model.
+
+    Methods:
+        _create_client: Returns None, the simulation has no client.
+        get_response: Generates a simulated response, blocking for the simulated latency.
+        aget_response: Generates a simulated response without blocking the event loop.
+        astream_response: Streams a simulated response at the simulated token rate.
+    """
+
+    supported_params = frozenset({'temperature', 'max_tokens'})
+    _random = random.Random(settings.SIMULATED_SEED)
+    _seen_prefixes: set = set()
+    _seen_prefixes_lock = threading.Lock()
+
+    @property
+    def supports_streaming(self) -> bool:
+        return settings.SIMULATED_STREAMING
+
+    def _create_client(self):
+        return None
+
+    def _response_for(self, prompt: Union[str, Prompt], max_tokens: int) -> str:
+        match = TEMPLATE_IN_PROMPT_PATTERN.search(prompt_text(prompt))
+        template = match.group(1).upper() if match else 'FLOWCHART'
+
+        response = None
+        if settings.SIMULATED_REPLAY_DIR:
+            replays = _load_replay_responses(settings.SIMULATED_REPLAY_DIR)
+            candidates = replays.get(template) or [r for rs in replays.values() for r in rs]
+            if candidates:
+                response = self._random.choice(candidates)
+        if response is None:
+            try:
+                examples = template_registry.get(template).examples
+            except ValueError:
+                examples = []
+            example = examples[0].strip() if examples else "flowchart TD\n    A[Start] --> B[End]"
+            response = f"```mermaid\n{example}\n```"
+        response = response[:max_tokens * SIMULATED_CHARS_PER_TOKEN]
+        self._record_simulated_usage(prompt, response)
+        return response
+
+    def _record_simulated_usage(self, prompt: Union[str, Prompt], response: str) -> None:
+        # Simulates a provider prompt cache: the system part counts as cached once it was seen
+        prompt_tokens = len(prompt_text(prompt)) // SIMULATED_CHARS_PER_TOKEN
+        cached_tokens = 0
+        if isinstance(prompt, Prompt):
+            with self._seen_prefixes_lock:
+                if prompt.system in self._seen_prefixes:
+                    cached_tokens = len(prompt.system) // SIMULATED_CHARS_PER_TOKEN
+                else:
+                    self._seen_prefixes.add(prompt.system)
+        self._record_usage({"prompt_tokens": prompt_tokens, "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                            "completion_tokens": len(response) // SIMULATED_CHARS_PER_TOKEN})
+
+    def _first_token_latency(self) -> float:
+        distribution = settings.SIMULATED_LATENCY_DISTRIBUTION.lower()
+        mean = max(settings.SIMULATED_LATENCY_MEAN, 0.0)
+        stddev = max(settings.SIMULATED_LATENCY_STDDEV, 0.0)
+        if mean == 0 or distribution == 'fixed':
+            return mean
+        if distribution == 'uniform':
+            spread = stddev * 3 ** 0.5
+            return max(self._random.uniform(mean - spread, mean + spread), 0.0)
+        if distribution == 'normal':
+            return max(self._random.gauss(mean, stddev), 0.0)
+        if distribution == 'exponential':
+            return self._random.expovariate(1 / mean)
+        if distribution == 'lognormal':
+            sigma_squared = math.log(1 + (stddev / mean) ** 2)
+            mu = math.log(mean) - sigma_squared / 2
+            return self._random.lognormvariate(mu, sigma_squared ** 0.5)
+        raise ValueError(f"Unknown simulated latency distribution: {settings.SIMULATED_LATENCY_DISTRIBUTION}")
+
+    def _generation_time(self, response: str) -> float:
+        if settings.SIMULATED_TOKENS_PER_SECOND <= 0:
+            return 0.0
+        return len(response) / SIMULATED_CHARS_PER_TOKEN / settings.SIMULATED_TOKENS_PER_SECOND
+
+    def _injected_error(self) -> Optional[str]:
+        roll = self._random.random()
+        for error, rate in (('rate_limit', settings.SIMULATED_RATE_LIMIT_RATE),
+                            ('bad_request', settings.SIMULATED_BAD_REQUEST_RATE),
+                            ('timeout', settings.SIMULATED_TIMEOUT_RATE)):
+            if roll < rate:
+                return error
+            roll -= rate
+        return None
+
+    def _raise(self, error: str) -> None:
+        request = httpx.Request("POST", "https://simulated.invalid/v1/chat/completions")
+        if error == 'rate_limit':
+            response = httpx.Response(429, request=request, headers={"retry-after": "1"})
+            raise RateLimitError("Simulated rate limit exceeded", response=response, body=None)
+        if error == 'bad_request':
+            response = httpx.Response(400, request=request)
+            raise BadRequestError("Simulated bad request", response=response, body=None)
+        raise APITimeoutError(request=request)
+
+    def get_response(self, prompt: Union[str, Prompt], temperature: float = 0.7, max_tokens: int = 4096) -> str:
+        """
+        Generates a simulated response, blocking for the simulated latency.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            temperature (float): Ignored.
+            max_tokens (int): The maximum number of tokens to generate.
+
+        Returns:
+            str: The simulated response.
+
+        Raises:
+            RateLimitError, BadRequestError, APITimeoutError: When an error is injected.
+        """
+        error = self._injected_error()
+        if error == 'timeout':
+            time.sleep(settings.SIMULATED_TIMEOUT_SECONDS)
+        if error:
+            self._raise(error)
+        response = self._response_for(prompt, max_tokens)
+        time.sleep(self._first_token_latency() + self._generation_time(response))
+        return response
+
+    async def aget_response(self, prompt: Union[str, Prompt], temperature: float = 0.7, max_tokens: int = 4096) -> str:
+        """
+        Generates a simulated response without blocking the event loop.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            temperature (float): Ignored.
+            max_tokens (int): The maximum number of tokens to generate.
+
+        Returns:
+            str: The simulated response.
+
+        Raises:
+            RateLimitError, BadRequestError, APITimeoutError: When an error is injected.
+        """
+        error = self._injected_error()
+        if error == 'timeout':
+            await asyncio.sleep(settings.SIMULATED_TIMEOUT_SECONDS)
+        if error:
+            self._raise(error)
+        response = self._response_for(prompt, max_tokens)
+        await asyncio.sleep(self._first_token_latency() + self._generation_time(response))
+        return response
+
+    async def astream_response(self, prompt: Union[str, Prompt], temperature: float = 0.7, max_tokens: int = 4096) -> AsyncIterator[str]:
+        """
+        Streams a simulated response at the simulated token rate. With
+        `SIMULATED_STREAMING` disabled the whole response is yielded at once.
+
+        Args:
+            prompt (Union[str, Prompt]): The prompt for generating the response.
+            temperature (float): Ignored.
+            max_tokens (int): The maximum number of tokens to generate.
+
+        Yields:
+            str: Chunks of the simulated response.
+        """
+        if not self.supports_streaming:
+            yield await self.aget_response(prompt, temperature=temperature, max_tokens=max_tokens)
+            return
+
+        error = self._injected_error()
+        if error == 'timeout':
+            await asyncio.sleep(settings.SIMULATED_TIMEOUT_SECONDS)
+        if error:
+            self._raise(error)
+        response = self._response_for(prompt, max_tokens)
+        await asyncio.sleep(self._first_token_latency())
+        chunk_size = SIMULATED_TOKENS_PER_CHUNK * SIMULATED_CHARS_PER_TOKEN
+        for start in range(0, len(response), chunk_size):
+            chunk = response[start:start + chunk_size]
+            yield chunk
+            await asyncio.sleep(self._generation_time(chunk))
+
+
 class LLMFactory:
     """
     Factory class for creating Language Model Managers (LLMs).
@@ -371,7 +1212,7 @@ class LLMFactory:
         # "sdxl": SDXLLLM,
         "huggingface-openai": HFOpenAIAPILLM,
         "huggingface-text": HFTextLLM,
-        "ollama": OllamaLLM
+        "ollama": OllamaLLM,
     }
 
     @staticmethod
@@ -393,6 +1234,11 @@ class LLMFactory:
         return LLMFactory.llm_classes[config.provider](config)
 
 
+# The load-testing provider is only offered where it is explicitly enabled
+if settings.SIMULATED_ENABLED:
+    LLMFactory.llm_classes["simulated"] = SimulatedLLM
+
+
 def get_llm(provider: str, model: str, **kwargs) -> BaseLLM:
     config = LLMConfig(provider, model, **kwargs)
     return LLMFactory.create_llm(config)
\ No newline at end of file
@@ -0,0 +1,143 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """
+    A prompt split into a static system part and the request-specific user part.
+
+    The system part only depends on the template, so requests for the same template
+    start with the same tokens. Providers reuse the work done for such a prefix: OpenAI
+    caches the prompt prefix, and Ollama keeps the KV cache of a loaded model.
+
+    Attributes:
+        system (str): The instructions and syntax guide of the template.
+        user (str): The input-dependent part, sent last.
+    """
+    system: str
+    user: str
+
+    @property
+    def text(self) -> str:
+        """The prompt as a single text, for providers without chat messages."""
+        return f"{self.system}\n\n{self.user}"
+
+    def messages(self) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user},
+        ]
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def prompt_text(prompt: Union[str, Prompt]) -> str:
+    """
+    Returns a prompt as a single text.
+    """
+    return prompt.text if isinstance(prompt, Prompt) else prompt
+
+
+def prompt_messages(prompt: Union[str, Prompt], role: str = "user") -> List[Dict[str, str]]:
+    """
+    Returns a prompt as chat messages.
+
+    Args:
+        prompt (Union[str, Prompt]): The prompt.
+        role (str): The role of the single message a plain text prompt is sent as.
+
+    Returns:
+        List[Dict[str, str]]: The chat messages.
+    """
+    if isinstance(prompt, Prompt):
+        return prompt.messages()
+    return [{"role": role, "content": prompt}]
+
+
+def _field(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def usage_tokens(usage: Any) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Reads the prompt token count and the number of those served from the provider's
+    prompt cache from the usage data of a response.
+
+    Understands OpenAI-style usage (`prompt_tokens`, `prompt_tokens_details.cached_tokens`)
+    and Gemini usage metadata (`prompt_token_count`, `cached_content_token_count`). Fields
+    a provider does not return are None.
+
+    Args:
+        usage (Any): The usage object or dictionary of a response.
+
+    Returns:
+        Tuple[Optional[int], Optional[int]]: (prompt tokens, cached tokens).
+    """
+    prompt_tokens = _field(usage, 'prompt_tokens')
+    if prompt_tokens is None:
+        prompt_tokens = _field(usage, 'prompt_token_count')
+    cached_tokens = _field(_field(usage, 'prompt_tokens_details'), 'cached_tokens')
+    if cached_tokens is None:
+        cached_tokens = _field(usage, 'cached_content_token_count')
+    return (prompt_tokens if isinstance(prompt_tokens, int) else None,
+            cached_tokens if isinstance(cached_tokens, int) else None)
+
+
+def completion_tokens(usage: Any) -> Optional[int]:
+    """
+    Reads the completion token count from the usage data of a response (OpenAI
+    `completion_tokens` or Gemini `candidates_token_count`), or None.
+    """
+    tokens = _field(usage, 'completion_tokens')
+    if tokens is None:
+        tokens = _field(usage, 'candidates_token_count')
+    return tokens if isinstance(tokens, int) else None
+
+
+class PromptCacheStats:
+    """
+    Counts prompt tokens and provider-side cached prompt tokens per provider.
+    """
+
+    def __init__(self):
+        self._providers: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, usage: Any) -> None:
+        """
+        Records the usage data of a response. Responses without usage data are ignored.
+
+        Args:
+            provider (str): The provider name.
+            usage (Any): The usage object or dictionary of the response.
+        """
+        prompt_tokens, cached_tokens = usage_tokens(usage)
+        if prompt_tokens is None:
+            return
+        logger.debug("Prompt tokens for %s: %d, cached: %s", provider, prompt_tokens, cached_tokens)
+        with self._lock:
+            counts = self._providers.setdefault(provider, {"responses": 0, "prompt_tokens": 0, "cached_tokens": 0})
+            counts["responses"] += 1
+            counts["prompt_tokens"] += prompt_tokens
+            counts["cached_tokens"] += cached_tokens or 0
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                provider: {**counts, "cached_ratio": round(counts["cached_tokens"] / counts["prompt_tokens"], 3)
+                           if counts["prompt_tokens"] else 0.0}
+                for provider, counts in self._providers.items()
+            }
+
+
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,294 @@
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Hashable, Iterator, List, Mapping, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitQueueError(Exception):
+    """
+    Raised when a call would have to wait longer than allowed for its rate limit.
+
+    Attributes:
+        retry_after (float): The number of seconds the call would have had to wait.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Settlement:
+    """The tokens a call reserved and the tokens its provider reported it used."""
+
+    def __init__(self):
+        self.reserved: Optional[Tuple['TokenBucket', float]] = None
+        self.used: Optional[int] = None
+
+
+# The settlement of the rate limited call made in the current context, see `RateLimiter.settlement`
+_settlement: ContextVar[Optional[_Settlement]] = ContextVar('rate_limit_settlement', default=None)
+
+
+def report_usage(tokens: int) -> None:
+    """
+    Reports the prompt and completion tokens a provider counted for the call made in the
+    current context, so that its unused reservation is given back.
+    """
+    settlement = _settlement.get()
+    if settlement is not None:
+        settlement.used = tokens
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> Optional[float]:
+    try:
+        value = headers.get(name)
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at a per-minute rate, from which calls reserve their cost.
+
+    A reservation may take the level below zero; the caller then waits until the bucket
+    has refilled to cover it, so concurrent callers are spaced out evenly instead of all
+    retrying at once. A call costing more than the whole bucket only waits for a full
+    bucket, and the calls after it wait for the rest.
+
+    Args:
+        per_minute (float): The refill rate per minute.
+        burst_seconds (float): The capacity of the bucket, in seconds of refill.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.per_minute = 0.0
+        self.rate = 0.0
+        self.capacity = 0.0
+        self.set_limit(per_minute, burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def set_limit(self, per_minute: float, burst_seconds: float) -> None:
+        self.per_minute = per_minute
+        self.rate = per_minute / 60
+        self.capacity = max(per_minute * burst_seconds / 60, 1.0)
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """The number of seconds until the bucket covers `cost`, or is full if it cannot hold it."""
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        if cost <= self.level:
+            return 0.0
+        return (cost - self.level) / self.rate if self.rate > 0 else float('inf')
+
+    def take(self, cost: float) -> None:
+        self.level -= cost
+
+    def give_back(self, cost: float) -> None:
+        self.level = min(self.capacity, self.level + cost)
+
+    def limit_level(self, level: float, now: float) -> None:
+        """Lowers the level to at most `level`, e.g. what the provider reports as remaining."""
+        self._refill(now)
+        self.level = min(self.level, level)
+
+
+class _KeyLimits:
+    """The request and token buckets of one provider, model and API key."""
+
+    def __init__(self, rpm: Optional[float], tpm: Optional[float]):
+        burst = settings.RATE_LIMIT_BURST_SECONDS
+        self.requests = TokenBucket(rpm, burst) if rpm else None
+        self.tokens = TokenBucket(tpm, burst) if tpm else None
+        self.calls = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.rejected = 0
+
+    def buckets(self, tokens: int) -> List[Tuple[TokenBucket, float]]:
+        return [(bucket, cost) for bucket, cost in ((self.requests, 1), (self.tokens, tokens)) if bucket is not None]
+
+
+class RateLimiter:
+    """
+    Client-side requests-per-minute and tokens-per-minute limits per provider, model and
+    API key, so that calls queue here for a bounded time instead of being rejected by the
+    provider.
+
+    Limits come from `RATE_LIMITS` ("provider:model" or "provider" -> {"rpm": ..., "tpm": ...})
+    and are corrected from the `x-ratelimit-*` headers of the provider's responses, which
+    also enable limiting for keys without configured limits. Each bucket holds
+    `RATE_LIMIT_BURST_SECONDS` worth of its limit, so calls are paced evenly through the
+    minute instead of bursting at its start. Tokens a call reserved but did not use, as
+    its provider reports, are given back after the call. A rate limit response empties the
+    buckets of the key for the server's `Retry-After` delay.
+    """
+
+    def __init__(self):
+        self._keys: Dict[Hashable, _KeyLimits] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def configured_limits(provider: str, model: str) -> Dict[str, float]:
+        return settings.RATE_LIMITS.get(f"{provider}:{model}") or settings.RATE_LIMITS.get(provider) or {}
+
+    def _limits(self, key: Tuple[str, str, str]) -> Optional[_KeyLimits]:
+        # Called with the lock held
+        limits = self._keys.get(key)
+        if limits is None:
+            configured = self.configured_limits(key[0], key[1])
+            if not configured.get('rpm') and not configured.get('tpm'):
+                return None
+            limits = self._keys[key] = _KeyLimits(configured.get('rpm'), configured.get('tpm'))
+        return limits
+
+    async def acquire(self, key: Tuple[str, str, str], tokens: int, max_wait: Optional[float] = None) -> float:
+        """
+        Reserves one request and `tokens` tokens for a call, waiting until the limits allow it.
+
+        Args:
+            key (Tuple[str, str, str]): The provider, model and API key hash.
+            tokens (int): The estimated token cost of the call.
+            max_wait (Optional[float]): The longest time to wait. Defaults to `RATE_LIMIT_MAX_WAIT`.
+
+        Returns:
+            float: The number of seconds waited.
+
+        Raises:
+            RateLimitQueueError: If the call would have to wait longer than `max_wait`.
+        """
+        if max_wait is None:
+            max_wait = settings.RATE_LIMIT_MAX_WAIT
+        with self._lock:
+            limits = self._limits(key)
+            if limits is None:
+                return 0.0
+            now = time.monotonic()
+            reservations = limits.buckets(tokens)
+            wait = max((bucket.wait_time(cost, now) for bucket, cost in reservations), default=0.0)
+            if wait > max_wait:
+                limits.rejected += 1
+                raise RateLimitQueueError(
+                    f"Rate limit of {key[0]} ({key[1]}) reached, the call would have to wait {wait:.1f} seconds.",
+                    retry_after=wait)
+            for bucket, cost in reservations:
+                bucket.take(cost)
+            settlement = _settlement.get()
+            if settlement is not None and limits.tokens is not None:
+                settlement.reserved = (limits.tokens, tokens)
+            limits.calls += 1
+            if wait > 0:
+                limits.waited += 1
+                limits.wait_seconds += wait
+
+        if wait > 0:
+            logger.debug("Waiting %.2f seconds for the rate limit of %s:%s", wait, key[0], key[1])
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                with self._lock:
+                    for bucket, cost in reservations:
+                        bucket.give_back(cost)
+                if settlement is not None:
+                    settlement.reserved = None
+                raise
+        return wait
+
+    @contextmanager
+    def settlement(self) -> Iterator[None]:
+        """
+        Settles the tokens reserved by `acquire` within the context manager with the usage
+        reported by `report_usage`: what the call did not use is given back. Calls that do
+        not report their usage, e.g. because they failed, keep the whole reservation.
+        """
+        settlement = _Settlement()
+        # Restored by value rather than with a reset token, since a streamed call may be
+        # closed from another context than the one it started in
+        previous = _settlement.get()
+        _settlement.set(settlement)
+        try:
+            yield
+        finally:
+            _settlement.set(previous)
+            if settlement.reserved is not None and settlement.used is not None:
+                bucket, reserved = settlement.reserved
+                if reserved > settlement.used:
+                    with self._lock:
+                        bucket.give_back(reserved - settlement.used)
+
+    def observe(self, key: Tuple[str, str, str], headers: Optional[Mapping[str, str]]) -> None:
+        """
+        Corrects the limits of a key from the `x-ratelimit-limit-*` and
+        `x-ratelimit-remaining-*` headers of a provider response.
+        """
+        if not headers:
+            return
+        limit_requests = _header_number(headers, 'x-ratelimit-limit-requests')
+        limit_tokens = _header_number(headers, 'x-ratelimit-limit-tokens')
+        remaining_requests = _header_number(headers, 'x-ratelimit-remaining-requests')
+        remaining_tokens = _header_number(headers, 'x-ratelimit-remaining-tokens')
+        if limit_requests is None and limit_tokens is None:
+            return
+
+        burst = settings.RATE_LIMIT_BURST_SECONDS
+        now = time.monotonic()
+        with self._lock:
+            limits = self._limits(key)
+            if limits is None:
+                limits = self._keys[key] = _KeyLimits(limit_requests, limit_tokens)
+            for name, limit, remaining in (('requests', limit_requests, remaining_requests),
+                                           ('tokens', limit_tokens, remaining_tokens)):
+                if not limit:
+                    continue
+                bucket = getattr(limits, name)
+                if bucket is None:
+                    bucket = TokenBucket(limit, burst)
+                    setattr(limits, name, bucket)
+                elif bucket.per_minute != limit:
+                    logger.info("Rate limit of %s:%s corrected to %g %s per minute", key[0], key[1], limit, name)
+                    bucket.set_limit(limit, burst)
+                if remaining is not None:
+                    bucket.limit_level(remaining, now)
+
+    def penalize(self, key: Tuple[str, str, str], retry_after: Optional[float]) -> None:
+        """
+        Empties the buckets of a key after the provider rejected a call for its rate limit,
+        so that queued calls wait for `retry_after` seconds (or until a call's worth refilled).
+        """
+        now = time.monotonic()
+        with self._lock:
+            limits = self._keys.get(key)
+            if limits is None:
+                return
+            for bucket in (limits.requests, limits.tokens):
+                if bucket is not None:
+                    bucket.limit_level(-(retry_after or 0.0) * bucket.rate, now)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                f"{provider}:{model}:{key_hash[:8]}": {
+                    "rpm": limits.requests.per_minute if limits.requests else None,
+                    "tpm": limits.tokens.per_minute if limits.tokens else None,
+                    "calls": limits.calls,
+                    "waited": limits.waited,
+                    "wait_seconds": round(limits.wait_seconds, 3),
+                    "rejected": limits.rejected,
+                }
+                for (provider, model, key_hash), limits in self._keys.items()
+            }
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,284 @@
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+import openai
+from google.api_core import exceptions as google_exceptions
+from huggingface_hub.errors import InferenceTimeoutError, OverloadedError
+
+from app.config import settings
+from app.services.metrics_service import count_retry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Status codes worth retrying regardless of provider
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+AUTH_STATUS_CODES = frozenset({401, 403})
+
+_OPENAI_ERRORS = (
+    (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError,
+     openai.ConflictError),
+    (openai.AuthenticationError, openai.PermissionDeniedError, openai.BadRequestError, openai.NotFoundError,
+     openai.UnprocessableEntityError),
+)
+_GEMINI_ERRORS = (
+    (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests, google_exceptions.ServiceUnavailable,
+     google_exceptions.InternalServerError, google_exceptions.DeadlineExceeded),
+    (google_exceptions.Unauthenticated, google_exceptions.PermissionDenied, google_exceptions.InvalidArgument,
+     google_exceptions.NotFound, google_exceptions.FailedPrecondition),
+)
+_HF_TEXT_ERRORS = (
+    (InferenceTimeoutError, OverloadedError),
+    (),
+)
+
+# (retryable, fatal) exception types per provider; anything else is classified by status code
+PROVIDER_ERRORS: Dict[str, Tuple[Tuple[Type[BaseException], ...], Tuple[Type[BaseException], ...]]] = {
+    "openai": _OPENAI_ERRORS,
+    "huggingface-openai": _OPENAI_ERRORS,
+    "ollama": _OPENAI_ERRORS,
+    "simulated": _OPENAI_ERRORS,
+    "gemini": _GEMINI_ERRORS,
+    "huggingface-text": _HF_TEXT_ERRORS,
+}
+
+
+class Deadline:
+    """
+    The point in time by which a request has to be answered.
+
+    Args:
+        timeout (Optional[float]): The number of seconds from now, or None for no deadline.
+    """
+
+    def __init__(self, timeout: Optional[float]):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout if timeout else None
+
+    def remaining(self) -> Optional[float]:
+        """The number of seconds left, or None without a deadline."""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+
+def _error_chain(error: BaseException):
+    # Some providers wrap the SDK error, e.g. GeminiLLM raises ValueError from it
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """
+    Returns the HTTP status code carried by a provider error, if any.
+    """
+    for candidate in _error_chain(error):
+        for value in (getattr(candidate, 'status_code', None), getattr(candidate, 'code', None),
+                      getattr(getattr(candidate, 'response', None), 'status_code', None),
+                      getattr(candidate, 'status', None)):
+            if isinstance(value, int) and 100 <= value < 600:
+                return value
+    return None
+
+
+def is_retryable(error: BaseException, provider: str) -> bool:
+    """
+    Classifies an error raised by a provider call as retryable or fatal.
+
+    Provider-specific exception types are checked first, then the HTTP status code
+    (408, 409, 425, 429 and 5xx are retryable), then timeouts and connection errors.
+    Everything else, including authentication and bad request errors, is fatal.
+
+    Args:
+        error (BaseException): The error raised by the call.
+        provider (str): The provider the call was made to.
+
+    Returns:
+        bool: Whether repeating the call may succeed.
+    """
+    retryable, fatal = PROVIDER_ERRORS.get(provider, ((), ()))
+    for candidate in _error_chain(error):
+        if isinstance(candidate, fatal):
+            return False
+        if isinstance(candidate, retryable):
+            return True
+    code = status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS_CODES
+    return any(isinstance(candidate, (TimeoutError, ConnectionError)) for candidate in _error_chain(error))
+
+
+def is_auth_error(error: BaseException) -> bool:
+    """
+    Returns whether an error means the credentials were rejected.
+    """
+    for candidate in _error_chain(error):
+        if isinstance(candidate, (openai.AuthenticationError, openai.PermissionDeniedError,
+                                  google_exceptions.Unauthenticated, google_exceptions.PermissionDenied)):
+            return True
+    return status_code(error) in AUTH_STATUS_CODES
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Returns the delay in seconds requested by the `Retry-After` (or `retry-after-ms`)
+    header of the response that caused an error, if any.
+    """
+    for candidate in _error_chain(error):
+        headers = getattr(getattr(candidate, 'response', None), 'headers', None)
+        if not headers:
+            continue
+        try:
+            if headers.get('retry-after-ms'):
+                return max(float(headers['retry-after-ms']) / 1000, 0.0)
+            value = headers.get('retry-after')
+            if value:
+                try:
+                    return max(float(value), 0.0)
+                except ValueError:
+                    return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class RetryPolicy:
+    """
+    Retries provider calls within the time budget of a request.
+
+    Every attempt is bounded by the remaining time of the request's `Deadline`. Fatal
+    errors are raised at once. Retryable errors are retried after the server's
+    `Retry-After` delay or, without one, a full-jitter exponential backoff; when that
+    delay would not leave time before the deadline, the error is raised instead.
+
+    Args:
+        max_attempts (int): The maximum number of attempts per call.
+        base_delay (float): The backoff ceiling of the first retry in seconds.
+        max_delay (float): The maximum backoff ceiling in seconds.
+    """
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int, error: BaseException, deadline: Deadline) -> Optional[float]:
+        """
+        Returns the delay before the next attempt, or None if the call should not be retried.
+
+        Args:
+            attempt (int): The number of the attempt that failed, starting at 1.
+            error (BaseException): The error of that attempt.
+            deadline (Deadline): The deadline of the request.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        remaining = deadline.remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+    async def _attempt(self, awaitable: Awaitable[T], deadline: Deadline) -> T:
+        try:
+            return await asyncio.wait_for(awaitable, timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            if not deadline.expired:
+                raise
+            raise TimeoutError(f"The model did not respond within {deadline.timeout:g} seconds") from None
+
+    async def _handle_failure(self, error: BaseException, attempt: int, provider: str, deadline: Deadline) -> None:
+        if isinstance(error, TimeoutError) and deadline.expired:
+            raise error
+        if not is_retryable(error, provider):
+            raise error
+        delay = self.backoff(attempt, error, deadline)
+        if delay is None:
+            raise error
+        logger.warning("Retrying %s call after %s (attempt %d of %d) in %.2f seconds",
+                       provider, type(error).__name__, attempt, self.max_attempts, delay)
+        count_retry(provider, error)
+        await asyncio.sleep(delay)
+
+    async def call(self, fn: Callable[[], Awaitable[T]], provider: str, deadline: Deadline) -> T:
+        """
+        Calls `fn` until it succeeds, fails with a fatal error, runs out of attempts or
+        the deadline passes.
+
+        Args:
+            fn (Callable[[], Awaitable[T]]): Starts one attempt of the call.
+            provider (str): The provider the call is made to, used to classify errors.
+            deadline (Deadline): The deadline of the request.
+
+        Returns:
+            T: The result of the first successful attempt.
+
+        Raises:
+            TimeoutError: If the deadline passes before an attempt succeeds.
+            Exception: The error of the last attempt.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await self._attempt(fn(), deadline)
+            except Exception as e:
+                await self._handle_failure(e, attempt, provider, deadline)
+
+    async def stream(self, factory: Callable[[], AsyncIterator[str]], provider: str,
+                     deadline: Deadline) -> AsyncIterator[str]:
+        """
+        Streams from `factory()`, retrying until the first chunk arrives. Once output has
+        been yielded the stream is not retried, but every chunk is still bounded by the
+        deadline.
+
+        Args:
+            factory (Callable[[], AsyncIterator[str]]): Starts one attempt of the stream.
+            provider (str): The provider the call is made to, used to classify errors.
+            deadline (Deadline): The deadline of the request.
+
+        Yields:
+            str: The chunks of the successful attempt.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            stream = factory()
+            try:
+                first = await self._attempt(stream.__anext__(), deadline)
+                break
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                await stream.aclose()
+                await self._handle_failure(e, attempt, provider, deadline)
+
+        try:
+            yield first
+            while True:
+                try:
+                    chunk = await self._attempt(stream.__anext__(), deadline)
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        finally:
+            await stream.aclose()
+
+
+retry_policy = RetryPolicy(max_attempts=settings.LLM_RETRY_MAX_ATTEMPTS,
+                           base_delay=settings.LLM_RETRY_BASE_DELAY,
+                           max_delay=settings.LLM_RETRY_MAX_DELAY)
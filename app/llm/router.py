@@ -0,0 +1,229 @@
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.llm.hedging import parse_route
+from app.llm.latency_tracker import LatencyTracker, Route, latency_tracker
+from app.llm.retry_policy import is_retryable, status_code
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailableError(Exception):
+    """Raised when every route for a request has an open circuit breaker."""
+    pass
+
+
+def is_provider_failure(error: BaseException, provider: str, user_supplied_key: bool = False) -> bool:
+    """
+    Returns whether an error says something about the health of the provider (rate
+    limits, server errors, timeouts and connection errors) rather than about the request
+    or the credentials.
+
+    A rate limit or exhausted quota of a user's own API key only concerns that key, which
+    the rate limiter already tracks, so it does not count against the provider.
+    """
+    if user_supplied_key and status_code(error) == 429:
+        return False
+    return isinstance(error, TimeoutError) or is_retryable(error, provider)
+
+
+class CircuitBreaker:
+    """
+    The circuit breaker of one route.
+
+    Closed, calls go through. It opens when at least `CIRCUIT_MIN_CALLS` calls were made
+    in the last `CIRCUIT_WINDOW_SECONDS` and at least `CIRCUIT_ERROR_THRESHOLD` of them
+    failed. Open, calls are refused for `CIRCUIT_OPEN_SECONDS`; then it is half-open and
+    lets up to `CIRCUIT_HALF_OPEN_PROBES` calls through at a time. A successful probe
+    closes it again and a failed one reopens it.
+
+    Args:
+        route (Route): The (provider, model) of the breaker.
+        tracker (LatencyTracker): Where the outcomes of the route's calls are recorded.
+    """
+
+    def __init__(self, route: Route, tracker: LatencyTracker):
+        self.route = route
+        self.tracker = tracker
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes = 0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def _update(self) -> None:
+        # Called with the lock held
+        if self.state == OPEN and time.monotonic() - self.opened_at >= settings.CIRCUIT_OPEN_SECONDS:
+            self.state = HALF_OPEN
+            self.probes = 0
+
+    def available(self) -> bool:
+        """
+        Returns whether `allow` would let a call through now, without taking a probe.
+        """
+        with self._lock:
+            self._update()
+            return self.state == CLOSED or (self.state == HALF_OPEN and
+                                            self.probes < settings.CIRCUIT_HALF_OPEN_PROBES)
+
+    def allow(self) -> bool:
+        """
+        Returns whether a call may be made now. A call allowed while half-open is a probe
+        and has to be followed by `record` or `release`.
+        """
+        with self._lock:
+            self._update()
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self.probes < settings.CIRCUIT_HALF_OPEN_PROBES:
+                self.probes += 1
+                return True
+            return False
+
+    def release(self) -> None:
+        """
+        Gives back the probe of a call that ended without an outcome, e.g. was cancelled.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probes = max(self.probes - 1, 0)
+
+    def record(self, failed: bool, rate_limited: bool = False) -> None:
+        """
+        Records the outcome of a call and updates the state.
+        """
+        self.tracker.record_outcome(*self.route, failed=failed, rate_limited=rate_limited)
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probes = max(self.probes - 1, 0)
+                if failed:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    # Failures from before the recovery should not reopen it
+                    self.tracker.reset_outcomes(*self.route)
+                    logger.info("Circuit for %s:%s closed", *self.route)
+            elif self.state == CLOSED and failed:
+                health = self.tracker.health(*self.route, max_age=settings.CIRCUIT_WINDOW_SECONDS)
+                if health["calls"] >= settings.CIRCUIT_MIN_CALLS and \
+                        health["error_rate"] >= settings.CIRCUIT_ERROR_THRESHOLD:
+                    self._open()
+
+    def _open(self) -> None:
+        # Called with the lock held
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        logger.warning("Circuit for %s:%s opened", *self.route)
+
+    def retry_in(self) -> float:
+        """The number of seconds until an open breaker lets a probe through."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(settings.CIRCUIT_OPEN_SECONDS - (time.monotonic() - self.opened_at), 0.0)
+
+
+class ProviderRouter:
+    """
+    Chooses the routes a call is made to, based on the circuit breakers and the measured
+    health of each provider and model.
+
+    A request goes to the provider and model it selected while its breaker allows it.
+    Otherwise, or when the call fails because of the provider, it goes to the fallbacks of
+    `ROUTING_FALLBACKS` ("provider:model" or "provider" -> list of "provider:model"),
+    healthiest first: lowest recent error rate, then lowest median latency, then the
+    configured order.
+
+    Args:
+        tracker (LatencyTracker): The latencies and outcomes of the calls.
+    """
+
+    def __init__(self, tracker: LatencyTracker):
+        self.tracker = tracker
+        self._breakers: Dict[Route, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.rerouted = 0
+        self.rejected = 0
+
+    def breaker(self, provider: str, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get((provider, model))
+            if breaker is None:
+                breaker = self._breakers[(provider, model)] = CircuitBreaker((provider, model), self.tracker)
+            return breaker
+
+    def fallbacks(self, provider: str, model: str) -> List[Route]:
+        """
+        Returns the fallback routes of a route, healthiest first.
+        """
+        configured = settings.ROUTING_FALLBACKS.get(f"{provider}:{model}") or \
+            settings.ROUTING_FALLBACKS.get(provider) or []
+        routes = [parse_route(route) for route in configured]
+        routes = [route for index, route in enumerate(routes)
+                  if route != (provider, model) and route not in routes[:index]]
+
+        def health_key(item):
+            index, route = item
+            health = self.tracker.health(*route, max_age=settings.CIRCUIT_WINDOW_SECONDS)
+            median = self.tracker.percentile(*route, 0.5)
+            return (health["error_rate"], median if median is not None else float('inf'), index)
+
+        return [route for _, route in sorted(enumerate(routes), key=health_key)]
+
+    def candidates(self, provider: str, model: str) -> List[Route]:
+        """
+        Returns the routes to try for a call, in order: the route itself, then its fallbacks.
+        Whether a route may be called is decided by its breaker's `allow` right before the call.
+        """
+        return [(provider, model)] + self.fallbacks(provider, model)
+
+    def rerouted_to(self, provider: str, model: str, route: Route) -> None:
+        """Counts a call that was sent to a fallback route."""
+        with self._lock:
+            self.rerouted += 1
+        logger.warning("Routing call for %s:%s to %s:%s", provider, model, *route)
+
+    def unavailable(self, provider: str, model: str) -> ProviderUnavailableError:
+        """
+        Counts a call that was refused because no route could be called, and returns the
+        error to raise for it.
+        """
+        with self._lock:
+            self.rejected += 1
+        retry_in = self.breaker(provider, model).retry_in()
+        return ProviderUnavailableError(
+            f"{provider} ({model}) is temporarily unavailable. Please try again in {retry_in:.0f} seconds.")
+
+    def record(self, route: Route, error: Optional[BaseException] = None, user_supplied_key: bool = False) -> None:
+        """
+        Records the outcome of a call. Errors that are not the provider's fault, like bad
+        requests, rejected credentials and the rate limits of a user's own API key, count
+        as successful calls.
+        """
+        failed = error is not None and is_provider_failure(error, route[0], user_supplied_key)
+        self.breaker(*route).record(failed, rate_limited=failed and status_code(error) == 429)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+            stats: Dict[str, Any] = {"rerouted": self.rerouted, "rejected": self.rejected}
+        stats["circuits"] = {
+            f"{provider}:{model}": {
+                "state": breaker.state,
+                "opened": breaker.times_opened,
+                **self.tracker.health(provider, model, max_age=settings.CIRCUIT_WINDOW_SECONDS),
+            }
+            for breaker in breakers for provider, model in [breaker.route]
+        }
+        return stats
+
+
+provider_router = ProviderRouter(latency_tracker)
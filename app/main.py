@@ -1,15 +1,34 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from .api.routes import router
+from .api.asgi_routes import router
 from .config import settings
+from .services import diagram_service
+from .services.coalescing_service import single_flight
+from .utils.logging_utils import configure_logging
 
-app = FastAPI(title=settings.APP_NAME)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Every request of a worker is served on this loop, so shared calls run on it too and
+    # reuse its pooled connections
+    configure_logging()
+    diagram_service.warm_up()
+    single_flight.bind_loop(asyncio.get_running_loop())
+    yield
+    await diagram_service.shutdown()
+
+
+app = FastAPI(title=settings.APP_NAME, lifespan=lifespan)
 
 app.include_router(router)
 
 # Mount static files
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(__file__), "static")), name="static")
+
 
-# Configure templates
-templates = Jinja2Templates(directory="app/templates")
\ No newline at end of file
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run("app.main:app", host=settings.HOST, port=settings.PORT, workers=settings.WORKERS)
@@ -0,0 +1,253 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.rendering.layout import layered_layout, midpoint
+from app.rendering.svg import LINE_HEIGHT, SvgDocument, css_style, label_lines, text_height, text_style, text_width
+
+PADDING_X = 10
+PADDING_Y = 6
+MIN_WIDTH = 80
+
+CLASS_NAME = r'(?:`[^`]+`|[\w.]+)(?:~[^~]*~)?'
+RELATION = re.compile(
+    rf'^({CLASS_NAME})\s*(?:"([^"]*)"\s*)?(<\||\*|o|<|\(\))?(--|\.\.)(\|>|\*|o|>|\(\))?\s*(?:"([^"]*)"\s*)?'
+    rf'({CLASS_NAME})\s*(?::(.*))?$')
+CLASS_DECLARATION = re.compile(rf'^class\s+({CLASS_NAME})(?:\["([^"]*)"\])?\s*(?::::([\w-]+))?\s*(\{{)?\s*(\}})?$')
+MEMBER = re.compile(rf'^({CLASS_NAME})\s*:\s*(.+)$')
+ANNOTATION = re.compile(r'^<<([^>]+)>>\s*(\S+)?$')
+NOTE = re.compile(r'^note\s+(?:for\s+(\S+)\s+)?"(.*)"$')
+GENERIC = re.compile(r'~([^~]*)~')
+
+# The marker drawn at an end of a relation for its end token
+END_MARKERS = {'<|': 'triangle', '|>': 'triangle', '*': 'diamond', 'o': 'hollow-diamond', '<': 'open-arrow',
+               '>': 'open-arrow', '()': 'circle'}
+
+
+@dataclass
+class ClassBox:
+    id: str
+    label: str
+    annotations: List[str] = field(default_factory=list)
+    attributes: List[str] = field(default_factory=list)
+    methods: List[str] = field(default_factory=list)
+    note: bool = False
+    classes: List[str] = field(default_factory=list)
+    style: str = ''
+
+
+@dataclass
+class Relation:
+    source: str
+    target: str
+    line: str
+    source_marker: Optional[str]
+    target_marker: Optional[str]
+    label: List[str]
+    source_cardinality: str = ''
+    target_cardinality: str = ''
+
+
+@dataclass
+class ClassDiagram:
+    direction: str = 'TB'
+    classes: Dict[str, ClassBox] = field(default_factory=dict)
+    relations: List[Relation] = field(default_factory=list)
+    class_styles: Dict[str, str] = field(default_factory=dict)
+
+
+def _class_id(name: str) -> str:
+    return GENERIC.sub('', name).strip('`')
+
+
+def _display_name(name: str) -> str:
+    # Generics are written with tildes, List~int~ is shown as List<int>
+    return GENERIC.sub(lambda match: f"<{match.group(1).replace('~', '')}>", name).strip('`')
+
+
+class ClassParser:
+    """
+    Parses the classes, members, annotations, relations, notes and styles of a class
+    diagram. Namespaces are flattened.
+    """
+
+    def __init__(self):
+        self.diagram = ClassDiagram()
+        self._open_class: Optional[str] = None
+        self._namespaces = 0
+
+    def parse(self, lines: List[str]) -> ClassDiagram:
+        for line in lines[1:]:
+            text = line.strip()
+            if text and not text.startswith('%%'):
+                self._statement(text)
+        return self.diagram
+
+    def _class(self, name: str) -> ClassBox:
+        class_id = _class_id(name)
+        box = self.diagram.classes.get(class_id)
+        if box is None:
+            box = self.diagram.classes[class_id] = ClassBox(class_id, _display_name(name))
+        elif '~' in name:
+            box.label = _display_name(name)
+        return box
+
+    @staticmethod
+    def _add_member(box: ClassBox, member: str) -> None:
+        member = member.strip()
+        annotation = ANNOTATION.match(member)
+        if annotation and not annotation.group(2):
+            box.annotations.append(annotation.group(1))
+        elif member:
+            (box.methods if '(' in member else box.attributes).append(_display_name(member))
+
+    def _statement(self, text: str) -> None:
+        if self._open_class is not None:
+            if text == '}':
+                self._open_class = None
+            else:
+                self._add_member(self.diagram.classes[self._open_class], text)
+            return
+        if text == '}':
+            self._namespaces = max(self._namespaces - 1, 0)
+            return
+        keyword = text.split(None, 1)[0]
+        rest = text[len(keyword):].strip()
+        if keyword == 'namespace':
+            self._namespaces += 1
+        elif keyword == 'direction':
+            self.diagram.direction = rest if rest in ('TB', 'BT', 'LR', 'RL') else 'TB'
+        elif keyword in ('classDef', 'cssClass', 'style', 'click', 'callback', 'link') or keyword.startswith('acc'):
+            self._styling(keyword, rest)
+        elif keyword == 'note':
+            match = NOTE.match(text)
+            if match:
+                note = ClassBox(f"note:{len(self.diagram.classes)}", '', note=True,
+                                attributes=label_lines(match.group(2).replace('\\n', '\n')))
+                self.diagram.classes[note.id] = note
+                if match.group(1):
+                    self.diagram.relations.append(Relation(note.id, self._class(match.group(1)).id, 'dashed',
+                                                           None, None, []))
+        elif keyword == 'class' and CLASS_DECLARATION.match(text):
+            name, label, css_class, opens, closes = CLASS_DECLARATION.match(text).groups()
+            box = self._class(name)
+            if label:
+                box.label = label
+            if css_class:
+                box.classes.append(css_class)
+            if opens and not closes:
+                self._open_class = box.id
+        elif ANNOTATION.match(text):
+            annotation, name = ANNOTATION.match(text).groups()
+            if name:
+                self._class(name).annotations.append(annotation)
+        elif RELATION.match(text):
+            self._relation(RELATION.match(text))
+        elif MEMBER.match(text):
+            name, member = MEMBER.match(text).groups()
+            self._add_member(self._class(name), member)
+        elif re.match(rf'^{CLASS_NAME}\s*\{{$', text):
+            self._open_class = self._class(text.rstrip('{').strip()).id
+
+    def _styling(self, keyword: str, rest: str) -> None:
+        if keyword == 'classDef':
+            name, _, definition = rest.partition(' ')
+            self.diagram.class_styles[name] = css_style(definition)
+        elif keyword == 'cssClass':
+            match = re.match(r'^"([^"]*)"\s+([\w-]+)$', rest)
+            if match:
+                for name in match.group(1).split(','):
+                    self._class(name.strip()).classes.append(match.group(2))
+        elif keyword == 'style':
+            name, _, definition = rest.partition(' ')
+            self._class(name).style = css_style(definition)
+
+    def _relation(self, match: re.Match) -> None:
+        source, source_cardinality, source_end, line, target_end, target_cardinality, target, label = match.groups()
+        self.diagram.relations.append(Relation(
+            self._class(source).id, self._class(target).id, 'dashed' if line == '..' else 'solid',
+            END_MARKERS.get(source_end), END_MARKERS.get(target_end),
+            label_lines(label) if label and label.strip() else [],
+            source_cardinality or '', target_cardinality or ''))
+
+
+def _sections(box: ClassBox) -> List[List[str]]:
+    title = [f"«{annotation}»" for annotation in box.annotations] + [box.label]
+    return [title, box.attributes, box.methods]
+
+
+def _section_height(lines: List[str]) -> float:
+    # Empty compartments are drawn, but only as high as their padding
+    return len(lines) * LINE_HEIGHT + 2 * PADDING_Y
+
+
+def _box_size(box: ClassBox) -> Tuple[float, float]:
+    if box.note:
+        return text_width(box.attributes) + 2 * PADDING_X, text_height(box.attributes) + 2 * PADDING_Y
+    sections = _sections(box)
+    width = max(text_width(lines) for lines in sections) + 2 * PADDING_X
+    height = sum(_section_height(lines) for lines in sections)
+    return max(width, MIN_WIDTH), height
+
+
+def _draw_box(svg: SvgDocument, box: ClassBox, x: float, y: float, width: float, height: float,
+              style: Optional[str]) -> None:
+    left, top = x - width / 2, y - height / 2
+    if box.note:
+        svg.rect(left, top, width, height, class_='note')
+        svg.text(x, y, box.attributes)
+        return
+    svg.rect(left, top, width, height, style=style)
+    section_top = top
+    for index, lines in enumerate(_sections(box)):
+        section_height = _section_height(lines)
+        if index:
+            svg.line([(left, section_top), (left + width, section_top)], class_='node')
+        if lines:
+            if index == 0:
+                svg.text(x, section_top + section_height / 2, lines, class_='bold', style=text_style(style))
+            else:
+                svg.text(left + PADDING_X, section_top + section_height / 2, lines, anchor='start',
+                         style=text_style(style))
+        section_top += section_height
+
+
+def render_class(lines: List[str]) -> str:
+    """
+    Renders the lines of a class diagram (after any front matter) as SVG.
+    """
+    diagram = ClassParser().parse(lines)
+    # In the layout a relation points away from the end with the marker, so that the
+    # parent of `Animal <|-- Duck` and of `Duck --|> Animal` is above the subclass
+    flipped = [bool(relation.target_marker and not relation.source_marker) for relation in diagram.relations]
+    layout = layered_layout([(class_id, *_box_size(box), 'box') for class_id, box in diagram.classes.items()],
+                            [(relation.target, relation.source) if flip else (relation.source, relation.target)
+                             for relation, flip in zip(diagram.relations, flipped)],
+                            diagram.direction, rank_gap=60, node_gap=40)
+
+    svg = SvgDocument()
+    for relation, points, flip in zip(diagram.relations, layout.edges, flipped):
+        if len(points) < 2:
+            continue
+        if flip:
+            points = list(reversed(points))
+        source_point, target_point = points[0], points[-1]
+        svg.line(points, class_='edge dashed' if relation.line == 'dashed' else 'edge',
+                 marker_start=relation.source_marker, marker_end=relation.target_marker)
+        if relation.label:
+            x, y = midpoint(points)
+            width, height = text_width(relation.label) + 4, text_height(relation.label)
+            svg.rect(x - width / 2, y - height / 2, width, height, class_='edge-label')
+            svg.text(x, y, relation.label)
+        for cardinality, point, towards in ((relation.source_cardinality, source_point, points[1]),
+                                            (relation.target_cardinality, target_point, points[-2])):
+            if cardinality:
+                dx, dy = towards[0] - point[0], towards[1] - point[1]
+                length = max((dx ** 2 + dy ** 2) ** 0.5, 1)
+                svg.text(point[0] + dx / length * 18 + 10, point[1] + dy / length * 18, [cardinality], anchor='start')
+
+    for class_id, box in diagram.classes.items():
+        placed = layout.nodes[class_id]
+        style = ';'.join(filter(None, [diagram.class_styles.get(name, '') for name in box.classes] + [box.style]))
+        _draw_box(svg, box, placed.x, placed.y, placed.width, placed.height, style or None)
+    return svg.render()
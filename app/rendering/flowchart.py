@@ -0,0 +1,297 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.rendering.layout import cluster_boxes, layered_layout, midpoint, nesting_depth, offset_layout
+from app.rendering.svg import LINE_HEIGHT, SvgDocument, css_style, label_lines, text_height, text_style, text_width
+
+PADDING_X = 15
+PADDING_Y = 10
+CLUSTER_PADDING = 12
+
+HEADER = re.compile(r'^(?:flowchart|graph)(?:\s+(TB|TD|BT|RL|LR))?\s*;?$')
+NODE_ID = re.compile(r'[\w.$-]+?(?=[\s\[\](){}>&|;:=~<-]|-[-.=>ox]|$)')
+# Opening and closing delimiters of the node shapes, longest first
+SHAPES = [
+    ('(((', ')))', 'double-circle'), ('([', '])', 'stadium'), ('[[', ']]', 'subroutine'), ('[(', ')]', 'cylinder'),
+    ('((', '))', 'circle'), ('{{', '}}', 'hexagon'), ('[/', '/]', 'parallelogram'), ('[\\', '\\]', 'parallelogram-alt'),
+    ('[/', '\\]', 'trapezoid'), ('[\\', '/]', 'trapezoid-alt'), ('(', ')', 'round'), ('[', ']', 'rect'),
+    ('{', '}', 'diamond'), ('>', ']', 'asymmetric'),
+]
+LINK_WITH_TEXT = re.compile(r'\s*([<xo]?)(--|==|-\.)\s*([^-=.>|\s](?:.*?\S)?)\s*(-{2,}|={2,}|\.-+|-\.+-|-{3,})([>xo]?)\s*')
+LINK = re.compile(r'\s*([<xo]?)(-{2,}|={2,}|-\.+-|~{3,})([>xo]?)(?:\s*\|([^|]*)\|)?\s*')
+CLASS_SUFFIX = re.compile(r':::([\w-]+)')
+MARKERS = {'>': 'arrow', 'x': 'cross', 'o': 'circle', '<': 'arrow'}
+
+
+@dataclass
+class Node:
+    id: str
+    label: List[str]
+    shape: str = 'rect'
+    classes: List[str] = field(default_factory=list)
+    style: str = ''
+
+
+@dataclass
+class Edge:
+    source: str
+    target: str
+    label: List[str]
+    line: str = 'solid'
+    start: Optional[str] = None
+    end: Optional[str] = 'arrow'
+
+
+@dataclass
+class Subgraph:
+    id: str
+    title: List[str]
+    nodes: List[str] = field(default_factory=list)
+    parent: Optional[int] = None
+
+
+@dataclass
+class Flowchart:
+    direction: str = 'TB'
+    nodes: Dict[str, Node] = field(default_factory=dict)
+    edges: List[Edge] = field(default_factory=list)
+    subgraphs: List[Subgraph] = field(default_factory=list)
+    class_styles: Dict[str, str] = field(default_factory=dict)
+
+
+class FlowchartParser:
+    """
+    Parses the node, link, subgraph and style statements of a flowchart. Statements it
+    does not understand, like `click`, are skipped.
+    """
+
+    def __init__(self):
+        self.chart = Flowchart()
+        self._subgraphs: List[int] = []
+
+    def parse(self, lines: List[str]) -> Flowchart:
+        header = HEADER.match(lines[0].strip())
+        direction = (header.group(1) if header else None) or 'TB'
+        self.chart.direction = 'TB' if direction == 'TD' else direction
+        for line in lines[1:]:
+            text = line.strip().rstrip(';').strip()
+            if text and not text.startswith('%%'):
+                self._statement(text)
+        return self.chart
+
+    def _statement(self, text: str) -> None:
+        keyword = text.split(None, 1)[0]
+        rest = text[len(keyword):].strip()
+        if keyword == 'subgraph':
+            self._open_subgraph(rest)
+        elif keyword == 'end' and not rest:
+            if self._subgraphs:
+                self._subgraphs.pop()
+        elif keyword in ('direction', 'linkStyle', 'click', 'accTitle', 'accDescr') or keyword.startswith('acc'):
+            return
+        elif keyword == 'classDef':
+            names, _, definition = rest.partition(' ')
+            for name in names.split(','):
+                self.chart.class_styles[name.strip()] = css_style(definition)
+        elif keyword == 'class':
+            ids, _, name = rest.rpartition(' ')
+            for node_id in ids.split(','):
+                self._node(node_id.strip()).classes.append(name.strip())
+        elif keyword == 'style':
+            node_id, _, definition = rest.partition(' ')
+            self._node(node_id).style = css_style(definition)
+        else:
+            self._chain(text)
+
+    def _open_subgraph(self, rest: str) -> None:
+        match = re.match(r'^([\w.$-]+)\s*\[(.*)\]$', rest)
+        if match:
+            subgraph_id, title = match.group(1), match.group(2)
+        else:
+            subgraph_id, title = rest or f"subgraph{len(self.chart.subgraphs)}", rest
+        parent = self._subgraphs[-1] if self._subgraphs else None
+        self.chart.subgraphs.append(Subgraph(subgraph_id, label_lines(title), parent=parent))
+        self._subgraphs.append(len(self.chart.subgraphs) - 1)
+
+    def _node(self, node_id: str, label: Optional[str] = None, shape: Optional[str] = None) -> Node:
+        node = self.chart.nodes.get(node_id)
+        if node is None:
+            node = self.chart.nodes[node_id] = Node(node_id, [node_id])
+            if self._subgraphs:
+                self.chart.subgraphs[self._subgraphs[-1]].nodes.append(node_id)
+        if label is not None:
+            node.label = label_lines(label)
+        if shape is not None:
+            node.shape = shape
+        return node
+
+    def _read_node(self, text: str, position: int) -> Tuple[Optional[str], int]:
+        match = NODE_ID.match(text, position)
+        if not match or not match.group(0):
+            return None, position
+        node_id = match.group(0)
+        position = match.end()
+        label, shape = None, None
+        for opening, closing, name in SHAPES:
+            if text.startswith(opening, position):
+                end = self._shape_end(text, position + len(opening), closing)
+                if end is not None:
+                    label, shape = text[position + len(opening):end], name
+                    position = end + len(closing)
+                    break
+        node = self._node(node_id, label, shape)
+        suffix = CLASS_SUFFIX.match(text, position)
+        if suffix:
+            node.classes.append(suffix.group(1))
+            position = suffix.end()
+        return node_id, position
+
+    @staticmethod
+    def _shape_end(text: str, start: int, closing: str) -> Optional[int]:
+        # The closing delimiter, skipping over a quoted label
+        position = start
+        if text.startswith('"', position):
+            quote_end = text.find('"', position + 1)
+            if quote_end != -1:
+                position = quote_end + 1
+        end = text.find(closing, position)
+        return end if end != -1 else None
+
+    def _read_group(self, text: str, position: int) -> Tuple[List[str], int]:
+        group = []
+        while True:
+            node_id, position = self._read_node(text, position)
+            if node_id is None:
+                return group, position
+            group.append(node_id)
+            ampersand = re.compile(r'\s*&\s*').match(text, position)
+            if not ampersand:
+                return group, position
+            position = ampersand.end()
+
+    def _chain(self, text: str) -> None:
+        sources, position = self._read_group(text, 0)
+        while sources and position < len(text):
+            match = LINK_WITH_TEXT.match(text, position)
+            if match:
+                start, kind, label, _, end = match.groups()
+            else:
+                match = LINK.match(text, position)
+                if not match:
+                    return
+                start, kind, end, label = match.groups()
+            targets, position = self._read_group(text, match.end())
+            line = ('invisible' if kind.startswith('~') else 'thick' if kind.startswith('=')
+                    else 'dotted' if '.' in kind else 'solid')
+            for source in sources:
+                for target in targets:
+                    self.chart.edges.append(Edge(source, target, label_lines(label) if label else [], line,
+                                                 MARKERS.get(start), MARKERS.get(end)))
+            sources = targets
+
+
+def _node_size(node: Node) -> Tuple[float, float]:
+    width = text_width(node.label) + 2 * PADDING_X
+    height = text_height(node.label) + 2 * PADDING_Y
+    if node.shape in ('circle', 'double-circle'):
+        diameter = max(width, height) + (10 if node.shape == 'double-circle' else 0)
+        return diameter, diameter
+    if node.shape == 'diamond':
+        return width + height, height * 1.6
+    if node.shape == 'hexagon':
+        return width + height / 2, height
+    if node.shape in ('parallelogram', 'parallelogram-alt', 'trapezoid', 'trapezoid-alt', 'asymmetric'):
+        return width + height, height
+    if node.shape == 'cylinder':
+        return width, height + 16
+    return width, height
+
+
+def _layout_shape(shape: str) -> str:
+    if shape in ('circle', 'double-circle'):
+        return 'ellipse'
+    return 'diamond' if shape == 'diamond' else 'box'
+
+
+def _draw_node(svg: SvgDocument, node: Node, x: float, y: float, width: float, height: float, style: str) -> None:
+    left, top, right, bottom = x - width / 2, y - height / 2, x + width / 2, y + height / 2
+    shape = node.shape
+    if shape == 'round':
+        svg.rect(left, top, width, height, rx=5, style=style)
+    elif shape == 'stadium':
+        svg.rect(left, top, width, height, rx=height / 2, style=style)
+    elif shape in ('circle', 'double-circle'):
+        svg.ellipse(x, y, width / 2, height / 2, style=style)
+        if shape == 'double-circle':
+            svg.ellipse(x, y, width / 2 - 5, height / 2 - 5, style=style)
+    elif shape == 'diamond':
+        svg.polygon([(x, top), (right, y), (x, bottom), (left, y)], style=style)
+    elif shape == 'hexagon':
+        inset = height / 4
+        svg.polygon([(left + inset, top), (right - inset, top), (right, y), (right - inset, bottom),
+                     (left + inset, bottom), (left, y)], style=style)
+    elif shape in ('parallelogram', 'parallelogram-alt', 'trapezoid', 'trapezoid-alt'):
+        inset = height / 2
+        top_left, top_right, bottom_right, bottom_left = {
+            'parallelogram': (inset, 0, -inset, 0), 'parallelogram-alt': (0, -inset, 0, inset),
+            'trapezoid': (inset, -inset, 0, 0), 'trapezoid-alt': (0, 0, -inset, inset),
+        }[shape]
+        svg.polygon([(left + top_left, top), (right + top_right, top), (right + bottom_right, bottom),
+                     (left + bottom_left, bottom)], style=style)
+    elif shape == 'asymmetric':
+        svg.polygon([(left, top), (right, top), (right, bottom), (left, bottom), (left + height / 2, y)], style=style)
+    elif shape == 'cylinder':
+        ry = 8
+        svg.path(f"M{left:.1f},{top + ry:.1f} a{width / 2:.1f},{ry} 0 0,0 {width:.1f},0 "
+                 f"a{width / 2:.1f},{ry} 0 0,0 {-width:.1f},0 l0,{height - 2 * ry:.1f} "
+                 f"a{width / 2:.1f},{ry} 0 0,0 {width:.1f},0 l0,{-(height - 2 * ry):.1f}",
+                 ((left, top), (right, bottom)), style=style)
+    else:
+        svg.rect(left, top, width, height, style=style)
+        if shape == 'subroutine':
+            svg.line([(left + 8, top), (left + 8, bottom)], class_='node')
+            svg.line([(right - 8, top), (right - 8, bottom)], class_='node')
+    svg.text(x, y + (8 if shape == 'cylinder' else 0), node.label, style=text_style(style))
+
+
+def render_flowchart(lines: List[str]) -> str:
+    """
+    Renders the lines of a flowchart (after any front matter) as SVG.
+    """
+    chart = FlowchartParser().parse(lines)
+    sizes = {node_id: _node_size(node) for node_id, node in chart.nodes.items()}
+    groups = {node_id: index for index, subgraph in enumerate(chart.subgraphs) for node_id in subgraph.nodes}
+    layout = layered_layout([(node_id, *sizes[node_id], _layout_shape(node.shape)) for node_id, node in chart.nodes.items()],
+                            [(edge.source, edge.target) for edge in chart.edges], chart.direction, groups=groups)
+
+    # Room for the subgraph titles and padding above and left of the layout
+    depth = max((nesting_depth(chart.subgraphs, index) + 1 for index in range(len(chart.subgraphs))), default=0)
+    offset = depth * (CLUSTER_PADDING + LINE_HEIGHT)
+    offset_layout(layout, offset, offset)
+
+    svg = SvgDocument()
+    boxes = cluster_boxes(chart.subgraphs, layout, CLUSTER_PADDING)
+    for index in sorted(boxes, key=lambda index: nesting_depth(chart.subgraphs, index)):
+        left, top, right, bottom = boxes[index]
+        svg.rect(left, top, right - left, bottom - top, class_='cluster')
+        svg.text((left + right) / 2, top + CLUSTER_PADDING / 2 + text_height(chart.subgraphs[index].title) / 2,
+                 chart.subgraphs[index].title)
+
+    for edge, points in zip(chart.edges, layout.edges):
+        if len(points) < 2:
+            continue
+        svg.line(points, class_=f"edge {edge.line}", marker_start=edge.start if edge.line != 'invisible' else None,
+                 marker_end=edge.end if edge.line != 'invisible' else None)
+    for edge, points in zip(chart.edges, layout.edges):
+        if edge.label and any(edge.label) and len(points) >= 2:
+            x, y = midpoint(points)
+            width, height = text_width(edge.label) + 4, text_height(edge.label)
+            svg.rect(x - width / 2, y - height / 2, width, height, class_='edge-label')
+            svg.text(x, y, edge.label)
+
+    for node_id, node in chart.nodes.items():
+        placed = layout.nodes[node_id]
+        style = ';'.join(filter(None, [chart.class_styles.get(name, '') for name in node.classes] + [node.style]))
+        _draw_node(svg, node, placed.x, placed.y, placed.width, placed.height, style or None)
+    return svg.render()
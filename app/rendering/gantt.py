@@ -0,0 +1,259 @@
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from app.rendering.svg import LINE_HEIGHT, SvgDocument, label_lines, text_width
+
+CHART_WIDTH = 800
+ROW_HEIGHT = 24
+BAR_HEIGHT = 18
+TITLE_HEIGHT = 40
+AXIS_HEIGHT = 30
+MAX_TICKS = 12
+
+# Moment.js date format tokens and their strptime directives, longest first
+MOMENT_TOKENS = [
+    ('YYYY', '%Y'), ('YY', '%y'), ('MMMM', '%B'), ('MMM', '%b'), ('MM', '%m'), ('M', '%m'), ('DD', '%d'),
+    ('D', '%d'), ('HH', '%H'), ('H', '%H'), ('hh', '%I'), ('h', '%I'), ('mm', '%M'), ('m', '%M'),
+    ('ss', '%S'), ('s', '%S'), ('SSS', '%f'), ('A', '%p'), ('a', '%p'), ('ZZ', '%z'), ('Z', '%z'),
+]
+DURATION = re.compile(r'^(\d+(?:\.\d+)?)\s*(ms|s|m|h|d|w|M|y)$')
+DURATION_UNITS = {'ms': timedelta(milliseconds=1), 's': timedelta(seconds=1), 'm': timedelta(minutes=1),
+                  'h': timedelta(hours=1), 'd': timedelta(days=1), 'w': timedelta(weeks=1),
+                  'M': timedelta(days=30), 'y': timedelta(days=365)}
+TICK_INTERVAL = re.compile(r'^(\d+)(millisecond|second|minute|hour|day|week|month)$')
+TICK_UNITS = {'millisecond': timedelta(milliseconds=1), 'second': timedelta(seconds=1),
+              'minute': timedelta(minutes=1), 'hour': timedelta(hours=1), 'day': timedelta(days=1),
+              'week': timedelta(weeks=1), 'month': timedelta(days=30)}
+# Tick intervals to choose from when the chart does not set one
+AUTO_TICKS = [timedelta(hours=1), timedelta(hours=6), timedelta(days=1), timedelta(days=2), timedelta(weeks=1),
+              timedelta(weeks=2), timedelta(days=30), timedelta(days=91), timedelta(days=365)]
+TAGS = ('done', 'active', 'crit', 'milestone')
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+@dataclass
+class Task:
+    name: List[str]
+    section: int
+    id: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+
+@dataclass
+class Gantt:
+    title: List[str] = field(default_factory=list)
+    date_format: str = 'YYYY-MM-DD'
+    axis_format: str = '%Y-%m-%d'
+    tick_interval: Optional[timedelta] = None
+    excludes: List[str] = field(default_factory=list)
+    sections: List[List[str]] = field(default_factory=list)
+    tasks: List[Task] = field(default_factory=list)
+
+
+def strptime_format(moment_format: str) -> str:
+    """Translates a Moment.js date format, as used by `dateFormat`, to a strptime format."""
+    result, position = [], 0
+    while position < len(moment_format):
+        for token, directive in MOMENT_TOKENS:
+            if moment_format.startswith(token, position):
+                result.append(directive)
+                position += len(token)
+                break
+        else:
+            result.append(moment_format[position].replace('%', '%%'))
+            position += 1
+    return ''.join(result)
+
+
+class GanttParser:
+    """
+    Parses the settings, sections and tasks of a gantt chart and computes the start and
+    end of every task.
+    """
+
+    def __init__(self):
+        self.gantt = Gantt()
+        self._pending: List[Tuple[Task, List[str]]] = []
+
+    def parse(self, lines: List[str]) -> Gantt:
+        for line in lines[1:]:
+            text = line.strip()
+            if text and not text.startswith('%%'):
+                self._statement(text)
+        self._schedule()
+        return self.gantt
+
+    def _statement(self, text: str) -> None:
+        keyword = text.split(None, 1)[0]
+        rest = text[len(keyword):].strip()
+        if keyword == 'title':
+            self.gantt.title = label_lines(rest)
+        elif keyword == 'dateFormat':
+            self.gantt.date_format = rest
+        elif keyword == 'axisFormat':
+            self.gantt.axis_format = rest
+        elif keyword == 'tickInterval':
+            match = TICK_INTERVAL.match(rest)
+            if match:
+                self.gantt.tick_interval = int(match.group(1)) * TICK_UNITS[match.group(2)]
+        elif keyword == 'excludes':
+            self.gantt.excludes.extend(item.strip().lower() for item in rest.split(',') if item.strip())
+        elif keyword == 'section':
+            self.gantt.sections.append(label_lines(rest))
+        elif keyword in ('includes', 'todayMarker', 'weekday', 'displayMode', 'inclusiveEndDates', 'topAxis',
+                         'click', 'weekend') or keyword.startswith('acc'):
+            return
+        elif ':' in text:
+            name, _, metadata = text.partition(':')
+            items = [item.strip() for item in metadata.split(',')]
+            tags = []
+            while items and items[0] in TAGS:
+                tags.append(items.pop(0))
+            if not self.gantt.sections:
+                self.gantt.sections.append([])
+            task = Task(label_lines(name), len(self.gantt.sections) - 1, tags=tags)
+            if len(items) >= 3:
+                task.id = items.pop(0)
+            self.gantt.tasks.append(task)
+            self._pending.append((task, items))
+
+    def _date(self, text: str) -> Optional[datetime]:
+        if self.gantt.date_format.strip() in ('X', 'x'):
+            try:
+                return datetime.fromtimestamp(float(text) / (1000 if self.gantt.date_format.strip() == 'x' else 1))
+            except (ValueError, OverflowError, OSError):
+                return None
+        try:
+            parsed = datetime.strptime(text, strptime_format(self.gantt.date_format))
+        except (ValueError, re.error):
+            # re.error for a format that repeats a token, e.g. "YY;YY", which strptime cannot compile
+            try:
+                parsed = datetime.fromisoformat(text)
+            except ValueError:
+                return None
+        return parsed.replace(tzinfo=None)
+
+    def _excluded(self, day: date) -> bool:
+        excludes = self.gantt.excludes
+        return (('weekends' in excludes and day.weekday() >= 5) or WEEKDAYS[day.weekday()] in excludes
+                or day.isoformat() in excludes)
+
+    def _add(self, start: datetime, duration: timedelta) -> datetime:
+        # Excluded days do not count towards a duration in days
+        if not self.gantt.excludes or duration < timedelta(days=1) or duration.seconds:
+            return start + duration
+        end, remaining = start, duration.days
+        for _ in range(duration.days * 7 + 7):
+            if remaining <= 0:
+                break
+            if not self._excluded(end.date()):
+                remaining -= 1
+            end += timedelta(days=1)
+        return end
+
+    def _schedule(self) -> None:
+        by_id = {task.id: task for task in self.gantt.tasks if task.id}
+        explicit = [self._date(item) for _, items in self._pending for item in items[:1] if self._date(item)]
+        # Like Mermaid, a chart without any dates starts today
+        origin = min(explicit) if explicit else datetime.combine(date.today(), datetime.min.time())
+        previous_end = origin
+        for task, items in self._pending:
+            start_text, end_text = (items[0], items[1]) if len(items) >= 2 else (None, items[0] if items else '')
+            start = None
+            if start_text and start_text.startswith('after '):
+                ends = [by_id[name].end for name in start_text[6:].split() if name in by_id and by_id[name].end]
+                start = max(ends) if ends else None
+            elif start_text:
+                start = self._date(start_text)
+            task.start = start or previous_end
+
+            duration = DURATION.match(end_text)
+            if duration:
+                task.end = self._add(task.start, float(duration.group(1)) * DURATION_UNITS[duration.group(2)])
+            elif end_text.startswith('until '):
+                starts = [by_id[name].start for name in end_text[6:].split() if name in by_id and by_id[name].start]
+                task.end = min(starts) if starts else task.start
+            else:
+                task.end = self._date(end_text) or task.start + timedelta(days=1)
+            if task.end < task.start:
+                task.end = task.start
+            previous_end = task.end
+
+
+def _ticks(start: datetime, end: datetime, interval: Optional[timedelta]) -> List[datetime]:
+    span = end - start
+    if interval is None:
+        interval = next((candidate for candidate in AUTO_TICKS if span / candidate <= MAX_TICKS), AUTO_TICKS[-1])
+    if interval >= timedelta(days=1):
+        tick = datetime.combine(start.date(), datetime.min.time())
+    else:
+        tick = start.replace(minute=0, second=0, microsecond=0)
+    ticks = []
+    while tick <= end and len(ticks) < 200:
+        if tick >= start:
+            ticks.append(tick)
+        tick += interval
+    return ticks
+
+
+def render_gantt(lines: List[str]) -> str:
+    """
+    Renders the lines of a gantt chart (after any front matter) as SVG.
+    """
+    gantt = GanttParser().parse(lines)
+    svg = SvgDocument()
+    label_width = max((text_width(section) for section in gantt.sections), default=0) + 20
+    top = TITLE_HEIGHT if gantt.title else 10
+    if gantt.title:
+        svg.text(label_width + CHART_WIDTH / 2, TITLE_HEIGHT / 2, gantt.title, class_='title')
+
+    tasks = gantt.tasks
+    start = min((task.start for task in tasks), default=datetime.combine(date.today(), datetime.min.time()))
+    end = max((task.end for task in tasks), default=start + timedelta(days=1))
+    if end <= start:
+        end = start + timedelta(days=1)
+    scale = CHART_WIDTH / (end - start).total_seconds()
+
+    def x_of(moment: datetime) -> float:
+        return label_width + (moment - start).total_seconds() * scale
+
+    # Section bands with their names, then the grid, then the bars
+    bottom = top + len(tasks) * ROW_HEIGHT
+    for section_index, section in enumerate(gantt.sections):
+        rows = [index for index, task in enumerate(tasks) if task.section == section_index]
+        if not rows:
+            continue
+        band_top = top + rows[0] * ROW_HEIGHT
+        band_height = len(rows) * ROW_HEIGHT
+        svg.rect(0, band_top, label_width + CHART_WIDTH, band_height,
+                 class_='section alt' if section_index % 2 else 'section')
+        if any(section):
+            svg.text(8, band_top + band_height / 2, section, anchor='start')
+
+    for tick in _ticks(start, end, gantt.tick_interval):
+        x = x_of(tick)
+        svg.line([(x, top), (x, bottom)], class_='grid')
+        svg.text(x, bottom + AXIS_HEIGHT / 2, [tick.strftime(gantt.axis_format)])
+
+    for index, task in enumerate(tasks):
+        y = top + index * ROW_HEIGHT + (ROW_HEIGHT - BAR_HEIGHT) / 2
+        classes = ' '.join(['task'] + [tag for tag in task.tags if tag != 'milestone'])
+        left = x_of(task.start)
+        if 'milestone' in task.tags:
+            size = BAR_HEIGHT / 2
+            svg.polygon([(left, y), (left + size, y + size), (left, y + BAR_HEIGHT), (left - size, y + size)],
+                        class_=classes)
+            svg.text(left + size + 4, y + BAR_HEIGHT / 2, task.name, anchor='start')
+            continue
+        width = max(x_of(task.end) - left, 1)
+        svg.rect(left, y, width, BAR_HEIGHT, class_=classes, rx=3)
+        if text_width(task.name) + 10 <= width and len(task.name) == 1:
+            svg.text(left + width / 2, y + BAR_HEIGHT / 2, task.name)
+        else:
+            svg.text(left + width + 5, y + BAR_HEIGHT / 2 + (len(task.name) - 1) * LINE_HEIGHT / 2, task.name,
+                     anchor='start')
+    return svg.render()
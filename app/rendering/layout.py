@@ -0,0 +1,329 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from app.rendering.svg import Point, text_height, text_width
+
+ORDERING_SWEEPS = 8
+POSITIONING_PASSES = 4
+
+
+@dataclass
+class LayoutNode:
+    """
+    A node placed by the layout. `x` and `y` are its center.
+    """
+    id: str
+    width: float
+    height: float
+    shape: str = 'box'
+    x: float = 0.0
+    y: float = 0.0
+    rank: int = 0
+    dummy: bool = False
+
+
+@dataclass
+class Layout:
+    """
+    The result of `layered_layout`: the placed nodes and, for every edge in the order
+    given, the points of its polyline from source to target.
+    """
+    nodes: Dict[str, LayoutNode]
+    edges: List[List[Point]] = field(default_factory=list)
+
+
+def _reverse_cycles(nodes: Sequence[str], edges: Sequence[Tuple[str, str]]) -> Set[int]:
+    # Edges that close a cycle in a depth-first search are reversed, which makes the graph
+    # acyclic; the search starts from the nodes in the order they were declared
+    outgoing: Dict[str, List[Tuple[int, str]]] = {node: [] for node in nodes}
+    for index, (source, target) in enumerate(edges):
+        outgoing[source].append((index, target))
+    state: Dict[str, int] = {}
+    reversed_edges: Set[int] = set()
+    for root in nodes:
+        if root in state:
+            continue
+        stack = [(root, iter(outgoing[root]))]
+        state[root] = 1
+        while stack:
+            node, children = stack[-1]
+            for index, child in children:
+                if state.get(child) == 1:
+                    reversed_edges.add(index)
+                elif child not in state:
+                    state[child] = 1
+                    stack.append((child, iter(outgoing[child])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+    return reversed_edges
+
+
+def _assign_ranks(nodes: Sequence[str], edges: Sequence[Tuple[str, str]]) -> Dict[str, int]:
+    # Longest path from the sources, in topological order
+    incoming = {node: 0 for node in nodes}
+    outgoing: Dict[str, List[str]] = {node: [] for node in nodes}
+    for source, target in edges:
+        outgoing[source].append(target)
+        incoming[target] += 1
+    ranks = {node: 0 for node in nodes}
+    queue = [node for node in nodes if incoming[node] == 0]
+    while queue:
+        node = queue.pop(0)
+        for target in outgoing[node]:
+            ranks[target] = max(ranks[target], ranks[node] + 1)
+            incoming[target] -= 1
+            if incoming[target] == 0:
+                queue.append(target)
+    return ranks
+
+
+def _crossings(layers: List[List[str]], down: Dict[str, List[str]]) -> int:
+    count = 0
+    for upper, lower in zip(layers, layers[1:]):
+        position = {node: index for index, node in enumerate(lower)}
+        pairs = [(index, position[target]) for index, node in enumerate(upper) for target in down[node]
+                 if target in position]
+        for i, (a_upper, a_lower) in enumerate(pairs):
+            for b_upper, b_lower in pairs[i + 1:]:
+                if (a_upper - b_upper) * (a_lower - b_lower) < 0:
+                    count += 1
+    return count
+
+
+def _order_layers(layers: List[List[str]], down: Dict[str, List[str]], up: Dict[str, List[str]]) -> List[List[str]]:
+    # Barycenter heuristic: alternately sweeps down and up, sorting every layer by the
+    # average position of the neighbours in the layer before, and keeps the best order
+    best = [list(layer) for layer in layers]
+    best_crossings = _crossings(best, down)
+    current = [list(layer) for layer in layers]
+    for sweep in range(ORDERING_SWEEPS):
+        downward = sweep % 2 == 0
+        indices = range(1, len(current)) if downward else range(len(current) - 2, -1, -1)
+        for index in indices:
+            fixed = current[index - 1] if downward else current[index + 1]
+            neighbours = up if downward else down
+            position = {node: i for i, node in enumerate(fixed)}
+            layer = current[index]
+
+            def barycenter(node: str, current_index: int) -> float:
+                positions = [position[other] for other in neighbours[node] if other in position]
+                return sum(positions) / len(positions) if positions else current_index
+
+            current[index] = [node for _, node in sorted(
+                ((barycenter(node, i), i), node) for i, node in enumerate(layer))]
+        crossings = _crossings(current, down)
+        if crossings < best_crossings:
+            best, best_crossings = [list(layer) for layer in current], crossings
+    return best
+
+
+def _place_layer(layer: List[LayoutNode], desired: List[float], gap: float) -> None:
+    # Moves the nodes as close to their desired positions as the gaps between them allow
+    for node, x in zip(layer, desired):
+        node.x = x
+    for left, right in zip(layer, layer[1:]):
+        minimum = left.x + (left.width + right.width) / 2 + gap
+        if right.x < minimum:
+            right.x = minimum
+    for right, left in zip(reversed(layer), list(reversed(layer))[1:]):
+        maximum = right.x - (left.width + right.width) / 2 - gap
+        if left.x > maximum:
+            left.x = maximum
+
+
+def layered_layout(nodes: Sequence[Tuple[str, float, float, str]], edges: Sequence[Tuple[str, str]],
+                   direction: str = 'TB', rank_gap: float = 50, node_gap: float = 30,
+                   groups: Optional[Dict[str, int]] = None) -> Layout:
+    """
+    Places a directed graph in layers, like Mermaid's dagre layout: cycles are broken,
+    nodes are ranked by their longest path from a source, long edges are routed through
+    dummy nodes, layers are ordered to reduce crossings and nodes are centered over their
+    neighbours.
+
+    Args:
+        nodes (Sequence[Tuple[str, float, float, str]]): The id, width, height and shape
+            (`box`, `ellipse` or `diamond`) of every node, in declaration order.
+        edges (Sequence[Tuple[str, str]]): The source and target of every edge.
+        direction (str): `TB`/`TD`, `BT`, `LR` or `RL`.
+        rank_gap (float): The space between layers.
+        node_gap (float): The space between nodes of a layer.
+        groups (Optional[Dict[str, int]]): A group (e.g. subgraph) number per node; nodes
+            of a group start out next to each other in their layer.
+
+    Returns:
+        Layout: The placed nodes, with coordinates from 0, and the edge polylines.
+    """
+    horizontal = direction in ('LR', 'RL')
+    placed: Dict[str, LayoutNode] = {}
+    for node_id, width, height, shape in nodes:
+        # Horizontal layouts are computed top to bottom with the sizes swapped
+        placed[node_id] = LayoutNode(node_id, height if horizontal else width, width if horizontal else height, shape)
+    order = list(placed)
+
+    graph_edges = [(source, target) for source, target in edges if source != target]
+    reversed_edges = _reverse_cycles(order, graph_edges)
+    acyclic = [(target, source) if index in reversed_edges else (source, target)
+               for index, (source, target) in enumerate(graph_edges)]
+    ranks = _assign_ranks(order, acyclic)
+    for node_id, rank in ranks.items():
+        placed[node_id].rank = rank
+
+    # Edges spanning several layers go through a dummy node in every layer in between
+    down: Dict[str, List[str]] = {node_id: [] for node_id in placed}
+    up: Dict[str, List[str]] = {node_id: [] for node_id in placed}
+    chains: List[List[str]] = []
+    for index, (source, target) in enumerate(acyclic):
+        chain = [source]
+        for rank in range(ranks[source] + 1, ranks[target]):
+            dummy = f"\0{index}:{rank}"
+            placed[dummy] = LayoutNode(dummy, 0, 0, dummy=True, rank=rank)
+            down[dummy], up[dummy] = [], []
+            chain.append(dummy)
+        chain.append(target)
+        for upper, lower in zip(chain, chain[1:]):
+            down[upper].append(lower)
+            up[lower].append(upper)
+        chains.append(chain)
+
+    layer_count = max((node.rank for node in placed.values()), default=-1) + 1
+    declared = {node_id: index for index, node_id in enumerate(placed)}
+    layers: List[List[str]] = [[] for _ in range(layer_count)]
+    for node_id in sorted(placed, key=lambda node_id: ((groups or {}).get(node_id, -1), declared[node_id])):
+        layers[placed[node_id].rank].append(node_id)
+    layers = _order_layers(layers, down, up)
+
+    # Layers top to bottom, nodes of a layer left to right, then centered over their
+    # neighbours in a few passes down and up
+    y = 0.0
+    for layer in layers:
+        height = max((placed[node_id].height for node_id in layer), default=0)
+        for node_id in layer:
+            placed[node_id].y = y + height / 2
+        y += height + rank_gap
+    for layer in layers:
+        x = 0.0
+        for node_id in layer:
+            node = placed[node_id]
+            node.x = x + node.width / 2
+            x += node.width + node_gap
+    for iteration in range(POSITIONING_PASSES):
+        downward = iteration % 2 == 0
+        sequence = layers[1:] if downward else list(reversed(layers[:-1]))
+        neighbours = up if downward else down
+        for layer in sequence:
+            nodes_of_layer = [placed[node_id] for node_id in layer]
+            desired = []
+            for node in nodes_of_layer:
+                xs = [placed[other].x for other in neighbours[node.id]]
+                desired.append(sum(xs) / len(xs) if xs else node.x)
+            _place_layer(nodes_of_layer, desired, node_gap)
+
+    min_x = min((node.x - node.width / 2 for node in placed.values()), default=0)
+    for node in placed.values():
+        node.x -= min_x
+    total_height = max(y - rank_gap, 0)
+    for node in placed.values():
+        if direction == 'BT' or direction == 'RL':
+            node.y = total_height - node.y
+        if horizontal:
+            node.x, node.y = node.y, node.x
+            node.width, node.height = node.height, node.width
+
+    layout = Layout({node_id: node for node_id, node in placed.items() if not node.dummy})
+    graph_index = 0
+    for source, target in edges:
+        if source == target:
+            layout.edges.append(_self_loop(placed[source]))
+            continue
+        chain = chains[graph_index]
+        points = [(placed[node_id].x, placed[node_id].y) for node_id in chain]
+        points[0] = clip(placed[chain[0]], points[1])
+        points[-1] = clip(placed[chain[-1]], points[-2])
+        if graph_index in reversed_edges:
+            points.reverse()
+        layout.edges.append(points)
+        graph_index += 1
+    return layout
+
+
+def _self_loop(node: LayoutNode) -> List[Point]:
+    right = node.x + node.width / 2
+    top, bottom = node.y - node.height / 4, node.y + node.height / 4
+    return [(right, top), (right + 20, top), (right + 20, bottom), (right, bottom)]
+
+
+def clip(node: LayoutNode, towards: Point) -> Point:
+    """
+    The point where the line from the center of a node towards a point leaves the node's
+    outline.
+    """
+    dx, dy = towards[0] - node.x, towards[1] - node.y
+    if dx == 0 and dy == 0:
+        return node.x, node.y
+    half_width, half_height = node.width / 2, node.height / 2
+    if node.shape == 'ellipse':
+        scale = 1 / ((dx / half_width) ** 2 + (dy / half_height) ** 2) ** 0.5 if half_width and half_height else 0
+    elif node.shape == 'diamond':
+        scale = 1 / (abs(dx) / half_width + abs(dy) / half_height) if half_width and half_height else 0
+    else:
+        scale = min(half_width / abs(dx) if dx else float('inf'), half_height / abs(dy) if dy else float('inf'))
+    return node.x + dx * scale, node.y + dy * scale
+
+
+def nesting_depth(clusters: Sequence, index: int) -> int:
+    """How many clusters the cluster at `index` is nested in."""
+    depth = 0
+    while clusters[index].parent is not None:
+        index = clusters[index].parent
+        depth += 1
+    return depth
+
+
+def cluster_boxes(clusters: Sequence, layout: Layout, padding: float) -> Dict[int, Tuple[float, float, float, float]]:
+    """
+    Returns the box (left, top, right, bottom) around the nodes of every cluster that has
+    any, including the clusters nested in it, with room for its title above them.
+
+    Args:
+        clusters (Sequence): Clusters with a `title` (list of lines), the ids of their
+            `nodes` and the index of their `parent` cluster, or None.
+        layout (Layout): The placed nodes.
+        padding (float): The space between a box and what it contains.
+    """
+    boxes: Dict[int, Tuple[float, float, float, float]] = {}
+    # Innermost clusters first, so nested boxes are known when their parent is computed
+    for index in sorted(range(len(clusters)), key=lambda index: -nesting_depth(clusters, index)):
+        cluster = clusters[index]
+        contents = [(node.x - node.width / 2, node.y - node.height / 2, node.x + node.width / 2, node.y + node.height / 2)
+                    for node in (layout.nodes[node_id] for node_id in cluster.nodes if node_id in layout.nodes)]
+        contents += [box for child, box in boxes.items() if clusters[child].parent == index]
+        if not contents:
+            continue
+        left = min(box[0] for box in contents) - padding
+        title_height = text_height(cluster.title) if any(cluster.title) else 0
+        boxes[index] = (left, min(box[1] for box in contents) - padding - title_height,
+                        max(max(box[2] for box in contents) + padding, left + text_width(cluster.title) + 2 * padding),
+                        max(box[3] for box in contents) + padding)
+    return boxes
+
+
+def offset_layout(layout: Layout, dx: float, dy: float) -> None:
+    """Moves all nodes and edges of a layout."""
+    for node in layout.nodes.values():
+        node.x += dx
+        node.y += dy
+    layout.edges = [[(x + dx, y + dy) for x, y in points] for points in layout.edges]
+
+
+def midpoint(points: Sequence[Point]) -> Point:
+    """The point halfway along a polyline, where its label goes."""
+    lengths = [((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5 for (x1, y1), (x2, y2) in zip(points, points[1:])]
+    remaining = sum(lengths) / 2
+    for ((x1, y1), (x2, y2)), length in zip(zip(points, points[1:]), lengths):
+        if remaining <= length and length:
+            ratio = remaining / length
+            return x1 + (x2 - x1) * ratio, y1 + (y2 - y1) * ratio
+        remaining -= length
+    return points[0]
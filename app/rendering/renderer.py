@@ -0,0 +1,77 @@
+import re
+from typing import Callable, Dict, List
+
+from app.rendering.class_diagram import render_class
+from app.rendering.flowchart import render_flowchart
+from app.rendering.gantt import render_gantt
+from app.rendering.sequence import render_sequence
+from app.rendering.state import render_state
+
+# The renderer for the keyword a diagram starts with
+RENDERERS: Dict[str, Callable[[List[str]], str]] = {
+    'flowchart': render_flowchart,
+    'graph': render_flowchart,
+    'sequenceDiagram': render_sequence,
+    'stateDiagram': render_state,
+    'stateDiagram-v2': render_state,
+    'classDiagram': render_class,
+    'classDiagram-v2': render_class,
+    'gantt': render_gantt,
+}
+HEADER = re.compile(r'^([\w-]+)')
+
+
+class UnsupportedDiagramError(ValueError):
+    """Raised for Mermaid code of a diagram type that cannot be rendered server-side."""
+
+    def __init__(self, diagram_type: str):
+        super().__init__(f"Rendering {diagram_type or 'empty'} diagrams to SVG is not supported")
+        self.diagram_type = diagram_type
+
+
+def diagram_lines(code: str) -> List[str]:
+    """
+    Returns the lines of Mermaid code from its header on, without the front matter and
+    the comments and directives before the header.
+    """
+    lines = code.replace('\r\n', '\n').split('\n')
+    content = [index for index, line in enumerate(lines) if line.strip()]
+    start = content[0] if content else 0
+    if content and lines[start].strip() == '---':
+        start = next((index + 1 for index in range(start + 1, len(lines)) if lines[index].strip() == '---'),
+                     start + 1)
+    while start < len(lines) and (not lines[start].strip() or lines[start].strip().startswith('%%')):
+        start += 1
+    return lines[start:]
+
+
+def diagram_type(code: str) -> str:
+    """Returns the keyword a diagram starts with, e.g. "flowchart", or "" for empty code."""
+    lines = diagram_lines(code)
+    match = HEADER.match(lines[0].strip()) if lines else None
+    return match.group(1) if match else ''
+
+
+def render_svg(code: str) -> str:
+    """
+    Renders Mermaid code as a standalone SVG document, without a browser.
+
+    Flowcharts, sequence, state, class and gantt diagrams are supported. Nodes are
+    placed by a layered layout and text is measured with average glyph widths, so the
+    result is close to, but not identical with, what Mermaid draws.
+
+    Args:
+        code (str): The Mermaid code, e.g. as returned by `extract_mermaid_code`.
+
+    Returns:
+        str: The SVG document.
+
+    Raises:
+        UnsupportedDiagramError: If the code is empty or of another diagram type.
+    """
+    lines = diagram_lines(code)
+    kind = diagram_type(code)
+    renderer = RENDERERS.get(kind)
+    if renderer is None:
+        raise UnsupportedDiagramError(kind)
+    return renderer(lines)
@@ -0,0 +1,276 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.rendering.svg import LINE_HEIGHT, SvgDocument, label_lines, text_height, text_width
+
+ACTOR_GAP = 50
+ACTOR_MIN_WIDTH = 150
+ACTOR_HEIGHT = 65
+MESSAGE_GAP = 16
+NOTE_PADDING = 10
+FRAME_PADDING = 10
+ACTIVATION_WIDTH = 10
+TOP = 10
+
+PARTICIPANT = re.compile(r'^(?:create\s+)?(participant|actor)\s+(.+?)(?:\s+as\s+(.+))?$', re.IGNORECASE)
+MESSAGE = re.compile(r'^([^\s:]+?)\s*(<<-->>|<<->>|-->>|->>|-->|->|--x|-x|--\)|-\))\s*([+-]?)\s*([^\s:]+)\s*(?::(.*))?$')
+NOTE = re.compile(r'^note\s+(left of|right of|over)\s+([^:]+?)\s*:(.*)$', re.IGNORECASE)
+BLOCK = re.compile(r'^(loop|alt|opt|par|par_over|critical|break|rect|box)\b\s*(.*)$')
+BLOCK_SECTION = re.compile(r'^(else|and|option)\b\s*(.*)$')
+ACTIVATION = re.compile(r'^(activate|deactivate)\s+(\S+)$')
+AUTONUMBER = re.compile(r'^autonumber\b')
+DESTROY = re.compile(r'^destroy\s+(\S+)$')
+
+ARROWS = {
+    # arrow: (dashed, marker at the target, marker at the source)
+    '->': (False, None, None), '-->': (True, None, None),
+    '->>': (False, 'arrow', None), '-->>': (True, 'arrow', None),
+    '-x': (False, 'cross', None), '--x': (True, 'cross', None),
+    '-)': (False, 'open-arrow', None), '--)': (True, 'open-arrow', None),
+    '<<->>': (False, 'arrow', 'arrow'), '<<-->>': (True, 'arrow', 'arrow'),
+}
+
+
+@dataclass
+class Participant:
+    id: str
+    label: List[str]
+    actor: bool = False
+
+
+@dataclass
+class Event:
+    """One row of the diagram: a message, note or block boundary."""
+    kind: str
+    text: List[str] = field(default_factory=list)
+    source: Optional[str] = None
+    target: Optional[str] = None
+    arrow: str = '->>'
+    placement: str = ''
+    block: str = ''
+    y: float = 0.0
+
+
+@dataclass
+class SequenceDiagram:
+    participants: Dict[str, Participant] = field(default_factory=dict)
+    events: List[Event] = field(default_factory=list)
+    autonumber: bool = False
+
+
+def parse_sequence(lines: List[str]) -> SequenceDiagram:
+    """
+    Parses the participants, messages, notes, activations and blocks of a sequence
+    diagram, in order. Statements it does not understand are skipped.
+    """
+    diagram = SequenceDiagram()
+
+    def participant(participant_id: str, label: Optional[str] = None, actor: bool = False) -> None:
+        if participant_id not in diagram.participants:
+            diagram.participants[participant_id] = Participant(participant_id, label_lines(label or participant_id), actor)
+
+    blocks: List[str] = []
+    for line in lines[1:]:
+        text = line.strip()
+        if not text or text.startswith('%%'):
+            continue
+        match = PARTICIPANT.match(text)
+        if match:
+            participant(match.group(2).strip(), match.group(3), match.group(1).lower() == 'actor')
+            continue
+        match = NOTE.match(text)
+        if match:
+            over = [name.strip() for name in match.group(2).split(',')]
+            for name in over:
+                participant(name)
+            diagram.events.append(Event('note', label_lines(match.group(3)), over[0], over[-1],
+                                        placement=match.group(1).lower()))
+            continue
+        match = BLOCK.match(text)
+        if match:
+            blocks.append(match.group(1))
+            # Boxes group participants; they are not drawn
+            if match.group(1) != 'box':
+                diagram.events.append(Event('start', label_lines(match.group(2)), block=match.group(1)))
+            continue
+        match = BLOCK_SECTION.match(text)
+        if match and blocks:
+            diagram.events.append(Event('section', label_lines(match.group(2)), block=match.group(1)))
+            continue
+        if text == 'end':
+            if blocks and blocks.pop() != 'box':
+                diagram.events.append(Event('end'))
+            continue
+        match = ACTIVATION.match(text)
+        if match:
+            participant(match.group(2))
+            diagram.events.append(Event(match.group(1), source=match.group(2)))
+            continue
+        if AUTONUMBER.match(text):
+            diagram.autonumber = True
+            continue
+        if DESTROY.match(text):
+            continue
+        match = MESSAGE.match(text)
+        if match:
+            source, arrow, activation, target, message = match.groups()
+            participant(source)
+            participant(target)
+            diagram.events.append(Event('message', label_lines(message or ''), source, target, arrow))
+            if activation:
+                diagram.events.append(Event('activate' if activation == '+' else 'deactivate',
+                                            source=target if activation == '+' else source))
+    diagram.events.extend(Event('end') for block in blocks if block != 'box')
+    return diagram
+
+
+def _actor_positions(diagram: SequenceDiagram) -> Dict[str, Tuple[float, float]]:
+    # The center and width of every participant. Neighbours are moved apart until the
+    # messages and notes between them fit
+    ids = list(diagram.participants)
+    index = {participant_id: position for position, participant_id in enumerate(ids)}
+    widths = [max(ACTOR_MIN_WIDTH, text_width(diagram.participants[participant_id].label) + 20) for participant_id in ids]
+    gaps = [ACTOR_GAP] * len(ids)
+    for event in diagram.events:
+        if event.kind != 'message' or event.source == event.target:
+            continue
+        left, right = sorted((index[event.source], index[event.target]))
+        needed = text_width(event.text) + 30
+        available = sum((widths[i] + widths[i + 1]) / 2 + gaps[i] for i in range(left, right))
+        if needed > available:
+            gaps[right - 1] += needed - available
+    positions = {}
+    x = FRAME_PADDING * 2
+    for position, participant_id in enumerate(ids):
+        positions[participant_id] = (x + widths[position] / 2, widths[position])
+        x += widths[position] + gaps[position]
+    return positions
+
+
+def _draw_actor(svg: SvgDocument, participant: Participant, x: float, y: float, width: float) -> None:
+    if participant.actor:
+        # A stick figure with the name below it
+        head_y = y + 10
+        svg.ellipse(x, head_y, 8, 8, class_='node')
+        svg.line([(x, head_y + 8), (x, head_y + 28)], class_='edge')
+        svg.line([(x - 14, head_y + 14), (x + 14, head_y + 14)], class_='edge')
+        svg.line([(x - 12, head_y + 42), (x, head_y + 28), (x + 12, head_y + 42)], class_='edge')
+        svg.text(x, y + ACTOR_HEIGHT - 8, participant.label)
+    else:
+        svg.rect(x - width / 2, y, width, ACTOR_HEIGHT, rx=3)
+        svg.text(x, y + ACTOR_HEIGHT / 2, participant.label)
+
+
+def render_sequence(lines: List[str]) -> str:
+    """
+    Renders the lines of a sequence diagram (after any front matter) as SVG.
+    """
+    diagram = parse_sequence(lines)
+    positions = _actor_positions(diagram)
+    svg = SvgDocument()
+
+    y = TOP + ACTOR_HEIGHT + 20
+    number = 0
+    frames: List[Dict] = []
+    activations: Dict[str, List[float]] = {participant_id: [] for participant_id in positions}
+    activation_boxes: List[Tuple[str, float, float, int]] = []
+    frame_boxes: List[Dict] = []
+    notes: List[Tuple[float, float, float, float, List[str]]] = []
+
+    def x_of(participant_id: str) -> float:
+        return positions[participant_id][0]
+
+    for event in diagram.events:
+        if event.kind == 'message':
+            if diagram.autonumber:
+                number += 1
+                event.text = [f"{number}. {event.text[0]}"] + event.text[1:]
+            text_lines = [line for line in event.text if line] or ['']
+            y += text_height(text_lines) if any(text_lines) else 0
+            event.y = y
+            y += 30 if event.source == event.target else MESSAGE_GAP + 4
+        elif event.kind == 'note':
+            x1, x2 = sorted((x_of(event.source), x_of(event.target)))
+            width = max(text_width(event.text) + 2 * NOTE_PADDING, 100 if event.placement != 'over' else 0)
+            height = text_height(event.text) + 2 * NOTE_PADDING
+            if event.placement == 'over':
+                width = max(width, x2 - x1 + 50)
+                left = (x1 + x2) / 2 - width / 2
+            elif event.placement == 'left of':
+                left = x1 - width - 15
+            else:
+                left = x2 + 15
+            notes.append((left, y, width, height, event.text))
+            y += height + MESSAGE_GAP
+        elif event.kind == 'start':
+            frames.append({"kind": event.block, "label": event.text, "top": y, "sections": []})
+            y += LINE_HEIGHT * max(len(event.text), 1) + 20
+        elif event.kind == 'section' and frames:
+            frames[-1]["sections"].append((y, event.text))
+            y += LINE_HEIGHT * max(len(event.text), 1) + 10
+        elif event.kind == 'end' and frames:
+            frame = frames.pop()
+            frame["bottom"] = y
+            frame["depth"] = len(frames)
+            frame_boxes.append(frame)
+            y += 10
+        elif event.kind == 'activate':
+            activations[event.source].append(y - MESSAGE_GAP)
+        elif event.kind == 'deactivate' and activations[event.source]:
+            start = activations[event.source].pop()
+            activation_boxes.append((event.source, start, y - MESSAGE_GAP, len(activations[event.source])))
+    for participant_id, starts in activations.items():
+        for start in starts:
+            activation_boxes.append((participant_id, start, y, 0))
+    bottom = y + 10
+
+    # Frames span the participants of the diagram, inset by their nesting depth
+    left_edge = min((x - width / 2 for x, width in positions.values()), default=0) - FRAME_PADDING
+    right_edge = max((x + width / 2 for x, width in positions.values()), default=0) + FRAME_PADDING
+    for frame in frame_boxes:
+        inset = frame["depth"] * FRAME_PADDING
+        left, right = left_edge + inset, right_edge - inset
+        top, frame_bottom = frame["top"], frame["bottom"]
+        if frame["kind"] == 'rect':
+            svg.rect(left, top, right - left, frame_bottom - top, class_='frame', style='fill:#eee;opacity:0.5')
+            continue
+        svg.rect(left, top, right - left, frame_bottom - top, class_='frame')
+        tab_width = text_width([frame["kind"]]) + 20
+        svg.polygon([(left, top), (left + tab_width, top), (left + tab_width, top + 12),
+                     (left + tab_width - 8, top + 20), (left, top + 20)], class_='frame-label')
+        svg.text(left + tab_width / 2 - 4, top + 10, [frame["kind"]], class_='bold')
+        if any(frame["label"]):
+            svg.text((left + tab_width + right) / 2, top + 10, [f"[{line}]" for line in frame["label"]])
+        for section_y, label in frame["sections"]:
+            svg.line([(left, section_y), (right, section_y)], class_='divider')
+            if any(label):
+                svg.text((left + right) / 2, section_y + LINE_HEIGHT / 2 + 2, [f"[{line}]" for line in label])
+
+    for participant_id, (x, width) in positions.items():
+        svg.line([(x, TOP + ACTOR_HEIGHT), (x, bottom)], class_='lifeline')
+        _draw_actor(svg, diagram.participants[participant_id], x, TOP, width)
+        _draw_actor(svg, diagram.participants[participant_id], x, bottom, width)
+
+    for participant_id, start, end, depth in activation_boxes:
+        x = x_of(participant_id) - ACTIVATION_WIDTH / 2 + depth * ACTIVATION_WIDTH / 2
+        svg.rect(x, start, ACTIVATION_WIDTH, max(end - start, 10), class_='activation')
+
+    for left, top, width, height, text in notes:
+        svg.rect(left, top, width, height, class_='note')
+        svg.text(left + width / 2, top + height / 2, text)
+
+    for event in diagram.events:
+        if event.kind != 'message':
+            continue
+        dashed, end_marker, start_marker = ARROWS[event.arrow]
+        x1, x2 = x_of(event.source), x_of(event.target)
+        class_ = 'edge dashed' if dashed else 'edge'
+        if event.source == event.target:
+            svg.line([(x1, event.y), (x1 + 40, event.y), (x1 + 40, event.y + 20), (x1, event.y + 20)],
+                     class_=class_, marker_end=end_marker)
+            svg.text(x1 + 45, event.y - LINE_HEIGHT / 2, event.text, anchor='start')
+        else:
+            svg.line([(x1, event.y), (x2, event.y)], class_=class_, marker_start=start_marker, marker_end=end_marker)
+            svg.text((x1 + x2) / 2, event.y - text_height(event.text) / 2 - 2, event.text)
+    return svg.render()
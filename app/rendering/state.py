@@ -0,0 +1,299 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.rendering.flowchart import CLUSTER_PADDING, PADDING_X, PADDING_Y
+from app.rendering.layout import cluster_boxes, layered_layout, midpoint, nesting_depth
+from app.rendering.svg import SvgDocument, css_style, label_lines, text_height, text_style, text_width
+
+START_SIZE = 14
+FORK_SIZE = (70, 8)
+CHOICE_SIZE = 28
+
+STATE = r'(?:\[\*\]|[\w.-]+)'
+TRANSITION = re.compile(rf'^({STATE})(?::::([\w-]+))?\s*-->\s*({STATE})(?::::([\w-]+))?\s*(?::(.*))?$')
+STATE_AS = re.compile(r'^state\s+"([^"]*)"\s+as\s+([\w.-]+)\s*(\{)?$')
+STATE_KIND = re.compile(r'^state\s+([\w.-]+)\s+<<(choice|fork|join)>>$')
+STATE_BLOCK = re.compile(r'^state\s+([\w.-]+)\s*(?:"[^"]*")?\s*\{$')
+STATE_DECLARATION = re.compile(r'^state\s+([\w.-]+)$')
+DESCRIPTION = re.compile(r'^([\w.-]+)\s*:(.*)$')
+NOTE = re.compile(r'^note\s+(left|right)\s+of\s+([\w.-]+)\s*(?::(.*))?$')
+CLASS_SUFFIX = re.compile(r'^([\w.-]+):::([\w-]+)$')
+
+
+@dataclass
+class State:
+    id: str
+    title: List[str]
+    kind: str = 'state'
+    descriptions: List[str] = field(default_factory=list)
+    classes: List[str] = field(default_factory=list)
+    style: str = ''
+
+
+@dataclass
+class Transition:
+    source: str
+    target: str
+    label: List[str]
+    note: bool = False
+
+
+@dataclass
+class Composite:
+    id: str
+    title: List[str]
+    nodes: List[str] = field(default_factory=list)
+    parent: Optional[int] = None
+
+
+@dataclass
+class StateDiagram:
+    direction: str = 'TB'
+    states: Dict[str, State] = field(default_factory=dict)
+    transitions: List[Transition] = field(default_factory=list)
+    composites: List[Composite] = field(default_factory=list)
+    class_styles: Dict[str, str] = field(default_factory=dict)
+
+
+class StateParser:
+    """
+    Parses the states, transitions, composite states, notes and styles of a state
+    diagram. `[*]` is a start or end state of the composite state it appears in.
+    """
+
+    def __init__(self):
+        self.diagram = StateDiagram()
+        self._scopes: List[int] = []
+        self._names: Dict[str, List[str]] = {}
+
+    def parse(self, lines: List[str]) -> StateDiagram:
+        note: Optional[List] = None
+        for line in lines[1:]:
+            text = line.strip()
+            if note is not None:
+                if text == 'end note':
+                    self._note(note[0], note[1])
+                    note = None
+                else:
+                    note[1].append(text)
+                continue
+            if not text or text.startswith('%%'):
+                continue
+            match = NOTE.match(text)
+            if match and match.group(3) is None:
+                note = [match.group(2), []]
+                continue
+            if match:
+                self._note(match.group(2), label_lines(match.group(3)))
+                continue
+            self._statement(text)
+        return self.diagram
+
+    def _scope(self) -> str:
+        return self.diagram.composites[self._scopes[-1]].id if self._scopes else ''
+
+    def _state(self, state_id: str, kind: Optional[str] = None) -> State:
+        state = self.diagram.states.get(state_id)
+        if state is None:
+            state = self.diagram.states[state_id] = State(state_id, self._names.get(state_id, [state_id]))
+            if self._scopes:
+                self.diagram.composites[self._scopes[-1]].nodes.append(state_id)
+        if kind is not None:
+            state.kind = kind
+        return state
+
+    def _pseudo_state(self, end: bool) -> str:
+        kind = 'end' if end else 'start'
+        state_id = f"[*]{kind}:{self._scope()}"
+        self._state(state_id, kind)
+        return state_id
+
+    def _note(self, state_id: str, text: List[str]) -> None:
+        note = self._state(f"note:{len(self.diagram.transitions)}:{state_id}", 'note')
+        note.title = text
+        self._state(state_id)
+        self.diagram.transitions.append(Transition(state_id, note.id, [], note=True))
+
+    def _statement(self, text: str) -> None:
+        match = TRANSITION.match(text)
+        if match:
+            source, source_class, target, target_class, label = match.groups()
+            source = self._pseudo_state(end=False) if source == '[*]' else self._state(source).id
+            target = self._pseudo_state(end=True) if target == '[*]' else self._state(target).id
+            for state_id, name in ((source, source_class), (target, target_class)):
+                if name:
+                    self.diagram.states[state_id].classes.append(name)
+            self.diagram.transitions.append(Transition(source, target, label_lines(label) if label else []))
+            return
+        if text == '}':
+            if self._scopes:
+                self._scopes.pop()
+            return
+        keyword = text.split(None, 1)[0]
+        rest = text[len(keyword):].strip()
+        if keyword == 'direction':
+            self.diagram.direction = rest if rest in ('TB', 'BT', 'LR', 'RL') else 'TB'
+        elif keyword == 'classDef':
+            name, _, definition = rest.partition(' ')
+            self.diagram.class_styles[name] = css_style(definition)
+        elif keyword == 'class':
+            ids, _, name = rest.rpartition(' ')
+            for state_id in ids.split(','):
+                self._state(state_id.strip()).classes.append(name.strip())
+        elif keyword == 'style':
+            state_id, _, definition = rest.partition(' ')
+            self._state(state_id).style = css_style(definition)
+        elif keyword == 'state':
+            self._declaration(text)
+        elif text == '--' or keyword.startswith('acc') or keyword in ('title', 'hide'):
+            return
+        elif CLASS_SUFFIX.match(text):
+            state_id, name = CLASS_SUFFIX.match(text).groups()
+            self._state(state_id).classes.append(name)
+        elif DESCRIPTION.match(text):
+            state_id, description = DESCRIPTION.match(text).groups()
+            self._state(state_id).descriptions.extend(label_lines(description))
+        elif re.match(r'^[\w.-]+$', text):
+            self._state(text)
+
+    def _declaration(self, text: str) -> None:
+        match = STATE_AS.match(text)
+        if match:
+            title, state_id, block = match.groups()
+            self._names[state_id] = label_lines(title)
+            if block:
+                self._open(state_id)
+            else:
+                self._state(state_id).title = self._names[state_id]
+            return
+        match = STATE_KIND.match(text)
+        if match:
+            self._state(match.group(1), match.group(2))
+            return
+        match = STATE_BLOCK.match(text)
+        if match:
+            self._open(match.group(1))
+            return
+        match = STATE_DECLARATION.match(text)
+        if match:
+            self._state(match.group(1))
+
+    def _open(self, state_id: str) -> None:
+        parent = self._scopes[-1] if self._scopes else None
+        self.diagram.composites.append(Composite(state_id, self._names.get(state_id, [state_id]), parent=parent))
+        self._scopes.append(len(self.diagram.composites) - 1)
+
+
+def _resolve_composites(diagram: StateDiagram) -> None:
+    # A transition to or from a composite state goes to its start state or from its end
+    # state; composite states are drawn as boxes around their contents, not as nodes
+    composites = {composite.id: index for index, composite in enumerate(diagram.composites)}
+
+    def members(index: int) -> List[str]:
+        nested = [state for child, other in enumerate(diagram.composites) if other.parent == index
+                  for state in members(child)]
+        return diagram.composites[index].nodes + nested
+
+    def endpoint(state_id: str, end: bool) -> str:
+        while state_id in composites:
+            contents = members(composites[state_id])
+            pseudo = f"[*]{'end' if end else 'start'}:{state_id}"
+            if pseudo in diagram.states:
+                return pseudo
+            candidates = [member for member in contents if member not in composites]
+            if not candidates:
+                return state_id
+            state_id = candidates[-1] if end else candidates[0]
+        return state_id
+
+    for transition in diagram.transitions:
+        transition.source = endpoint(transition.source, end=True)
+        transition.target = endpoint(transition.target, end=False)
+    for composite_id in composites:
+        if composite_id in diagram.states and members(composites[composite_id]):
+            del diagram.states[composite_id]
+            for composite in diagram.composites:
+                if composite_id in composite.nodes:
+                    composite.nodes.remove(composite_id)
+
+
+def _state_size(state: State) -> Tuple[float, float]:
+    if state.kind in ('start', 'end'):
+        return START_SIZE, START_SIZE
+    if state.kind in ('fork', 'join'):
+        return FORK_SIZE
+    if state.kind == 'choice':
+        return CHOICE_SIZE, CHOICE_SIZE
+    lines = state.title + state.descriptions
+    width = max(text_width(lines) + 2 * PADDING_X, 50)
+    height = text_height(lines) + 2 * PADDING_Y + (6 if state.descriptions else 0)
+    return width, height
+
+
+def _draw_state(svg: SvgDocument, state: State, x: float, y: float, width: float, height: float,
+                style: Optional[str]) -> None:
+    left, top = x - width / 2, y - height / 2
+    if state.kind == 'start':
+        svg.ellipse(x, y, width / 2, height / 2, class_='start')
+    elif state.kind == 'end':
+        svg.ellipse(x, y, width / 2, height / 2, class_='end')
+        svg.ellipse(x, y, width / 2 - 3, height / 2 - 3, class_='start')
+    elif state.kind in ('fork', 'join'):
+        svg.rect(left, top, width, height, class_='start', rx=2)
+    elif state.kind == 'choice':
+        svg.polygon([(x, top), (left + width, y), (x, top + height), (left, y)], style=style)
+    elif state.kind == 'note':
+        svg.rect(left, top, width, height, class_='note')
+        svg.text(x, y, state.title)
+    else:
+        svg.rect(left, top, width, height, rx=5, style=style)
+        if state.descriptions:
+            title_bottom = top + PADDING_Y + text_height(state.title) + 3
+            svg.text(x, top + PADDING_Y + text_height(state.title) / 2, state.title, style=text_style(style))
+            svg.line([(left, title_bottom), (left + width, title_bottom)], class_='node')
+            svg.text(x, title_bottom + 3 + text_height(state.descriptions) / 2, state.descriptions,
+                     style=text_style(style))
+        else:
+            svg.text(x, y, state.title, style=text_style(style))
+
+
+def render_state(lines: List[str]) -> str:
+    """
+    Renders the lines of a state diagram (after any front matter) as SVG.
+    """
+    diagram = StateParser().parse(lines)
+    _resolve_composites(diagram)
+    groups = {state_id: index for index, composite in enumerate(diagram.composites) for state_id in composite.nodes}
+    layout = layered_layout(
+        [(state_id, *_state_size(state), 'ellipse' if state.kind in ('start', 'end')
+          else 'diamond' if state.kind == 'choice' else 'box') for state_id, state in diagram.states.items()],
+        [(transition.source, transition.target) for transition in diagram.transitions],
+        diagram.direction, groups=groups)
+
+    svg = SvgDocument()
+    boxes = cluster_boxes(diagram.composites, layout, CLUSTER_PADDING)
+    for index in sorted(boxes, key=lambda index: nesting_depth(diagram.composites, index)):
+        left, top, right, bottom = boxes[index]
+        title = diagram.composites[index].title
+        svg.rect(left, top, right - left, bottom - top, rx=5)
+        svg.line([(left, top + text_height(title) + CLUSTER_PADDING / 2),
+                  (right, top + text_height(title) + CLUSTER_PADDING / 2)], class_='node')
+        svg.text((left + right) / 2, top + CLUSTER_PADDING / 4 + text_height(title) / 2, title)
+
+    for transition, points in zip(diagram.transitions, layout.edges):
+        if len(points) >= 2:
+            svg.line(points, class_='edge dashed' if transition.note else 'edge',
+                     marker_end=None if transition.note else 'arrow')
+    for transition, points in zip(diagram.transitions, layout.edges):
+        if transition.label and any(transition.label) and len(points) >= 2:
+            x, y = midpoint(points)
+            width, height = text_width(transition.label) + 4, text_height(transition.label)
+            svg.rect(x - width / 2, y - height / 2, width, height, class_='edge-label')
+            svg.text(x, y, transition.label)
+
+    for state_id, state in diagram.states.items():
+        placed = layout.nodes[state_id]
+        style = ';'.join(filter(None, [diagram.class_styles.get(name, '') for name in state.classes] + [state.style]))
+        _draw_state(svg, state, placed.x, placed.y, placed.width, placed.height, style or None)
+    return svg.render()
@@ -0,0 +1,198 @@
+import re
+import html
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+Point = Tuple[float, float]
+
+FONT_FAMILY = '"trebuchet ms", verdana, arial, sans-serif'
+FONT_SIZE = 14
+LINE_HEIGHT = 18
+# Average glyph width of the font, in em; there are no font metrics on the server
+CHAR_WIDTH = 0.58
+MARGIN = 8
+
+STYLE = f"""
+text {{ font-family: {FONT_FAMILY}; font-size: {FONT_SIZE}px; fill: #333; }}
+.node {{ fill: #ECECFF; stroke: #9370DB; stroke-width: 1px; }}
+.cluster {{ fill: #ffffde; stroke: #aaaa33; stroke-width: 1px; }}
+.edge {{ fill: none; stroke: #333; stroke-width: 1.5px; }}
+.edge.thick {{ stroke-width: 3.5px; }}
+.edge.dotted, .edge.dashed {{ stroke-dasharray: 3 3; }}
+.edge.invisible {{ stroke: none; }}
+.edge-label {{ fill: #e8e8e8; opacity: 0.8; }}
+.note {{ fill: #fff5ad; stroke: #aaaa33; stroke-width: 1px; }}
+.lifeline {{ stroke: #999; stroke-width: 0.5px; stroke-dasharray: 3 3; }}
+.activation {{ fill: #f4f4f4; stroke: #666; }}
+.frame {{ fill: none; stroke: #9370DB; stroke-width: 1px; }}
+.frame-label {{ fill: #ECECFF; stroke: #9370DB; stroke-width: 1px; }}
+.divider {{ stroke: #9370DB; stroke-width: 1px; stroke-dasharray: 3 3; }}
+.start {{ fill: #333; stroke: #333; }}
+.end {{ fill: #fff; stroke: #333; stroke-width: 1.5px; }}
+.section {{ fill: #eeeeff; opacity: 0.6; }}
+.section.alt {{ fill: #fff; }}
+.task {{ fill: #8a90dd; stroke: #534fbc; }}
+.task.done {{ fill: #d3d3d3; stroke: #808080; }}
+.task.active {{ fill: #bfc7ff; stroke: #534fbc; }}
+.task.crit {{ stroke: #f00; stroke-width: 2px; }}
+.task.crit.done, .task.crit.active {{ fill: #ffcccc; }}
+.grid {{ stroke: #ddd; stroke-width: 1px; }}
+.title {{ font-size: 18px; font-weight: bold; }}
+.bold {{ font-weight: bold; }}
+"""
+
+# Marker ids used by edges. Every document defines all of them
+MARKERS = """
+<marker id="arrow" viewBox="0 0 10 10" refX="9" refY="5" markerWidth="8" markerHeight="8" orient="auto-start-reverse"><path d="M0,0 L10,5 L0,10 z" fill="#333"/></marker>
+<marker id="open-arrow" viewBox="0 0 10 10" refX="9" refY="5" markerWidth="8" markerHeight="8" orient="auto-start-reverse"><path d="M0,0 L10,5 L0,10" fill="none" stroke="#333"/></marker>
+<marker id="circle" viewBox="0 0 10 10" refX="9" refY="5" markerWidth="8" markerHeight="8" orient="auto-start-reverse"><circle cx="5" cy="5" r="4" fill="#333"/></marker>
+<marker id="cross" viewBox="0 0 10 10" refX="9" refY="5" markerWidth="8" markerHeight="8" orient="auto-start-reverse"><path d="M1,1 L9,9 M1,9 L9,1" stroke="#333" stroke-width="2"/></marker>
+<marker id="triangle" viewBox="0 0 20 20" refX="19" refY="10" markerWidth="14" markerHeight="14" orient="auto-start-reverse"><path d="M1,1 L19,10 L1,19 z" fill="#fff" stroke="#333"/></marker>
+<marker id="diamond" viewBox="0 0 20 10" refX="19" refY="5" markerWidth="16" markerHeight="8" orient="auto-start-reverse"><path d="M1,5 L10,1 L19,5 L10,9 z" fill="#333" stroke="#333"/></marker>
+<marker id="hollow-diamond" viewBox="0 0 20 10" refX="19" refY="5" markerWidth="16" markerHeight="8" orient="auto-start-reverse"><path d="M1,5 L10,1 L19,5 L10,9 z" fill="#fff" stroke="#333"/></marker>
+"""
+
+BREAK = re.compile(r'<br\s*/?>', re.IGNORECASE)
+ENTITY = re.compile(r'#(\w+);')
+STYLE_VALUE = re.compile(r'^[#\w\s.,%()-]*$')
+STYLE_PROPERTIES = {'fill', 'stroke', 'stroke-width', 'stroke-dasharray', 'color', 'font-weight', 'font-style',
+                    'font-size', 'opacity'}
+
+
+def _entity(match: re.Match) -> str:
+    name = match.group(1)
+    if name.isdigit():
+        return chr(int(name))
+    return html.unescape(f"&{name};")
+
+
+def label_lines(text: str) -> List[str]:
+    """
+    Splits a Mermaid label into its lines: quotes and the backticks of markdown strings
+    are removed, `<br>` tags and newlines break lines and `#name;` entities are decoded.
+    """
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        text = text[1:-1]
+    if len(text) >= 2 and text[0] == text[-1] == '`':
+        text = text[1:-1].replace('**', '').replace('__', '')
+    text = ENTITY.sub(_entity, BREAK.sub('\n', text))
+    return [line.strip() for line in text.split('\n')] or ['']
+
+
+def text_width(lines: Iterable[str], size: float = FONT_SIZE) -> float:
+    """An estimate of the width of the widest line, in pixels."""
+    return max((len(line) * size * CHAR_WIDTH for line in lines), default=0.0)
+
+
+def text_height(lines: Sequence[str]) -> float:
+    return max(len(lines), 1) * LINE_HEIGHT
+
+
+def css_style(definition: str) -> str:
+    """
+    Turns the properties of a Mermaid `style` or `classDef` statement, like
+    `fill:#f9f,stroke:#333`, into an SVG style attribute. Unknown properties and values
+    with unexpected characters are dropped.
+    """
+    declarations = []
+    for declaration in definition.split(','):
+        name, _, value = declaration.partition(':')
+        name, value = name.strip().lower(), value.strip()
+        if name in STYLE_PROPERTIES and value and STYLE_VALUE.match(value):
+            declarations.append(f"{name}:{value}")
+    return ';'.join(declarations)
+
+
+def text_style(style: Optional[str]) -> Optional[str]:
+    """The style of the label of a shape styled with `style`: its `color` as text fill."""
+    for declaration in (style or '').split(';'):
+        name, _, value = declaration.partition(':')
+        if name == 'color':
+            return f"fill:{value}"
+    return None
+
+
+def _number(value: float) -> str:
+    return f"{value:.1f}".rstrip('0').rstrip('.')
+
+
+def _attributes(attributes: Dict[str, Optional[str]]) -> str:
+    return ''.join(f' {name.rstrip("_").replace("_", "-")}="{html.escape(str(value))}"'
+                   for name, value in attributes.items() if value not in (None, ''))
+
+
+class SvgDocument:
+    """
+    Collects the elements of an SVG drawing and tracks its extent. Coordinates are in
+    pixels; the document is sized to fit its elements.
+    """
+
+    def __init__(self):
+        self.elements: List[str] = []
+        self.min_x = self.min_y = float('inf')
+        self.max_x = self.max_y = float('-inf')
+
+    def _extend(self, x: float, y: float) -> None:
+        self.min_x, self.min_y = min(self.min_x, x), min(self.min_y, y)
+        self.max_x, self.max_y = max(self.max_x, x), max(self.max_y, y)
+
+    def rect(self, x: float, y: float, width: float, height: float, class_: str = 'node', rx: float = 0,
+             style: Optional[str] = None) -> None:
+        self._extend(x, y)
+        self._extend(x + width, y + height)
+        self.elements.append(f'<rect x="{_number(x)}" y="{_number(y)}" width="{_number(width)}" '
+                             f'height="{_number(height)}"{_attributes({"rx": _number(rx) if rx else None})}'
+                             f'{_attributes({"class": class_, "style": style})}/>')
+
+    def ellipse(self, cx: float, cy: float, rx: float, ry: float, class_: str = 'node',
+                style: Optional[str] = None) -> None:
+        self._extend(cx - rx, cy - ry)
+        self._extend(cx + rx, cy + ry)
+        self.elements.append(f'<ellipse cx="{_number(cx)}" cy="{_number(cy)}" rx="{_number(rx)}" ry="{_number(ry)}"'
+                             f'{_attributes({"class": class_, "style": style})}/>')
+
+    def polygon(self, points: Sequence[Point], class_: str = 'node', style: Optional[str] = None) -> None:
+        for x, y in points:
+            self._extend(x, y)
+        coordinates = ' '.join(f"{_number(x)},{_number(y)}" for x, y in points)
+        self.elements.append(f'<polygon points="{coordinates}"{_attributes({"class": class_, "style": style})}/>')
+
+    def path(self, d: str, bounds: Tuple[Point, Point], class_: str = 'node', style: Optional[str] = None) -> None:
+        """A path with the drawing commands `d`, within the corners `bounds`."""
+        for x, y in bounds:
+            self._extend(x, y)
+        self.elements.append(f'<path d="{d}"{_attributes({"class": class_, "style": style})}/>')
+
+    def line(self, points: Sequence[Point], class_: str = 'edge', marker_start: Optional[str] = None,
+             marker_end: Optional[str] = None, style: Optional[str] = None) -> None:
+        """A polyline through the points, with optional markers at its ends."""
+        for x, y in points:
+            self._extend(x, y)
+        d = ' '.join(f"{'M' if index == 0 else 'L'}{_number(x)},{_number(y)}" for index, (x, y) in enumerate(points))
+        self.elements.append(f'<path d="{d}"' + _attributes({
+            "class": class_, "style": style,
+            "marker_start": f"url(#{marker_start})" if marker_start else None,
+            "marker_end": f"url(#{marker_end})" if marker_end else None,
+        }) + '/>')
+
+    def text(self, x: float, y: float, lines: Sequence[str], anchor: str = 'middle', class_: Optional[str] = None,
+             style: Optional[str] = None) -> None:
+        """Text lines centered vertically on `y`."""
+        width = text_width(lines)
+        left = x - width / 2 if anchor == 'middle' else x - width if anchor == 'end' else x
+        self._extend(left, y - text_height(lines) / 2)
+        self._extend(left + width, y + text_height(lines) / 2)
+        first = y - (len(lines) - 1) * LINE_HEIGHT / 2
+        spans = ''.join(f'<tspan x="{_number(x)}" y="{_number(first + index * LINE_HEIGHT)}">{html.escape(line)}</tspan>'
+                        for index, line in enumerate(lines))
+        self.elements.append(f'<text text-anchor="{anchor}" dominant-baseline="central"'
+                             f'{_attributes({"class": class_, "style": style})}>{spans}</text>')
+
+    def render(self) -> str:
+        if not self.elements:
+            self._extend(0, 0)
+        left, top = min(self.min_x, 0) - MARGIN, min(self.min_y, 0) - MARGIN
+        width, height = self.max_x + MARGIN - left, self.max_y + MARGIN - top
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{_number(width)}" height="{_number(height)}" '
+                f'viewBox="{_number(left)} {_number(top)} {_number(width)} {_number(height)}" role="img">'
+                f'<style>{STYLE}</style><defs>{MARKERS}</defs>{"".join(self.elements)}</svg>')
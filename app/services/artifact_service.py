@@ -0,0 +1,198 @@
+import os
+import re
+import gzip
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_ID = re.compile(r'^[0-9a-f]{64}$')
+# The representations of an artifact: the Mermaid code and, once rendered, its SVG
+KINDS = ('mmd', 'svg')
+
+
+def artifact_id(code: str) -> str:
+    """The id of the artifact of Mermaid code: the hex SHA-256 digest of the code."""
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+class ArtifactStore:
+    """
+    Content-addressed store of finished diagrams on local disk.
+
+    An artifact is the Mermaid code of a diagram, stored under the hash of the code, and
+    optionally its SVG. Every file is stored together with a gzip-compressed copy, so
+    serving it costs no compression. Files are never modified, only added and removed.
+
+    When the files of all artifacts exceed `max_bytes`, the least recently used
+    artifacts are removed. Recency is tracked per process and starts out as the order
+    the artifacts were stored in.
+
+    Args:
+        directory (str): The directory of the files, created on the first write.
+        max_bytes (int): The maximum total size of the files.
+        enabled (bool): Whether artifacts are stored and served at all.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, enabled: bool = True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # Total file size per artifact, least recently used first
+        self._sizes: 'OrderedDict[str, int]' = OrderedDict()
+        self._bytes = 0
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, directory: Optional[str] = None, max_bytes: Optional[int] = None,
+                  enabled: Optional[bool] = None) -> None:
+        """Replaces the store settings; the directory is scanned again on the next use."""
+        with self._lock:
+            self.directory = directory or self.directory
+            self.max_bytes = max_bytes or self.max_bytes
+            if enabled is not None:
+                self.enabled = enabled
+            self._sizes.clear()
+            self._bytes = 0
+            self._loaded = False
+
+    def path(self, artifact: str, kind: str, compressed: bool = False) -> str:
+        return os.path.join(self.directory, artifact[:2], f"{artifact}.{kind}{'.gz' if compressed else ''}")
+
+    def exists(self, artifact: str, kind: str) -> bool:
+        return os.path.exists(self.path(artifact, kind))
+
+    def put(self, code: str, svg: Optional[str] = None) -> str:
+        """
+        Stores the Mermaid code of a diagram and, if given, its SVG. Representations that
+        are already stored are not written again.
+
+        Returns:
+            str: The id of the artifact.
+        """
+        artifact = artifact_id(code)
+        with self._lock:
+            self._load()
+            written = 0
+            for kind, text in (('mmd', code), ('svg', svg)):
+                if text is not None and not os.path.exists(self.path(artifact, kind)):
+                    written += self._write(artifact, kind, text.encode())
+            self._bytes += written
+            self._sizes[artifact] = self._sizes.get(artifact, 0) + written
+            self._sizes.move_to_end(artifact)
+            self._evict(keep=artifact)
+        return artifact
+
+    def get(self, artifact: str, kind: str, compressed: bool = False) -> Optional[bytes]:
+        """
+        Returns a stored representation of an artifact, or None if it is not stored.
+
+        Args:
+            artifact (str): The id of the artifact.
+            kind (str): "mmd" for the Mermaid code, "svg" for the SVG.
+            compressed (bool): Whether to return the gzip-compressed copy.
+        """
+        try:
+            with open(self.path(artifact, kind, compressed), 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if artifact in self._sizes:
+                self._sizes.move_to_end(artifact)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "artifacts": len(self._sizes),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _write(self, artifact: str, kind: str, data: bytes) -> int:
+        # Written to a temporary file first, so a concurrent reader never sees a partial file
+        path = self.path(artifact, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        written = 0
+        for target, content in ((f"{path}.gz", gzip.compress(data, compresslevel=9, mtime=0)), (path, data)):
+            temporary = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, 'wb') as file:
+                file.write(content)
+            os.replace(temporary, target)
+            written += len(content)
+        return written
+
+    def _load(self) -> None:
+        # The artifacts already on disk, e.g. of an earlier run, ordered by their age
+        if self._loaded:
+            return
+        self._loaded = True
+        sizes: Dict[str, int] = {}
+        modified: Dict[str, float] = {}
+        if os.path.isdir(self.directory):
+            for folder in os.scandir(self.directory):
+                if not folder.is_dir():
+                    continue
+                for entry in os.scandir(folder.path):
+                    artifact = entry.name.split('.', 1)[0]
+                    if not ARTIFACT_ID.match(artifact) or entry.name.endswith('.tmp'):
+                        continue
+                    stat = entry.stat()
+                    sizes[artifact] = sizes.get(artifact, 0) + stat.st_size
+                    modified[artifact] = max(modified.get(artifact, 0.0), stat.st_mtime)
+        for artifact in sorted(sizes, key=modified.get):
+            self._sizes[artifact] = sizes[artifact]
+        self._bytes = sum(sizes.values())
+
+    def _evict(self, keep: str) -> None:
+        while self._bytes > self.max_bytes and self._sizes:
+            artifact = next(iter(self._sizes))
+            if artifact == keep:
+                break
+            self._bytes -= self._sizes.pop(artifact)
+            self.evictions += 1
+            for kind in KINDS:
+                for compressed in (False, True):
+                    try:
+                        os.remove(self.path(artifact, kind, compressed))
+                    except FileNotFoundError:
+                        pass
+
+
+artifact_store = ArtifactStore(directory=settings.ARTIFACTS_DIR,
+                               max_bytes=settings.ARTIFACTS_MAX_BYTES,
+                               enabled=settings.ARTIFACTS_ENABLED)
+
+
+async def store_artifact(code: str, svg: Optional[str] = None) -> Optional[str]:
+    """
+    Stores a finished diagram off the event loop. Failing to store it does not fail the
+    request it was generated for.
+
+    Returns:
+        Optional[str]: The id of the artifact, or None if it was not stored.
+    """
+    if not artifact_store.enabled or not code:
+        return None
+    try:
+        return await asyncio.to_thread(artifact_store.put, code, svg)
+    except OSError as e:
+        logger.error("Error storing diagram: %s", e)
+        return None
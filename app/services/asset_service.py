@@ -0,0 +1,226 @@
+"""
+Fingerprinted, pre-compressed static assets.
+
+Every file under `app/static` is copied to `ASSETS_DIR` under a name containing the hash
+of its content, e.g. `js/main.3f2a9c41d07b.js`, together with a gzip-compressed copy.
+Templates link to these copies with `asset_url`, so they can be cached forever: a changed
+file gets a new URL.
+
+Third-party libraries are vendored into `app/static/vendor`, with their licenses, once with
+
+    python -m app.services.asset_service vendor
+
+and committed, so the page loads them from the app rather than a CDN. The build fails while a
+library is missing, unless `ASSETS_CDN_FALLBACK` is set to link it on its CDN instead.
+`python -m app.services.asset_service build` builds the assets ahead of a deployment;
+otherwise they are built when the app starts.
+"""
+import os
+import sys
+import gzip
+import json
+import hashlib
+import logging
+import argparse
+import mimetypes
+import threading
+import urllib.request
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static')
+URL_PREFIX = '/assets'
+
+# The pinned third-party libraries of the UI, by their path under app/static
+VENDORED = {
+    'vendor/axios-0.21.1.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/axios/0.21.1/axios.min.js',
+    'vendor/mermaid-10.9.1.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/mermaid/10.9.1/mermaid.min.js',
+}
+VENDORED_LICENSES = {
+    'vendor/axios-0.21.1.LICENSE.txt': 'https://raw.githubusercontent.com/axios/axios/v0.21.1/LICENSE',
+    'vendor/mermaid-10.9.1.LICENSE.txt': 'https://raw.githubusercontent.com/mermaid-js/mermaid/v10.9.1/LICENSE',
+}
+# Files of these types are also stored gzip-compressed
+COMPRESSIBLE = ('.js', '.mjs', '.css', '.svg', '.json', '.map', '.txt', '.html')
+MEDIA_TYPES = {'.js': 'text/javascript', '.mjs': 'text/javascript', '.css': 'text/css', '.map': 'application/json'}
+
+
+class MissingVendoredAssetsError(RuntimeError):
+    """Raised by a build while third-party libraries have not been vendored."""
+
+    def __init__(self, paths: List[str]):
+        super().__init__(f"{', '.join(paths)} not vendored: run `python -m app.services.asset_service vendor` "
+                         f"and commit app/static/vendor, or set ASSETS_CDN_FALLBACK to link them on their CDN")
+        self.paths = paths
+
+
+@dataclass(frozen=True)
+class Asset:
+    """
+    A built asset.
+
+    Attributes:
+        path (str): The path of the fingerprinted file.
+        digest (str): The content hash in its name.
+        compressed (bool): Whether a gzip-compressed copy is stored next to it.
+        media_type (str): The media type of the file.
+    """
+    path: str
+    digest: str
+    compressed: bool
+    media_type: str
+
+
+def _fingerprinted(path: str, digest: str) -> str:
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.{digest}{extension}"
+
+
+def _write(path: str, data: bytes) -> None:
+    # Written to a temporary file first, so concurrent builds and readers never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+class AssetPipeline:
+    """
+    Builds and looks up the fingerprinted copies of the static files.
+
+    Args:
+        source (str): The directory of the static files.
+        output (str): The directory of the fingerprinted copies.
+    """
+
+    def __init__(self, source: str, output: str):
+        self.source = source
+        self.output = output
+        self._lock = threading.Lock()
+        # Path under the source directory -> fingerprinted name, and fingerprinted name -> asset
+        self._manifest: Optional[Dict[str, str]] = None
+        self._assets: Dict[str, Asset] = {}
+
+    def build(self) -> Dict[str, str]:
+        """
+        Copies every static file that has changed since the last build. Unchanged files
+        keep their name and are not written again.
+
+        Returns:
+            Dict[str, str]: The fingerprinted name of every file, by its path under the
+                source directory. Also written to `manifest.json` in the output directory.
+
+        Raises:
+            MissingVendoredAssetsError: If a library of `VENDORED` is missing and
+                `ASSETS_CDN_FALLBACK` is off.
+        """
+        manifest: Dict[str, str] = {}
+        assets: Dict[str, Asset] = {}
+        for root, _, files in os.walk(self.source):
+            for filename in sorted(files):
+                if filename.startswith('.'):
+                    continue
+                source_path = os.path.join(root, filename)
+                path = os.path.relpath(source_path, self.source).replace(os.sep, '/')
+                with open(source_path, 'rb') as file:
+                    data = file.read()
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                name = _fingerprinted(path, digest)
+                target = os.path.join(self.output, name)
+                extension = os.path.splitext(path)[1].lower()
+                compressed = extension in COMPRESSIBLE
+                if not os.path.exists(target):
+                    if compressed:
+                        _write(f"{target}.gz", gzip.compress(data, compresslevel=9, mtime=0))
+                    _write(target, data)
+                media_type = MEDIA_TYPES.get(extension) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+                manifest[path] = name
+                assets[name] = Asset(target, digest, compressed, media_type)
+
+        missing = [path for path in VENDORED if path not in manifest]
+        if missing and not settings.ASSETS_CDN_FALLBACK:
+            raise MissingVendoredAssetsError(missing)
+        if missing:
+            logger.warning("Linking %s on their CDN, they have not been vendored", ", ".join(missing))
+
+        _write(os.path.join(self.output, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode())
+        with self._lock:
+            self._manifest = manifest
+            self._assets = assets
+        logger.info("Built %d static assets in %s", len(manifest), self.output)
+        return manifest
+
+    def _ensure_built(self) -> Dict[str, str]:
+        with self._lock:
+            manifest = self._manifest
+        return manifest if manifest is not None else self.build()
+
+    def url(self, path: str) -> str:
+        """
+        Returns the URL of a static file, e.g. "js/main.js".
+
+        The fingerprinted copy is linked if there is one. A third-party library that has
+        not been vendored is linked on its CDN, which the build only allows with
+        `ASSETS_CDN_FALLBACK`, any other file at `/static`.
+        """
+        manifest = self._ensure_built()
+        if path in manifest:
+            return f"{URL_PREFIX}/{manifest[path]}"
+        return VENDORED.get(path, f"/static/{path}")
+
+    def lookup(self, name: str) -> Optional[Asset]:
+        """Returns the built asset of a fingerprinted name, or None for any other name."""
+        self._ensure_built()
+        with self._lock:
+            return self._assets.get(name)
+
+
+asset_pipeline = AssetPipeline(STATIC_DIR, settings.ASSETS_DIR)
+
+
+def asset_url(path: str) -> str:
+    """The `asset_url` template function, see `AssetPipeline.url`."""
+    return asset_pipeline.url(path)
+
+
+def vendor(force: bool = False) -> None:
+    """
+    Downloads the pinned third-party libraries and their licenses into `app/static/vendor`.
+
+    Args:
+        force (bool): Whether to download libraries that are already vendored again.
+    """
+    for path, url in {**VENDORED, **VENDORED_LICENSES}.items():
+        target = os.path.join(STATIC_DIR, *path.split('/'))
+        if os.path.exists(target) and not force:
+            logger.info("%s is already vendored", path)
+            continue
+        with urllib.request.urlopen(url, timeout=60) as response:
+            data = response.read()
+        _write(target, data)
+        logger.info("Vendored %s from %s (%d bytes)", path, url, len(data))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=['vendor', 'build'])
+    parser.add_argument('--force', action='store_true', help="download libraries that are already vendored again")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.command == 'vendor':
+        vendor(args.force)
+    try:
+        asset_pipeline.build()
+    except MissingVendoredAssetsError as e:
+        logger.error("%s", e)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import time
+import asyncio
+import weakref
+import logging
+from typing import Any, AsyncIterator, Dict, List
+
+from pydantic import ValidationError
+
+from app.api.models import DiagramRequest
+from app.config import settings
+from app.services.artifact_service import store_artifact
+from app.services.cache_service import normalize_input
+from app.services.render_service import render_fields
+from app.utils.llm_utils import set_llm
+from app.utils.mermaid_utils import generate, render_mermaid
+from app.utils.error_handling import describe_llm_error, describe_validation_error
+
+logger = logging.getLogger(__name__)
+
+
+def provider_limit(provider: str) -> int:
+    """
+    Returns the number of items of a batch that may call a provider at the same time.
+    """
+    return max(settings.BATCH_PROVIDER_CONCURRENCY.get(provider, settings.BATCH_CONCURRENCY), 1)
+
+
+# The semaphores limiting batch items per provider, shared by all batches. Semaphores
+# belong to the event loop they are used on, so each running loop gets its own.
+_provider_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def provider_semaphore(provider: str) -> asyncio.Semaphore:
+    """
+    Returns the semaphore that limits the batch items calling a provider, across all
+    batches running on the current event loop, to `provider_limit(provider)`.
+    """
+    semaphores = _provider_semaphores.setdefault(asyncio.get_running_loop(), {})
+    semaphore = semaphores.get(provider)
+    if semaphore is None:
+        semaphore = semaphores[provider] = asyncio.Semaphore(provider_limit(provider))
+    return semaphore
+
+
+def _item_id(item: Any, index: int) -> Any:
+    return item.get('id', index) if isinstance(item, dict) else index
+
+
+async def _generate_item(index: int, item: Any) -> Dict[str, Any]:
+    result = {"type": "result", "index": index, "id": _item_id(item, index)}
+    start_time = time.perf_counter()
+    try:
+        request = DiagramRequest.model_validate(item)
+    except ValidationError as e:
+        return {**result, "status": 422, "error": f"Invalid item: {describe_validation_error(e)}"}
+
+    provider = request.provider.strip()
+    model = request.model.strip()
+    async with provider_semaphore(provider):
+        try:
+            llm = set_llm(provider, model, (request.apiKey or '').strip())
+            if llm is None:
+                return {**result, "status": 400,
+                        "error": f"Failed to initialize LLM for provider: {provider}, model: {model}"}
+            generated = await generate(request.input, request.selectedTemplate, llm, model,
+                                       request.temperature, request.maxTokens)
+            result.update(status=200, text=render_mermaid(generated['text']))
+            if request.format == 'svg':
+                result.update(await render_fields(generated['text']))
+            artifact = await store_artifact(result["text"], result.get("svg"))
+            if artifact:
+                result["diagramId"] = artifact
+            return {**result, "elapsed": round(time.perf_counter() - start_time, 3)}
+        except Exception as e:
+            logger.error("Error generating batch item %d: %s", index, e)
+            message, status = describe_llm_error(e)
+            return {**result, "status": status, "error": message,
+                    "elapsed": round(time.perf_counter() - start_time, 3)}
+
+
+async def generate_batch(items: List[Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Generates a diagram for every item of a batch concurrently.
+
+    Items are validated with `DiagramRequest` one by one, so an invalid item only fails
+    itself. At most `provider_limit(provider)` items, of this and all other batches
+    running on the event loop, call the same provider at a time.
+
+    Yields events as dictionaries, in the order the items finish:
+        {"type": "result", "index": ..., "id": ..., "status": 200, "text": ...} for a generated item,
+            with `svg` (or `svgError`) too if the item asks for `"format": "svg"` and the
+            `diagramId` of the stored diagram,
+        {"type": "result", "index": ..., "id": ..., "status": <http status>, "error": ...} for a failed item,
+        {"type": "done", "total": ..., "succeeded": ..., "failed": ...} last.
+
+    `index` is the position of the item in the batch and `id` the item's `id` field, if it
+    has one, or the index.
+
+    Args:
+        items (List[Any]): The request bodies, as accepted by `/api/ask`.
+    """
+    tasks = [asyncio.ensure_future(_generate_item(index, item)) for index, item in enumerate(items)]
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result["status"] == 200:
+                succeeded += 1
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+    yield {"type": "done", "total": len(items), "succeeded": succeeded, "failed": len(items) - succeeded}
+
+
+async def generate_multi(input: str, selected_templates: List[str], llm, selected_model: str,
+                         temperature: float, max_tokens: int) -> List[Dict[str, Any]]:
+    """
+    Generates one input as several diagram types in parallel.
+
+    The input is normalized once and shared by all generations. The system part of each
+    prompt only depends on its template, so repeated multi requests reuse the providers'
+    cached prompt prefixes.
+
+    Args:
+        input (str): What the diagrams should be about.
+        selected_templates (List[str]): The diagram templates.
+        llm: The LLM instance.
+        selected_model (str): The model name.
+        temperature (float): The sampling temperature.
+        max_tokens (int): The maximum number of tokens to generate per diagram.
+
+    Returns:
+        List[Dict[str, Any]]: One result per template, in the given order:
+            {"template": ..., "status": 200, "text": ..., "diagramId": ...} or
+            {"template": ..., "status": <http status>, "error": ...}.
+    """
+    normalized_input = normalize_input(input)
+    outcomes = await asyncio.gather(
+        *(generate(normalized_input, template, llm, selected_model, temperature, max_tokens)
+          for template in selected_templates),
+        return_exceptions=True,
+    )
+
+    results = []
+    for template, outcome in zip(selected_templates, outcomes):
+        if isinstance(outcome, Exception):
+            message, status = describe_llm_error(outcome)
+            results.append({"template": template, "status": status, "error": message})
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            result = {"template": template, "status": 200, "text": render_mermaid(outcome['text'])}
+            artifact = await store_artifact(result["text"])
+            if artifact:
+                result["diagramId"] = artifact
+            results.append(result)
+    return results
@@ -0,0 +1,138 @@
+import json
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+from cachetools import Cache, TTLCache
+
+from app.config import settings
+
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache that counts size-based evictions and TTL expirations."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.evictions = 0
+        self.expirations = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def expire(self, time=None):
+        # Cache.__len__ is used directly since TTLCache.__len__ itself calls expire()
+        before = Cache.__len__(self)
+        expired = super().expire(time)
+        self.expirations += before - Cache.__len__(self)
+        return expired
+
+
+def normalize_input(text: str) -> str:
+    """
+    Normalizes user input so that inputs differing only in whitespace share a cache entry.
+
+    Args:
+        text (str): The raw user input.
+
+    Returns:
+        str: The input with surrounding whitespace removed and inner whitespace collapsed.
+    """
+    return " ".join((text or "").split())
+
+
+def make_cache_key(input: str, template: str, provider: str, model: str,
+                   temperature: float, max_tokens: int, syntax_version: str) -> str:
+    """
+    Builds the cache key for a generation request.
+
+    Args:
+        input (str): The user input.
+        template (str): The selected diagram template.
+        provider (str): The LLM provider.
+        model (str): The LLM model.
+        temperature (float): The sampling temperature.
+        max_tokens (int): The maximum number of tokens to generate.
+        syntax_version (str): The version of the syntax documents and prompt compiler
+            settings used to build the prompt.
+
+    Returns:
+        str: A hex digest identifying the request.
+    """
+    payload = json.dumps([
+        normalize_input(input),
+        (template or "").upper(),
+        (provider or "").lower(),
+        model,
+        float(temperature),
+        int(max_tokens),
+        syntax_version,
+    ], separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with TTL for generation results.
+
+    Args:
+        maxsize (int): The maximum number of cached results.
+        ttl (float): The number of seconds a result stays valid.
+        enabled (bool): Whether lookups and stores are performed at all.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, enabled: bool = False):
+        self.enabled = enabled
+        self._cache = _CountingTTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize: Optional[int] = None, ttl: Optional[float] = None,
+                  enabled: Optional[bool] = None) -> None:
+        """Replaces the cache settings, dropping all cached results."""
+        with self._lock:
+            self._cache = _CountingTTLCache(maxsize=maxsize or self._cache.maxsize,
+                                            ttl=ttl or self._cache.ttl)
+            if enabled is not None:
+                self.enabled = enabled
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._cache[key] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "ttl": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self._cache.evictions,
+                "expirations": self._cache.expirations,
+            }
+
+
+result_cache = ResultCache(maxsize=settings.RESULT_CACHE_MAXSIZE,
+                           ttl=settings.RESULT_CACHE_TTL,
+                           enabled=settings.RESULT_CACHE_ENABLED)
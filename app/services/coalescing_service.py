@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import threading
+import contextvars
+import concurrent.futures
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar, Union
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class _InFlight:
+    """A shared call and the number of callers still waiting for it."""
+
+    def __init__(self, future: Union[asyncio.Future, concurrent.futures.Future]):
+        self.future = future
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicates identical calls that are in flight at the same time.
+
+    The first caller for a key starts the call; callers arriving with the same key before
+    it completes wait for the same result (or error) instead of starting their own.
+
+    Requests are served on different event loops (one per request for Flask's async
+    views), so shared calls run on a background event loop owned by this class and every
+    caller waits on a `concurrent.futures.Future` through `asyncio.wrap_future`. A server
+    that handles all requests on one long-lived loop binds it with `bind_loop`, and
+    calls from that loop then run on it directly. A caller
+    that is cancelled stops waiting without affecting the others; the call itself is only
+    cancelled once no caller is waiting for it any more.
+
+    Args:
+        enabled (bool): Whether calls are deduplicated. When disabled, `do` simply awaits
+            the call on the caller's event loop.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls: Dict[Hashable, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._bound_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.calls = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        # Called with the lock held
+        if self._loop is None or self._loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='single-flight', daemon=True)
+            thread.start()
+            self._loop, self._thread = loop, thread
+        return self._loop
+
+    def bind_loop(self, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """
+        Runs the shared calls of callers on `loop` on that loop instead of the background
+        loop, so they use its connection pools. None unbinds it.
+        """
+        with self._lock:
+            self._bound_loop = loop
+
+    def _start(self, fn: Callable[[], Awaitable[T]]) -> Union[asyncio.Future, concurrent.futures.Future]:
+        # Called with the lock held
+        context = contextvars.copy_context()
+        if self._bound_loop is not None and self._bound_loop is asyncio.get_running_loop():
+            return self._bound_loop.create_task(fn(), context=context)
+        return asyncio.run_coroutine_threadsafe(self._run_in(context, fn), self._ensure_loop())
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Returns the result of `fn()`, sharing it with concurrent callers using the same key.
+
+        Args:
+            key (Hashable): Identifies calls that are interchangeable.
+            fn (Callable[[], Awaitable[T]]): Starts the call. It runs on the bound loop or
+                the background loop.
+
+        Returns:
+            T: The result of the shared call.
+
+        Raises:
+            Exception: The error raised by the shared call.
+        """
+        if not self.enabled:
+            return await fn()
+
+        started = False
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _InFlight(self._start(fn))
+                self._calls[key] = call
+                self.calls += 1
+                started = True
+            else:
+                self.coalesced += 1
+                logger.debug("Coalescing with in-flight call for key %s", key)
+            call.waiters += 1
+        if started:
+            # Registered outside the lock: the callback runs at once if the call already finished
+            call.future.add_done_callback(lambda _: self._forget(key, call))
+
+        cancelled = False
+        try:
+            # Shielded, since cancelling a wrapped future would cancel the shared call
+            return await asyncio.shield(asyncio.wrap_future(call.future))
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            self._release(key, call, cancelled)
+
+    @staticmethod
+    async def _run_in(context: contextvars.Context, fn: Callable[[], Awaitable[T]]) -> T:
+        # Runs the call with the context variables of the caller that started it (e.g. metric labels)
+        return await context.run(asyncio.ensure_future, fn())
+
+    def _release(self, key: Hashable, call: _InFlight, cancelled: bool = False) -> None:
+        with self._lock:
+            call.waiters -= 1
+            abandoned = cancelled and call.waiters == 0 and not call.future.done()
+            if abandoned:
+                self.cancelled += 1
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+        if abandoned:
+            # Nobody is waiting any more. Cancelled outside the lock since done callbacks run synchronously.
+            call.future.cancel()
+
+    def _forget(self, key: Hashable, call: _InFlight) -> None:
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def close(self) -> None:
+        """Cancels all in-flight calls and stops the background loop."""
+        with self._lock:
+            calls = list(self._calls.values())
+            self._calls.clear()
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        # Outside the lock, since the done callbacks of cancelled calls take it
+        for call in calls:
+            call.future.cancel()
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "in_flight": len(self._calls),
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "cancelled": self.cancelled,
+            }
+
+
+single_flight = SingleFlight(enabled=settings.COALESCE_ENABLED)
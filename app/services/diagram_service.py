@@ -0,0 +1,431 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Mapping, Optional
+
+from pydantic import ValidationError
+
+from app.api.models import MultiDiagramRequest
+from app.config import settings
+from app.llm.hedging import hedge_policy
+from app.llm.latency_tracker import latency_tracker
+from app.llm.llm_manager import async_client_pool, client_pool
+from app.llm.prompt import prompt_cache_stats
+from app.llm.rate_limiter import rate_limiter
+from app.llm.router import provider_router
+from app.rendering.renderer import UnsupportedDiagramError
+from app.services.artifact_service import ARTIFACT_ID, artifact_store, store_artifact
+from app.services.asset_service import asset_pipeline
+from app.services.batch_service import generate_batch, generate_multi
+from app.services.cache_service import result_cache
+from app.services.coalescing_service import single_flight
+from app.services.metrics_service import in_flight, observe_stage, register_models, stage_timer
+from app.services.profiling_service import ProfilerBusyError, RequestProfile, profiling_requested
+from app.services.prompt_compiler import prompt_compiler
+from app.services.render_service import render_cache, render_diagram, render_fields
+from app.services.template_service import template_registry
+from app.utils.error_handling import describe_llm_error, describe_validation_error
+from app.utils.http_utils import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, accepts_gzip, etag_matches
+from app.utils.llm_utils import get_available_llms, set_llm
+from app.utils.mermaid_utils import generate, generate_stream, render_mermaid
+from app.utils.template_utils import TemplateEnum, get_templates
+
+logger = logging.getLogger(__name__)
+
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+SVG_MEDIA_TYPE = 'image/svg+xml'
+ARTIFACT_MEDIA_TYPES = {'mmd': 'text/plain', 'svg': SVG_MEDIA_TYPE}
+
+MODELS = {
+    'openai': [
+        {"value": "gpt-3.5-turbo", "label": "GPT-3.5 Turbo"},
+        {"value": "gpt-4", "label": "GPT-4"},
+        {"value": "gpt-4-turbo", "label": "GPT-4 Turbo"},
+    ],
+    'gemini': [
+        {"value": "gemini-1.5-pro", "label": "Gemini 1.5 Pro"},
+        {"value": "gemini-1.5-flash", "label": "Gemini 1.5 Flash"},
+        {"value": "gemini-1.0-pro", "label": "Gemini 1.0 Pro"},
+    ],
+}
+if settings.SIMULATED_ENABLED:
+    MODELS['simulated'] = [{"value": "simulated", "label": "Simulated (no API calls)"}]
+register_models(model["value"] for models in MODELS.values() for model in models)
+
+
+@dataclass
+class ServiceResponse:
+    """
+    A response of the diagram API, independent of the web framework serving it: a body,
+    JSON unless stated otherwise, or a stream of newline-delimited JSON lines.
+
+    Attributes:
+        status (int): The HTTP status.
+        body (Optional[bytes]): The body.
+        lines (Optional[AsyncIterator[str]]): The lines of a streamed response.
+        headers (Dict[str, str]): Extra response headers.
+        media_type (str): The media type of the body.
+    """
+    status: int = 200
+    body: Optional[bytes] = None
+    lines: Optional[AsyncIterator[str]] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    media_type: str = 'application/json'
+
+
+def json_response(payload: Any, status: int = 200) -> ServiceResponse:
+    return ServiceResponse(status=status, body=json.dumps(payload).encode())
+
+
+def svg_response(svg: str) -> ServiceResponse:
+    return ServiceResponse(body=svg.encode(), media_type=SVG_MEDIA_TYPE)
+
+
+def stream_response(lines: AsyncIterator[str]) -> ServiceResponse:
+    return ServiceResponse(lines=lines, headers=dict(STREAM_HEADERS))
+
+
+@dataclass
+class AskParams:
+    """The fields of an `/api/ask` body, with the defaults of the UI."""
+    input: Optional[str]
+    template: str
+    provider: str
+    model: str
+    temperature: float
+    max_tokens: int
+    api_key: str
+    format: str = 'mermaid'
+
+    @classmethod
+    def from_json(cls, data: Mapping[str, Any]) -> 'AskParams':
+        return cls(
+            input=data.get('input'),
+            template=data.get('selectedTemplate', TemplateEnum.FLOWCHART.value),
+            provider=data.get('provider', '').strip(),
+            model=data.get('model', '').strip(),
+            temperature=float(data.get('temperature', 0.7)),
+            max_tokens=int(data.get('maxTokens', 4096)),
+            api_key=data.get('apiKey', '').strip(),
+            format=str(data.get('format', 'mermaid')).lower(),
+        )
+
+
+def _llm_init_error(provider: str, model: str) -> ServiceResponse:
+    return json_response({"error": f"Failed to initialize LLM for provider: {provider}, model: {model}"}, 400)
+
+
+def _not_an_object() -> ServiceResponse:
+    return json_response({"error": "Expected a JSON object"}, 400)
+
+
+def warm_up() -> None:
+    """
+    Loads the syntax documents and builds the example index of every template and the
+    static assets, so the first requests do not pay for it.
+    """
+    template_registry.load()
+    for name in template_registry.names():
+        prompt_compiler.compile(name, "")
+    asset_pipeline.build()
+
+
+async def shutdown() -> None:
+    """
+    Cancels the shared calls in flight and closes the pooled provider clients. Called by
+    a server when it stops.
+    """
+    single_flight.bind_loop(None)
+    single_flight.close()
+    await async_client_pool().aclose_all()
+    client_pool.close_all()
+
+
+def index_context() -> Dict[str, Any]:
+    """The variables of the `index.html` template."""
+    return {"templates": get_templates(), "available_llms": get_available_llms()}
+
+
+def list_models(provider: Optional[str]) -> ServiceResponse:
+    if provider in MODELS:
+        return json_response(MODELS[provider])
+    if provider in ['huggingface', 'ollama']:
+        return json_response({"type": "text_input"})
+    return json_response({"error": "Unknown provider"}, 400)
+
+
+def stats() -> ServiceResponse:
+    return json_response({"cache": result_cache.stats(), "clients": client_pool.stats(),
+                          "coalescing": single_flight.stats(), "prompt_cache": prompt_cache_stats.stats(),
+                          "hedging": hedge_policy.stats(), "routing": provider_router.stats(),
+                          "rate_limits": rate_limiter.stats(), "latency": latency_tracker.stats(),
+                          "render_cache": render_cache.stats(), "artifacts": artifact_store.stats()})
+
+
+async def _ask(params: AskParams, raw_svg: bool = False) -> ServiceResponse:
+    try:
+        llm = set_llm(params.provider, params.model, params.api_key)
+        if llm is None:
+            return _llm_init_error(params.provider, params.model)
+
+        result = await generate(params.input, params.template, llm, params.model, params.temperature,
+                                params.max_tokens)
+
+        rendered_chart = render_mermaid(result['text'])
+        payload = {"text": rendered_chart}
+        if params.format == 'svg' or raw_svg:
+            payload.update(await render_fields(result['text']))
+        artifact = await store_artifact(rendered_chart, payload.get("svg"))
+        if artifact:
+            payload["diagramId"] = artifact
+        if raw_svg:
+            if "svg" not in payload:
+                return json_response({"error": payload["svgError"], "text": rendered_chart}, 406)
+            response = svg_response(payload["svg"])
+            if artifact:
+                response.headers["Content-Location"] = f"/d/{artifact}.svg"
+            return response
+        with stage_timer("serialization", provider=params.provider, model=params.model, template=params.template):
+            return json_response(payload)
+
+    except Exception as e:
+        message, status = describe_llm_error(e)
+        return json_response({"error": message}, status)
+
+
+async def ask(data: Any, headers: Mapping[str, str], args: Mapping[str, str]) -> ServiceResponse:
+    """
+    Generates a diagram. With `PROFILING_ENABLED`, a request with the `X-Debug-Profile: 1`
+    header (or `?profile=1`) is profiled and answered with a `Server-Timing` header of its
+    stages; `save` instead of `1` also writes the profile files to `PROFILING_DIR`. Only
+    one request is profiled at a time, others asking to be are answered with 409.
+
+    With `"format": "svg"` in the body (or `?format=svg`) the response also contains the
+    diagram rendered as `svg`, or an `svgError` if its type cannot be rendered. A request
+    that accepts `image/svg+xml` is answered with the SVG document itself, so clients
+    without a browser can use it directly.
+
+    The diagram is stored, see `get_artifact`, and its id returned as `diagramId`.
+
+    Args:
+        data (Any): The JSON body.
+        headers (Mapping[str, str]): The request headers.
+        args (Mapping[str, str]): The query parameters.
+    """
+    if not isinstance(data, dict):
+        return _not_an_object()
+    params = AskParams.from_json(data)
+    if args.get('format'):
+        params.format = args['format'].lower()
+    raw_svg = SVG_MEDIA_TYPE in (headers.get('Accept') or '')
+    with in_flight('ask'):
+        mode = profiling_requested(headers, args)
+        if mode is None:
+            return await _ask(params, raw_svg)
+
+        try:
+            with RequestProfile(name=str(params.template or 'request'), save=mode == 'save') as profile:
+                response = await _ask(params, raw_svg)
+        except ProfilerBusyError as e:
+            return json_response({"error": str(e)}, 409)
+        response.headers['Server-Timing'] = profile.server_timing()
+        if profile.files:
+            response.headers['X-Profile-Files'] = ", ".join(os.path.basename(path) for path in profile.files)
+        return response
+
+
+def ask_stream(data: Any) -> ServiceResponse:
+    """
+    Streams a generation as newline-delimited JSON events: `token` events with raw LLM
+    output as it arrives, a `code` event with the extracted diagram once the closing
+    code fence appears, and a final `done` (or `error`) event.
+    """
+    if not isinstance(data, dict):
+        return _not_an_object()
+    params = AskParams.from_json(data)
+    llm = set_llm(params.provider, params.model, params.api_key)
+    if llm is None:
+        return _llm_init_error(params.provider, params.model)
+
+    async def events():
+        serialization_seconds = 0.0
+        with in_flight('stream'):
+            try:
+                async for event in generate_stream(params.input, params.template, llm, params.model,
+                                                   params.temperature, params.max_tokens):
+                    if event["type"] == "done":
+                        event["text"] = render_mermaid(event["text"])
+                        artifact = await store_artifact(event["text"])
+                        if artifact:
+                            event["diagramId"] = artifact
+                    start_time = time.perf_counter()
+                    line = json.dumps(event) + "\n"
+                    serialization_seconds += time.perf_counter() - start_time
+                    yield line
+                observe_stage("serialization", serialization_seconds, provider=params.provider,
+                              model=params.model, template=params.template)
+            except Exception as e:
+                logger.error("Error in streaming generation: %s", e, exc_info=True)
+                message, status = describe_llm_error(e)
+                yield json.dumps({"type": "error", "error": message, "status": status}) + "\n"
+
+    return stream_response(events())
+
+
+async def ask_multi(data: Any) -> ServiceResponse:
+    """
+    Generates one input as several diagram types in parallel. Takes the `/api/ask` body
+    with a `selectedTemplates` list instead of `selectedTemplate` and returns all results
+    together, each with its own status.
+    """
+    try:
+        request = MultiDiagramRequest.model_validate(data)
+    except ValidationError as e:
+        return json_response({"error": f"Invalid request: {describe_validation_error(e)}"}, 422)
+
+    provider = request.provider.strip()
+    model = request.model.strip()
+    llm = set_llm(provider, model, (request.apiKey or '').strip())
+    if llm is None:
+        return _llm_init_error(provider, model)
+
+    templates = [template.value for template in request.selectedTemplates]
+    with in_flight('multi'):
+        results = await generate_multi(request.input, templates, llm, model, request.temperature, request.maxTokens)
+
+    succeeded = sum(1 for result in results if result["status"] == 200)
+    # Partial success is still a success; the per-template statuses tell which ones failed
+    status = 200 if succeeded else results[0]["status"]
+    return json_response({"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}, status)
+
+
+def ask_batch(data: Any) -> ServiceResponse:
+    """
+    Generates diagrams for a list of `/api/ask` request bodies, given as the JSON body
+    itself or as its `items` field. Items are generated concurrently and streamed back as
+    newline-delimited JSON `result` events as each one finishes, followed by a `done` event.
+    """
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return json_response({"error": "Expected a non-empty list of items"}, 400)
+    if len(items) > settings.BATCH_MAX_ITEMS:
+        return json_response({"error": f"A batch can contain at most {settings.BATCH_MAX_ITEMS} items"}, 400)
+
+    async def events():
+        with in_flight('batch'):
+            async for event in generate_batch(items):
+                yield json.dumps(event) + "\n"
+
+    return stream_response(events())
+
+
+def _not_found(message: str = "Diagram not found") -> ServiceResponse:
+    return json_response({"error": message}, 404)
+
+
+def _cacheable_response(tag: str, headers: Mapping[str, str], media_type: str,
+                        read: Callable[[bool], Optional[bytes]], compressible: bool = True,
+                        cache_control: str = IMMUTABLE_CACHE_CONTROL) -> ServiceResponse:
+    """
+    Serves content identified by a strong `ETag`, by default as immutable for content
+    whose URL changes whenever the content does. Each encoding has its own bytes and so
+    its own tag; a request with a matching `If-None-Match` header is answered with a 304
+    without reading the content.
+
+    Args:
+        tag (str): The entity tag of the uncompressed content, without quotes.
+        headers (Mapping[str, str]): The request headers.
+        media_type (str): The media type of the content.
+        read (Callable[[bool], Optional[bytes]]): Reads the content, gzip-compressed if
+            passed True. Returns None if it does not exist.
+        compressible (bool): Whether a gzip-compressed copy can be read.
+        cache_control (str): The `Cache-Control` header.
+    """
+    compressed = compressible and accepts_gzip(headers.get('Accept-Encoding'))
+    response_headers = {"ETag": f'"{tag}{".gz" if compressed else ""}"',
+                        "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag_matches(headers.get('If-None-Match'), response_headers["ETag"]):
+        return ServiceResponse(status=304, headers=response_headers)
+    body = read(compressed)
+    if body is None:
+        return _not_found()
+    if compressed:
+        response_headers["Content-Encoding"] = "gzip"
+    return ServiceResponse(body=body, headers=response_headers, media_type=media_type)
+
+
+def _stored_svg(artifact: str) -> Optional[bytes]:
+    # The SVG of a diagram stored without one is rendered once and stored with it
+    svg = artifact_store.get(artifact, 'svg')
+    if svg is not None:
+        return svg
+    code = artifact_store.get(artifact, 'mmd')
+    if code is None:
+        return None
+    svg = render_diagram(code.decode())
+    artifact_store.put(code.decode(), svg)
+    return svg.encode()
+
+
+def get_artifact(name: str, headers: Mapping[str, str]) -> ServiceResponse:
+    """
+    Serves a stored diagram: `<id>` is its Mermaid code and `<id>.svg` its SVG, where the
+    id is the hash of the code returned by the generation endpoints.
+
+    The id names the code, so the code never changes at its URL and is served as
+    immutable. The SVG at its URL can change, when the renderer does or when it is
+    rendered again after being evicted, so it is tagged with the hash of its own bytes and
+    revalidated. Clients accepting gzip get the stored compressed copy.
+
+    Args:
+        name (str): The last path segment, e.g. "<id>.svg".
+        headers (Mapping[str, str]): The request headers.
+    """
+    artifact, _, extension = name.partition('.')
+    kind = extension or 'mmd'
+    if (not artifact_store.enabled or not ARTIFACT_ID.match(artifact) or kind not in ARTIFACT_MEDIA_TYPES
+            or not artifact_store.exists(artifact, 'mmd')):
+        return _not_found()
+
+    if kind == 'mmd':
+        return _cacheable_response(f"{artifact}.mmd", headers, ARTIFACT_MEDIA_TYPES[kind],
+                                   lambda compressed: artifact_store.get(artifact, kind, compressed))
+
+    try:
+        svg = _stored_svg(artifact)
+    except UnsupportedDiagramError as e:
+        return _not_found(str(e))
+    if svg is None:
+        return _not_found()
+
+    def read(compressed: bool) -> Optional[bytes]:
+        return artifact_store.get(artifact, kind, compressed) if compressed else svg
+
+    return _cacheable_response(f"{hashlib.sha256(svg).hexdigest()}.svg", headers, ARTIFACT_MEDIA_TYPES[kind], read,
+                               cache_control=REVALIDATE_CACHE_CONTROL)
+
+
+def get_asset(name: str, headers: Mapping[str, str]) -> ServiceResponse:
+    """
+    Serves a fingerprinted static file, e.g. "js/main.3f2a9c41d07b.js", see
+    `asset_service`. Clients accepting gzip get the compressed copy built with it.
+
+    Args:
+        name (str): The path after `/assets/`.
+        headers (Mapping[str, str]): The request headers.
+    """
+    asset = asset_pipeline.lookup(name)
+    if asset is None:
+        return json_response({"error": "Asset not found"}, 404)
+
+    def read(compressed: bool) -> Optional[bytes]:
+        try:
+            with open(f"{asset.path}.gz" if compressed else asset.path, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    return _cacheable_response(asset.digest, headers, asset.media_type, read, compressible=asset.compressed)
@@ -0,0 +1,164 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+from app.llm.prompt import completion_tokens, usage_tokens
+from app.services.profiling_service import record_stage
+from app.utils.template_utils import TemplateEnum
+
+LABELS = ('provider', 'model', 'template')
+TEMPLATE_LABELS = frozenset(template.value for template in TemplateEnum)
+# Label values for a template that does not exist and a model that is not offered in the UI
+INVALID_TEMPLATE = 'invalid'
+OTHER_MODEL = 'other'
+
+# From sub-millisecond local stages up to slow model calls
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    'diagram_stage_seconds', 'Time spent in each stage of a diagram generation.',
+    ('stage',) + LABELS, buckets=STAGE_BUCKETS)
+PROMPT_TOKENS = Counter('llm_prompt_tokens', 'Prompt tokens reported by the providers.', ('provider', 'model'))
+CACHED_PROMPT_TOKENS = Counter('llm_cached_prompt_tokens', 'Prompt tokens served from provider prompt caches.',
+                               ('provider', 'model'))
+COMPLETION_TOKENS = Counter('llm_completion_tokens', 'Completion tokens reported by the providers.',
+                            ('provider', 'model'))
+RETRIES = Counter('llm_retries', 'Retried LLM call attempts.', ('provider', 'error'))
+ERRORS = Counter('diagram_errors', 'Failed diagram generations by error type.', LABELS + ('error',))
+REPAIRS = Counter('diagram_repairs', 'Repairs of invalid diagrams by outcome.', ('template', 'outcome'))
+RESULT_CACHE_REQUESTS = Counter('result_cache_requests', 'Result cache lookups.', ('result',))
+IN_FLIGHT = Gauge('diagram_requests_in_flight', 'Requests being served.', ('endpoint',),
+                  multiprocess_mode='livesum')
+
+# Labels of the generation the current code runs for; stages and errors default to them
+_labels: ContextVar[Dict[str, str]] = ContextVar('metric_labels', default={})
+# The models labelled by name, see `register_models`
+_models: FrozenSet[str] = frozenset()
+
+
+def register_models(models: Iterable[str]) -> None:
+    """
+    Sets the models that metrics are labelled with. Model names come from requests, so
+    any other model, e.g. a free-text Ollama or Hugging Face model, is labelled "other"
+    to keep the number of time series bounded.
+    """
+    global _models
+    _models = frozenset(models)
+
+
+def template_label(template: Optional[str]) -> str:
+    """The label of a template: its name, or "invalid" for a template that does not exist."""
+    if not template:
+        return ''
+    name = str(template).upper()
+    return name if name in TEMPLATE_LABELS else INVALID_TEMPLATE
+
+
+def model_label(model: Optional[str]) -> str:
+    """The label of a model: its name if it was registered, otherwise "other"."""
+    if not model:
+        return ''
+    return model if model in _models else OTHER_MODEL
+
+
+def _label_values(labels: Dict[str, Optional[str]]) -> Tuple[str, ...]:
+    merged = {**_labels.get(), **{name: value for name, value in labels.items() if value is not None}}
+    return (str(merged.get('provider') or ''), model_label(merged.get('model')), template_label(merged.get('template')))
+
+
+@contextmanager
+def metric_labels(**labels: str) -> Iterator[None]:
+    """
+    Sets the provider, model and template labels for the metrics recorded in the block,
+    including by coroutines it awaits.
+    """
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def observe_stage(stage: str, seconds: float, **labels: Optional[str]) -> None:
+    """
+    Records the duration of a stage, also in the profile of the request if it is profiled.
+
+    Args:
+        stage (str): The stage name, e.g. "prompt_build".
+        seconds (float): The duration.
+        **labels: `provider`, `model` and `template`, overriding those of `metric_labels`.
+    """
+    STAGE_SECONDS.labels(stage, *_label_values(labels)).observe(seconds)
+    record_stage(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage: str, **labels: Optional[str]) -> Iterator[None]:
+    """
+    Times the block as a stage, also when it raises.
+
+    Args:
+        stage (str): The stage name.
+        **labels: `provider`, `model` and `template`, overriding those of `metric_labels`.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start_time, **labels)
+
+
+def count_error(error: BaseException, **labels: Optional[str]) -> None:
+    ERRORS.labels(*_label_values(labels), type(error).__name__).inc()
+
+
+def count_retry(provider: str, error: BaseException) -> None:
+    RETRIES.labels(provider, type(error).__name__).inc()
+
+
+def count_repair(template: str, outcome: str) -> None:
+    REPAIRS.labels(template_label(template), outcome).inc()
+
+
+def count_cache_lookup(hit: bool) -> None:
+    RESULT_CACHE_REQUESTS.labels('hit' if hit else 'miss').inc()
+
+
+def record_token_usage(provider: str, model: str, usage: Any) -> None:
+    """
+    Counts the prompt, cached prompt and completion tokens of a response's usage data.
+    """
+    prompt, cached = usage_tokens(usage)
+    completion = completion_tokens(usage)
+    model = model_label(model)
+    if prompt:
+        PROMPT_TOKENS.labels(provider, model).inc(prompt)
+    if cached:
+        CACHED_PROMPT_TOKENS.labels(provider, model).inc(cached)
+    if completion:
+        COMPLETION_TOKENS.labels(provider, model).inc(completion)
+
+
+def in_flight(endpoint: str):
+    """Counts the requests of an endpoint while the returned context manager is active."""
+    return IN_FLIGHT.labels(endpoint).track_inprogress()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Renders all metrics in the Prometheus text format. With `PROMETHEUS_MULTIPROC_DIR`
+    set, the metrics of all worker processes are combined.
+
+    Returns:
+        Tuple[bytes, str]: The body and its content type.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
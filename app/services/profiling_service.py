@@ -0,0 +1,164 @@
+import os
+import re
+import time
+import cProfile
+import logging
+import threading
+import tracemalloc
+from contextvars import ContextVar
+from typing import Dict, List, Mapping, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Debug-Profile'
+TRACEMALLOC_FRAMES = 10
+
+# The profile of the request the current code runs for, if it is profiled
+_current: ContextVar[Optional['RequestProfile']] = ContextVar('request_profile', default=None)
+
+# cProfile hooks a whole thread, and on the ASGI app every request shares the loop thread,
+# so only one request per process is profiled at a time
+_profiler_lock = threading.Lock()
+
+# tracemalloc traces the whole process, so it runs while any profiled request does
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def profiling_requested(headers: Mapping[str, str], args: Mapping[str, str]) -> Optional[str]:
+    """
+    Returns how a request asked to be profiled: "1", or "save" to also keep the profile
+    files, from the `X-Debug-Profile` header or the `profile` query parameter. Returns
+    None when it did not ask or `PROFILING_ENABLED` is off.
+    """
+    if not settings.PROFILING_ENABLED:
+        return None
+    mode = (headers.get(PROFILE_HEADER) or args.get('profile') or '').strip().lower()
+    if mode in ('', '0', 'false', 'off'):
+        return None
+    return 'save' if mode == 'save' else '1'
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """
+    Adds the duration of a stage to the profile of the current request, if it is profiled.
+    """
+    profile = _current.get()
+    if profile is not None:
+        profile.add_stage(stage, seconds)
+
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a request asks to be profiled while another request is."""
+
+    def __init__(self):
+        super().__init__("Another request is being profiled, try again later")
+
+
+class RequestProfile:
+    """
+    Profiles one request with `cProfile` and `tracemalloc` while used as a context
+    manager, and collects the durations of its stages.
+
+    `cProfile` records everything that runs on the thread of the request. On Flask that
+    is the request alone; on the ASGI app it includes whatever other requests run on the
+    event loop in the meantime, so keep concurrent traffic low while profiling there. A
+    model call shared through coalescing runs on the coalescing loop and shows up as the
+    time spent waiting for it. The stages are recorded wherever they run. Only one request
+    per process is profiled at a time; entering a second profile raises
+    `ProfilerBusyError`.
+
+    Args:
+        name (str): Names the saved profile files, e.g. the template.
+        save (bool): Whether to write the profile files to `PROFILING_DIR` at the end.
+    """
+
+    def __init__(self, name: str = 'request', save: bool = False):
+        self.name = name
+        self.save = save
+        self.stages: Dict[str, float] = {}
+        self.total = 0.0
+        self.memory_peak = 0
+        self.files: List[str] = []
+        self._profiler = cProfile.Profile()
+        self._lock = threading.Lock()
+        self._token = None
+        self._start_time = 0.0
+        self._memory_start = 0
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def __enter__(self) -> 'RequestProfile':
+        if not _profiler_lock.acquire(blocking=False):
+            raise ProfilerBusyError()
+        self._token = _current.set(self)
+        _start_tracemalloc()
+        self._memory_start = tracemalloc.get_traced_memory()[0]
+        self._start_time = time.perf_counter()
+        try:
+            self._profiler.enable()
+        except ValueError:
+            # Python 3.12+ refuses a second profiler on the thread, e.g. one started outside the app
+            _stop_tracemalloc()
+            _current.reset(self._token)
+            _profiler_lock.release()
+            raise ProfilerBusyError()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._profiler.disable()
+        _profiler_lock.release()
+        self.total = time.perf_counter() - self._start_time
+        # The peak of the process since tracing started, above what was allocated at the start
+        self.memory_peak = max(tracemalloc.get_traced_memory()[1] - self._memory_start, 0)
+        snapshot = tracemalloc.take_snapshot() if self.save else None
+        _stop_tracemalloc()
+        _current.reset(self._token)
+        if self.save:
+            self._save(snapshot)
+
+    def _save(self, snapshot: tracemalloc.Snapshot) -> None:
+        directory = settings.PROFILING_DIR
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # The name comes from the request, so it is reduced to safe file name characters
+            name = re.sub(r'[^A-Za-z0-9_-]', '_', self.name)[:40]
+            base = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{id(self):x}-{name}")
+            self._profiler.dump_stats(f"{base}.prof")
+            snapshot.dump(f"{base}.tracemalloc")
+            self.files = [f"{base}.prof", f"{base}.tracemalloc"]
+            logger.info("Saved request profile to %s.prof", base)
+        except OSError as e:
+            logger.error("Could not save request profile to %s: %s", directory, e)
+
+    def server_timing(self) -> str:
+        """
+        Returns the value of a `Server-Timing` header with the duration of every stage,
+        the total time and the peak memory allocated during the request.
+        """
+        with self._lock:
+            stages = list(self.stages.items())
+        metrics = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in stages]
+        metrics.append(f"total;dur={self.total * 1000:.2f}")
+        metrics.append(f'memory;desc="peak {self.memory_peak / 1024:.1f} KiB"')
+        return ", ".join(metrics)
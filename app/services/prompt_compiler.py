@@ -0,0 +1,232 @@
+import re
+import math
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.template_service import EXAMPLE_PATTERN, TemplateDoc, TemplateRegistry, template_registry
+
+CHARS_PER_TOKEN = 4
+# How much of the prose before an example is indexed along with it
+EXAMPLE_CONTEXT_CHARS = 400
+
+TOKEN_PATTERN = re.compile(r'[A-Za-z][a-z0-9]*|[A-Z]+(?![a-z])|[0-9]+')
+STOPWORDS = frozenset("""
+    a an and are as at be by can diagram diagrams do for from has have how i in is it its
+    mermaid my of on or our that the their this to use used using we with you your
+""".split())
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens of a text at about four characters per token.
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lower-case search terms, breaking up camelCase identifiers and
+    dropping stopwords and plural endings.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text):
+        token = token.lower()
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        if len(token) > 1 and token not in STOPWORDS:
+            terms.append(token)
+    return terms
+
+
+class BM25Index:
+    """
+    Okapi BM25 index over a small set of documents.
+
+    Args:
+        documents (List[List[str]]): The terms of every document.
+        k1 (float): Term frequency saturation.
+        b (float): Document length normalization.
+    """
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_frequencies = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        document_frequencies = Counter(term for document in documents for term in set(document))
+        count = len(documents)
+        self.idf = {term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+                    for term, frequency in document_frequencies.items()}
+
+    def scores(self, query: List[str]) -> List[float]:
+        """
+        Scores every document against the query terms.
+
+        Returns:
+            List[float]: The score of each document, in index order.
+        """
+        scores = []
+        terms = [term for term in set(query) if term in self.idf]
+        for frequencies, length in zip(self.term_frequencies, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.average_length) if self.average_length else self.k1
+            for term in terms:
+                frequency = frequencies.get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+
+
+@dataclass(frozen=True)
+class _TemplateIndex:
+    doc: TemplateDoc
+    examples: List[str]
+    index: BM25Index
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """
+    The syntax guide selected for a template and an input.
+
+    Attributes:
+        template (str): The template name.
+        syntax (str): The syntax section of the document.
+        example_text (str): The selected examples, separated by blank lines.
+        examples (List[int]): The positions in the document of the selected examples.
+        total_examples (int): The number of examples in the document.
+        static (bool): Whether the selection is the same for every input (no budget, or
+            no examples to choose from), so that the examples can be part of a cached prefix.
+    """
+    template: str
+    syntax: str
+    example_text: str
+    examples: List[int] = field(default_factory=list)
+    total_examples: int = 0
+    static: bool = False
+
+    @property
+    def text(self) -> str:
+        """The syntax section and selected examples, formatted like `TemplateDoc.text`."""
+        return f"Syntax:\n{self.syntax}\n\nExamples:\n{self.example_text}"
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+class PromptCompiler:
+    """
+    Builds the syntax guide of a prompt from only the parts of a template's syntax
+    document that are relevant to the user input.
+
+    The syntax section is always included. The `mermaid-example` blocks, each indexed
+    together with the prose leading up to it in the document, are ranked by BM25
+    relevance to the input; the best ones are added while they fit into the token budget,
+    up to `max_examples`. At least one example is always included. Selected examples keep
+    their document order. With a budget of 0 the whole guide is used.
+
+    Indexes are built once per document and rebuilt when the registry reloads it.
+
+    Args:
+        registry (TemplateRegistry): The registry providing the syntax documents.
+        token_budget (Optional[int]): The token budget of the guide. Defaults to
+            `settings.PROMPT_TOKEN_BUDGET`.
+        max_examples (Optional[int]): The maximum number of examples. Defaults to
+            `settings.PROMPT_MAX_EXAMPLES`.
+    """
+
+    def __init__(self, registry: TemplateRegistry, token_budget: Optional[int] = None,
+                 max_examples: Optional[int] = None):
+        self.registry = registry
+        self._token_budget = token_budget
+        self._max_examples = max_examples
+        self._indexes: Dict[str, _TemplateIndex] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def token_budget(self) -> int:
+        return settings.PROMPT_TOKEN_BUDGET if self._token_budget is None else self._token_budget
+
+    @property
+    def max_examples(self) -> int:
+        return settings.PROMPT_MAX_EXAMPLES if self._max_examples is None else self._max_examples
+
+    @property
+    def version(self) -> str:
+        """Identifies the compiler settings, so that cached results follow them."""
+        return f"budget={self.token_budget},examples={self.max_examples}"
+
+    def _template_index(self, doc: TemplateDoc) -> _TemplateIndex:
+        cached = self._indexes.get(doc.name)
+        if cached is not None and cached.doc is doc:
+            return cached
+
+        examples, documents = [], []
+        previous_end = 0
+        for match in EXAMPLE_PATTERN.finditer(doc.content):
+            context = doc.content[max(previous_end, match.start() - EXAMPLE_CONTEXT_CHARS):match.start()]
+            examples.append(match.group(1))
+            documents.append(tokenize(context + "\n" + match.group(1)))
+            previous_end = match.end()
+        template_index = _TemplateIndex(doc=doc, examples=examples, index=BM25Index(documents))
+        with self._lock:
+            self._indexes[doc.name] = template_index
+        return template_index
+
+    def rank(self, template: str, input: str) -> List[Tuple[int, float]]:
+        """
+        Ranks the examples of a template by relevance to the input.
+
+        Returns:
+            List[Tuple[int, float]]: (position in the document, score), best first.
+        """
+        template_index = self._template_index(self.registry.get(template))
+        scores = template_index.index.scores(tokenize(input or ""))
+        return sorted(enumerate(scores), key=lambda item: (-item[1], item[0]))
+
+    def compile(self, template: str, input: str) -> CompiledPrompt:
+        """
+        Selects the syntax guide for a template and an input.
+
+        Args:
+            template (str): The template name (case-insensitive).
+            input (str): The user input.
+
+        Returns:
+            CompiledPrompt: The selected guide.
+
+        Raises:
+            ValueError: If no syntax document exists for the template.
+        """
+        doc = self.registry.get(template)
+        template_index = self._template_index(doc)
+        examples = template_index.examples
+        if self.token_budget <= 0 or not examples:
+            return CompiledPrompt(template=doc.name, syntax=doc.syntax, example_text="\n\n".join(examples),
+                                  examples=list(range(len(examples))), total_examples=len(examples), static=True)
+
+        header = f"Syntax:\n{doc.syntax}\n\nExamples:\n"
+        used = estimate_tokens(header)
+        selected: List[int] = []
+        for position, _ in self.rank(doc.name, input):
+            if len(selected) >= max(self.max_examples, 1):
+                break
+            cost = estimate_tokens(examples[position] + "\n\n")
+            if selected and used + cost > self.token_budget:
+                continue
+            selected.append(position)
+            used += cost
+        selected.sort()
+
+        return CompiledPrompt(template=doc.name, syntax=doc.syntax,
+                              example_text="\n\n".join(examples[position] for position in selected),
+                              examples=selected, total_examples=len(examples))
+
+
+prompt_compiler = PromptCompiler(template_registry)
@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+import logging
+from typing import Dict
+
+from app.config import settings
+from app.rendering.renderer import UnsupportedDiagramError, render_svg
+from app.services.cache_service import ResultCache
+from app.services.metrics_service import stage_timer
+
+logger = logging.getLogger(__name__)
+
+render_cache = ResultCache(maxsize=settings.RENDER_CACHE_MAXSIZE,
+                           ttl=settings.RENDER_CACHE_TTL,
+                           enabled=settings.RENDER_CACHE_ENABLED)
+
+
+def render_key(code: str) -> str:
+    """The cache key of the SVG of Mermaid code: a hex digest of the code."""
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+def render_diagram(code: str) -> str:
+    """
+    Renders Mermaid code as SVG. Renderings are cached by the hash of the code, so
+    rendering the same diagram again (e.g. a cached generation, or an export of a diagram
+    just generated) is a lookup.
+
+    Args:
+        code (str): The Mermaid code.
+
+    Returns:
+        str: The SVG document.
+
+    Raises:
+        UnsupportedDiagramError: If the diagram type cannot be rendered server-side.
+    """
+    key = render_key(code)
+    cached = render_cache.get(key)
+    if cached is not None:
+        return cached["svg"]
+    with stage_timer("render"):
+        svg = render_svg(code)
+    render_cache.set(key, {"svg": svg})
+    return svg
+
+
+async def render_fields(code: str) -> Dict[str, str]:
+    """
+    Renders Mermaid code off the event loop for a JSON response.
+
+    Returns:
+        Dict[str, str]: `svg` with the SVG document, or `svgError` with the reason the
+            diagram could not be rendered.
+    """
+    try:
+        return {"svg": await asyncio.to_thread(render_diagram, code)}
+    except UnsupportedDiagramError as e:
+        return {"svgError": str(e)}
+    except Exception as e:
+        logger.error("Error rendering diagram: %s", e, exc_info=True)
+        return {"svgError": "Failed to render the diagram"}
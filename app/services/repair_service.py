@@ -0,0 +1,130 @@
+import re
+import logging
+from typing import Awaitable, Callable, Dict, List, Set
+
+from app.config import settings
+from app.llm.prompt import Prompt
+from app.services.metrics_service import count_repair
+from app.utils.mermaid_validator import ValidationResult, validate_diagram
+
+logger = logging.getLogger(__name__)
+
+REPAIR_LINE = re.compile(r'^(\d+):\s?(.*)$')
+
+
+def _repair_system_prompt(template: str) -> str:
+    return f"""You fix the invalid lines of a Mermaid {template.lower()} diagram.
+You are given the invalid lines with their line numbers and the reason each one is invalid.
+Reply only with the fixed lines, one per line, written as `<line number>: <fixed line>` with the original indentation.
+To replace a line with several lines, repeat its line number on each of them.
+To delete a line, reply with its line number followed by a colon and nothing else.
+Do not reply with any other lines, explanations or code fences."""
+
+
+def build_repair_prompt(code: str, result: ValidationResult) -> Prompt:
+    """
+    Builds the prompt to fix the invalid lines of a diagram. Only the invalid lines and
+    the reasons are sent, not the whole diagram.
+
+    Args:
+        code (str): The Mermaid code.
+        result (ValidationResult): The validation result of the code.
+
+    Returns:
+        Prompt: The prompt.
+    """
+    messages: Dict[int, List[str]] = {}
+    texts: Dict[int, str] = {}
+    for error in result.errors:
+        messages.setdefault(error.line, []).append(error.message)
+        texts[error.line] = error.text
+    invalid = "\n".join(f"{line}: {texts[line]}\n    Error: {'; '.join(messages[line])}" for line in sorted(messages))
+    end_line = len(code.split('\n')) + 1
+    user = (f"Invalid lines:\n{invalid}\n\n"
+            f"Lines that close a block at the end of the diagram can be added as line {end_line}.")
+    return Prompt(system=_repair_system_prompt(result.template), user=user)
+
+
+def parse_repair(response: str, lines: Set[int]) -> Dict[int, List[str]]:
+    """
+    Reads the fixed lines from the response to a repair prompt.
+
+    Args:
+        response (str): The LLM response.
+        lines (Set[int]): The line numbers that may be fixed; others are ignored.
+
+    Returns:
+        Dict[int, List[str]]: The replacement lines by line number. An empty replacement
+            deletes the line.
+    """
+    fixes: Dict[int, List[str]] = {}
+    for line in response.split('\n'):
+        match = REPAIR_LINE.match(line.strip('\r').lstrip())
+        if match and int(match.group(1)) in lines:
+            fixes.setdefault(int(match.group(1)), []).append(match.group(2).rstrip())
+    return fixes
+
+
+def merge_repair(code: str, fixes: Dict[int, List[str]]) -> str:
+    """
+    Replaces lines of a diagram with their fixes. Fixes for the line after the last line
+    are appended.
+    """
+    lines = code.split('\n')
+    merged: List[str] = []
+    for number, line in enumerate(lines + [None], start=1):
+        if number in fixes:
+            merged.extend(fix for fix in fixes[number] if fix.strip())
+        elif line is not None:
+            merged.append(line)
+    return '\n'.join(merged)
+
+
+async def repair_diagram(code: str, template: str, call: Callable[[Prompt], Awaitable[str]]) -> str:
+    """
+    Validates a diagram and, if lines are invalid, asks the LLM to fix just those lines
+    and merges the fixes back, up to `REPAIR_MAX_ATTEMPTS` times. A fix is only kept if
+    the diagram has fewer invalid lines afterwards.
+
+    Diagrams without the header of their template, or with more than `REPAIR_MAX_LINES`
+    invalid lines, are returned as they are: they need to be generated again rather than
+    repaired.
+
+    Args:
+        code (str): The Mermaid code.
+        template (str): The template the diagram was generated for.
+        call: Sends a repair prompt to the LLM and returns its response.
+
+    Returns:
+        str: The repaired code, or the code as it was if it is valid or could not be repaired.
+    """
+    result = validate_diagram(code, template)
+    if result.valid:
+        return code
+    invalid_lines = {error.line for error in result.errors}
+    logger.info("Invalid %s diagram, lines %s", template, sorted(invalid_lines))
+    if not result.header_ok or len(invalid_lines) > settings.REPAIR_MAX_LINES:
+        count_repair(template, 'skipped')
+        return code
+
+    errors_before = len(result.errors)
+    for _ in range(settings.REPAIR_MAX_ATTEMPTS):
+        try:
+            response = await call(build_repair_prompt(code, result))
+        except Exception as e:
+            logger.warning("Repair of a %s diagram failed: %s", template, e)
+            break
+        end_line = len(code.split('\n')) + 1
+        fixes = parse_repair(response, {error.line for error in result.errors} | {end_line})
+        repaired = merge_repair(code, fixes)
+        repaired_result = validate_diagram(repaired, template)
+        if len(repaired_result.errors) >= len(result.errors):
+            break
+        code, result = repaired, repaired_result
+        if result.valid:
+            break
+
+    outcome = 'repaired' if result.valid else 'improved' if len(result.errors) < errors_before else 'failed'
+    count_repair(template, outcome)
+    logger.info("Repair of a %s diagram: %s", template, outcome)
+    return code
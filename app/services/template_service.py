@@ -1,29 +1,194 @@
 import os
 import re
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 
-def read_syntax_file(template: str) -> str:
-    syntax_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'syntax')
-    file_path = os.path.join(syntax_dir, f"{template.lower()}.md")
+logger = logging.getLogger(__name__)
+
+SYNTAX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'syntax')
+
+SYNTAX_SECTION_PATTERN = re.compile(r'## Syntax\n\n(.*?)\n\n', re.DOTALL)
+EXAMPLE_PATTERN = re.compile(r'```mermaid-example\n(.*?)```', re.DOTALL)
+
+
+@dataclass(frozen=True)
+class TemplateDoc:
+    """
+    A parsed syntax document for a single diagram template.
+
+    Attributes:
+        name (str): The template name, e.g. "FLOWCHART".
+        path (str): The path of the markdown file the document was parsed from.
+        mtime_ns (int): The modification time of the file when it was parsed.
+        content (str): The raw markdown content.
+        syntax (str): The text of the "## Syntax" section.
+        examples (List[str]): The bodies of all ```mermaid-example blocks.
+        text (str): The syntax and examples rendered for use in a prompt.
+    """
+    name: str
+    path: str
+    mtime_ns: int
+    content: str
+    syntax: str
+    examples: List[str] = field(default_factory=list)
+    text: str = ""
+
+
+def _read_markdown(file_path: str) -> str:
     try:
         with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            
-        # Extract the syntax section
-        syntax_section = re.search(r'## Syntax\n\n(.*?)\n\n', content, re.DOTALL)
-        if syntax_section:
-            syntax = syntax_section.group(1)
-        else:
-            syntax = "Syntax section not found in the file."
-        
-        # Extract examples
-        examples = re.findall(r'```mermaid-example\n(.*?)```', content, re.DOTALL)
-        
-        return f"Syntax:\n{syntax}\n\nExamples:\n" + "\n\n".join(examples)
-    except FileNotFoundError:
-        raise ValueError(f"Syntax file not found for template: {template}")
-    except Exception as e:
-        raise ValueError(f"Error reading syntax file for template {template}: {str(e)}")
-
-def get_templates() -> list:
-    syntax_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'syntax')
-    return [file[:-3].upper() for file in os.listdir(syntax_dir) if file.endswith('.md')]
\ No newline at end of file
+            return file.read()
+    except UnicodeDecodeError:
+        # If UTF-8 fails, try with ISO-8859-1 encoding
+        with open(file_path, 'r', encoding='iso-8859-1') as file:
+            return file.read()
+
+
+def parse_syntax_doc(name: str, file_path: str, mtime_ns: int) -> TemplateDoc:
+    """
+    Parses a syntax markdown file into a TemplateDoc.
+
+    Args:
+        name (str): The template name.
+        file_path (str): The path of the markdown file.
+        mtime_ns (int): The modification time of the file.
+
+    Returns:
+        TemplateDoc: The parsed document.
+    """
+    content = _read_markdown(file_path)
+
+    syntax_section = SYNTAX_SECTION_PATTERN.search(content)
+    if syntax_section:
+        syntax = syntax_section.group(1)
+    else:
+        syntax = "Syntax section not found in the file."
+
+    examples = EXAMPLE_PATTERN.findall(content)
+    text = f"Syntax:\n{syntax}\n\nExamples:\n" + "\n\n".join(examples)
+
+    return TemplateDoc(name=name, path=file_path, mtime_ns=mtime_ns, content=content,
+                       syntax=syntax, examples=examples, text=text)
+
+
+class TemplateRegistry:
+    """
+    In-memory registry of the parsed syntax documents in the syntax directory.
+
+    Every document is parsed once when the registry is loaded. Afterwards a lookup
+    only costs a stat of the file and the directory; a document is re-parsed when its
+    mtime changes and the directory is re-scanned when files are added or removed.
+
+    Args:
+        syntax_dir (str): The directory containing the `<template>.md` files.
+    """
+
+    def __init__(self, syntax_dir: str = SYNTAX_DIR):
+        self.syntax_dir = syntax_dir
+        self._docs: Dict[str, TemplateDoc] = {}
+        self._dir_mtime_ns: Optional[int] = None
+        self._version = ""
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """
+        (Re)parses every syntax document in the syntax directory.
+
+        Raises:
+            FileNotFoundError: If the syntax directory does not exist.
+        """
+        if not os.path.isdir(self.syntax_dir):
+            raise FileNotFoundError(f"The syntax directory does not exist at the expected path: {self.syntax_dir}")
+
+        with self._lock:
+            dir_mtime_ns = os.stat(self.syntax_dir).st_mtime_ns
+            docs = {}
+            for file in sorted(os.listdir(self.syntax_dir)):
+                if not file.endswith('.md'):
+                    continue
+                name = file[:-3].upper()
+                file_path = os.path.join(self.syntax_dir, file)
+                mtime_ns = os.stat(file_path).st_mtime_ns
+                current = self._docs.get(name)
+                if current is not None and current.mtime_ns == mtime_ns:
+                    docs[name] = current
+                else:
+                    docs[name] = parse_syntax_doc(name, file_path, mtime_ns)
+            self._docs = docs
+            self._dir_mtime_ns = dir_mtime_ns
+            self._update_version()
+        logger.info("Loaded %d syntax documents from %s", len(self._docs), self.syntax_dir)
+
+    def _update_version(self) -> None:
+        digest = hashlib.sha256()
+        for name, doc in sorted(self._docs.items()):
+            digest.update(f"{name}:{doc.mtime_ns}\n".encode())
+        self._version = digest.hexdigest()[:16]
+
+    def _ensure_fresh(self) -> None:
+        try:
+            dir_mtime_ns = os.stat(self.syntax_dir).st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime_ns = None
+        if self._dir_mtime_ns is None or dir_mtime_ns != self._dir_mtime_ns:
+            self.load()
+
+    def _refresh_doc(self, doc: TemplateDoc) -> TemplateDoc:
+        try:
+            mtime_ns = os.stat(doc.path).st_mtime_ns
+        except FileNotFoundError:
+            self.load()
+            return self._docs.get(doc.name, doc)
+        if mtime_ns == doc.mtime_ns:
+            return doc
+
+        with self._lock:
+            current = self._docs.get(doc.name)
+            if current is not None and current.mtime_ns == mtime_ns:
+                return current
+            logger.info("Reloading syntax document for template %s", doc.name)
+            refreshed = parse_syntax_doc(doc.name, doc.path, mtime_ns)
+            self._docs = {**self._docs, doc.name: refreshed}
+            self._update_version()
+            return refreshed
+
+    def names(self) -> List[str]:
+        """
+        Returns the names of all available templates.
+
+        Returns:
+            List[str]: The upper-case template names.
+        """
+        self._ensure_fresh()
+        return list(self._docs.keys())
+
+    def get(self, template: str) -> TemplateDoc:
+        """
+        Returns the parsed syntax document for a template.
+
+        Args:
+            template (str): The template name (case-insensitive).
+
+        Returns:
+            TemplateDoc: The parsed document.
+
+        Raises:
+            ValueError: If no syntax document exists for the template.
+        """
+        self._ensure_fresh()
+        doc = self._docs.get(template.upper()) if template else None
+        if doc is None:
+            raise ValueError(f"Invalid template: {template}. Available templates: {', '.join(self._docs.keys())}")
+        return self._refresh_doc(doc)
+
+    @property
+    def version(self) -> str:
+        """A short hash identifying the current set of syntax documents."""
+        self._ensure_fresh()
+        return self._version
+
+
+template_registry = TemplateRegistry()
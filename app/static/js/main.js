@@ -54,6 +54,7 @@ document.addEventListener('DOMContentLoaded', function() {
     return;
     }
 
+    chart = '';
     loadingIndicator.classList.remove('hidden');
     chartDiv.classList.add('hidden');
     initialContent.classList.add('hidden');
@@ -62,7 +63,7 @@ document.addEventListener('DOMContentLoaded', function() {
     submitButton.classList.add('opacity-50');
 
     try {
-    const response = await axios.post('/api/ask', {
+    const payload = {
         input,
         selectedTemplate,
         provider,
@@ -70,24 +71,23 @@ document.addEventListener('DOMContentLoaded', function() {
         apiKey,
         temperature,
         maxTokens
-    });
+    };
 
-    if (response.data.text) {
-        chart = response.data.text;
-        // Clear previous content
-        chartDiv.innerHTML = '';
-        // Create a new div for Mermaid
-        const mermaidDiv = document.createElement('div');
-        mermaidDiv.className = 'mermaid';
-        mermaidDiv.textContent = chart;
-        chartDiv.appendChild(mermaidDiv);
-        // Re-run Mermaid rendering
-        mermaid.init(undefined, mermaidDiv);
-        chartDiv.classList.remove('hidden');
-        exportOptions.classList.remove('hidden');
+    if (window.ReadableStream && window.TextDecoder) {
+        await streamDiagram(payload);
     } else {
+        const response = await axios.post('/api/ask', payload);
+        if (!response.data.text) {
+            throw new Error('No chart data received from the server');
+        }
+        renderChart(response.data.text);
+        rememberDiagram(response.data.diagramId);
+    }
+
+    if (!chart) {
         throw new Error('No chart data received from the server');
     }
+    exportOptions.classList.remove('hidden');
     } catch (error) {
     console.error('Error:', error);
     let errorMessage = 'An unexpected error occurred';
@@ -117,6 +117,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     showToast('error', errorTitle, errorMessage);
+    chartDiv.classList.add('hidden');
     initialContent.classList.remove('hidden');
     } finally {
     loadingIndicator.classList.add('hidden');
@@ -125,6 +126,124 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     });
 
+    // Streams a generation from /api/ask/stream, showing the raw output while it arrives
+    // and rendering the diagram as soon as the server has extracted it.
+    async function streamDiagram(payload) {
+        const response = await fetch('/api/ask/stream', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(payload)
+        });
+
+        if (!response.ok) {
+            let data = await response.text();
+            try {
+                data = JSON.parse(data);
+            } catch (e) {
+                // Keep the plain text body
+            }
+            const error = new Error('Request failed');
+            error.response = {status: response.status, data};
+            throw error;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let rawOutput = '';
+        let preview = null;
+
+        const handleEvent = (event) => {
+            if (event.type === 'token') {
+                rawOutput += event.text;
+                if (!preview) {
+                    loadingIndicator.classList.add('hidden');
+                    chartDiv.innerHTML = '';
+                    preview = document.createElement('pre');
+                    preview.className = 'stream-preview';
+                    chartDiv.appendChild(preview);
+                    chartDiv.classList.remove('hidden');
+                }
+                preview.textContent = rawOutput;
+            } else if (event.type === 'code' || event.type === 'done') {
+                if (event.text && event.text !== chart) {
+                    renderChart(event.text);
+                }
+                if (event.type === 'done') {
+                    rememberDiagram(event.diagramId);
+                }
+            } else if (event.type === 'error') {
+                const error = new Error(event.error);
+                error.response = {status: event.status, data: {error: event.error}};
+                throw error;
+            }
+        };
+
+        while (true) {
+            const {value, done} = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, {stream: true});
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (line.trim()) {
+                    handleEvent(JSON.parse(line));
+                }
+            }
+        }
+        if (buffer.trim()) {
+            handleEvent(JSON.parse(buffer));
+        }
+    }
+
+    // Puts the id of the stored diagram in the address, so reloading the page or sharing
+    // the link shows it again without generating it.
+    function rememberDiagram(diagramId) {
+        if (diagramId && window.history.replaceState) {
+            window.history.replaceState(null, '', `?d=${diagramId}`);
+        }
+    }
+
+    async function loadDiagram(diagramId) {
+        initialContent.classList.add('hidden');
+        loadingIndicator.classList.remove('hidden');
+        try {
+            const response = await fetch(`/d/${encodeURIComponent(diagramId)}`);
+            if (!response.ok) {
+                throw new Error(`Error ${response.status}`);
+            }
+            renderChart(await response.text());
+            exportOptions.classList.remove('hidden');
+        } catch (error) {
+            console.error('Error:', error);
+            loadingIndicator.classList.add('hidden');
+            initialContent.classList.remove('hidden');
+            showToast('warning', 'Diagram not found', 'The diagram of this link is no longer stored.');
+        }
+    }
+
+    const sharedDiagram = new URLSearchParams(window.location.search).get('d');
+    if (sharedDiagram) {
+        loadDiagram(sharedDiagram);
+    }
+
+    function renderChart(code) {
+        chart = code;
+        loadingIndicator.classList.add('hidden');
+        // Clear previous content
+        chartDiv.innerHTML = '';
+        // Create a new div for Mermaid
+        const mermaidDiv = document.createElement('div');
+        mermaidDiv.className = 'mermaid';
+        mermaidDiv.textContent = chart;
+        chartDiv.appendChild(mermaidDiv);
+        // Re-run Mermaid rendering
+        mermaid.init(undefined, mermaidDiv);
+        chartDiv.classList.remove('hidden');
+    }
+
         function getSelectedModel() {
             const provider = document.getElementById('llmProvider').value;
             if (['huggingface-openai', 'huggingface-text', 'ollama'].includes(provider)) {
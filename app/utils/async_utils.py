@@ -0,0 +1,34 @@
+import asyncio
+from typing import AsyncIterator, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+def iterate_async(agen: AsyncIterator[T]) -> Iterator[T]:
+    """
+    Drives an async iterator from synchronous code, e.g. a streamed Flask response.
+
+    The iterator runs on a private event loop in the calling thread, which is closed
+    once the iterator is exhausted or the consumer stops iterating.
+
+    Args:
+        agen (AsyncIterator[T]): The async iterator to consume.
+
+    Yields:
+        T: The items produced by the async iterator.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        try:
+            aclose = getattr(agen, "aclose", None)
+            if aclose is not None:
+                loop.run_until_complete(aclose())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
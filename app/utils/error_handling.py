@@ -1,13 +1,35 @@
+from typing import Tuple
+from pydantic import ValidationError
 from fastapi import HTTPException
-from openai import AuthenticationError, RateLimitError, BadRequestError
+from openai import AuthenticationError, RateLimitError, BadRequestError, APITimeoutError
 from flask import jsonify
+from app.utils.mermaid_utils import AuthError
+from app.llm.router import ProviderUnavailableError
+from app.llm.rate_limiter import RateLimitQueueError
 
-def handle_llm_error(e: Exception) -> HTTPException:
-    if isinstance(e, AuthenticationError):
-        return jsonify({"error": "Authentication failed. Please check your API key."}), 401
-    elif isinstance(e, RateLimitError):
-        return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
+def describe_llm_error(e: Exception) -> Tuple[str, int]:
+    """
+    Maps an exception raised while generating a diagram to a user-facing message and HTTP status.
+    """
+    if isinstance(e, (AuthenticationError, AuthError)):
+        return "Authentication failed. Please check your API key.", 401
+    elif isinstance(e, (RateLimitError, RateLimitQueueError)):
+        return "Rate limit exceeded. Please try again later.", 429
     elif isinstance(e, BadRequestError):
-        return jsonify({"error": f"Bad request: {str(e)}"}), 400
+        return f"Bad request: {str(e)}", 400
+    elif isinstance(e, ProviderUnavailableError):
+        return str(e), 503
+    elif isinstance(e, (TimeoutError, APITimeoutError)):
+        return "The model did not respond in time. Please try again later.", 504
     else:
-        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+        return f"An unexpected error occurred: {str(e)}", 500
+
+def describe_validation_error(e: ValidationError) -> str:
+    """
+    Formats the errors of a request model validation as a single line.
+    """
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())
+
+def handle_llm_error(e: Exception) -> HTTPException:
+    message, status = describe_llm_error(e)
+    return jsonify({"error": message}), status
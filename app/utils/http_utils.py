@@ -0,0 +1,54 @@
+import re
+from typing import Optional
+
+# For responses whose URL changes whenever their content does
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# For responses that may change at the same URL: cached, but revalidated with their ETag
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+QUALITY = re.compile(r'(?:^|;)\s*q=([0-9.]+)')
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """
+    Tells whether a client accepts gzip-encoded responses.
+
+    Args:
+        accept_encoding (Optional[str]): The `Accept-Encoding` request header.
+
+    Returns:
+        bool: True if gzip, or any coding (`*`), is accepted with a nonzero quality.
+    """
+    qualities = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, parameters = part.partition(';')
+        match = QUALITY.search(parameters)
+        try:
+            qualities[coding.strip().lower()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            qualities[coding.strip().lower()] = 0.0
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Tells whether an `If-None-Match` request header matches an entity tag, comparing
+    weakly as RFC 9110 requires for this header.
+
+    Args:
+        if_none_match (Optional[str]): The `If-None-Match` request header.
+        etag (str): The quoted entity tag of the current representation.
+
+    Returns:
+        bool: True if the client's copy is current and a 304 can be sent.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == opaque:
+            return True
+    return False
@@ -25,7 +25,7 @@ def set_llm(selected_provider: str, selected_model: str, api_key: str = None) ->
     Returns:
         An instance of the selected LLM, or None if instantiation fails.
     """
-    logger.debug(f"Setting LLM for provider: {selected_provider}, model: {selected_model}")
+    logger.debug("Setting LLM for provider: %s, model: %s", selected_provider, selected_model)
 
     if not selected_provider:
         logger.error("Error: No LLM provider selected")
@@ -49,15 +49,17 @@ def set_llm(selected_provider: str, selected_model: str, api_key: str = None) ->
             if not selected_model.startswith('gemini-'):
                 selected_model = f'gemini-{selected_model}'
 
-        logger.debug(f"Attempting to get LLM with provider={selected_provider}, model={selected_model}, kwargs={kwargs}")
+        # Never log the kwargs themselves, they contain the API key
+        logger.debug("Attempting to get LLM with provider=%s, model=%s, api_key provided: %s",
+                     selected_provider, selected_model, 'api_key' in kwargs)
         selected_llm = get_llm(provider=selected_provider, model=selected_model, **kwargs)
         
         if not hasattr(selected_llm, 'get_response'):
-            logger.error(f"The object returned for {selected_provider} does not have a 'get_response' method.")
+            logger.error("The object returned for %s does not have a 'get_response' method.", selected_provider)
             raise ValueError(f"The object returned for {selected_provider} does not have a 'get_response' method.")
         
-        logger.debug(f"Successfully created LLM instance for provider: {selected_provider}, model: {selected_model}")
+        logger.debug("Successfully created LLM instance for provider: %s, model: %s", selected_provider, selected_model)
         return selected_llm
     except Exception as e:
-        logger.exception(f"Error creating LLM instance: {str(e)}")
+        logger.exception("Error creating LLM instance: %s", e)
         return None
\ No newline at end of file
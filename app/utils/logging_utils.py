@@ -0,0 +1,112 @@
+import re
+import sys
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Any, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Secrets that may end up in log messages: provider API keys, bearer tokens and
+# api_key fields of dictionaries, keyword arguments and query strings
+SECRET_PATTERNS = [
+    (re.compile(r'\b(sk-[A-Za-z0-9_-]{4})[A-Za-z0-9_-]{8,}'), r'\1***'),
+    (re.compile(r'\b(hf_)[A-Za-z0-9]{8,}'), r'\1***'),
+    (re.compile(r'\b(AIza)[0-9A-Za-z_-]{20,}'), r'\1***'),
+    (re.compile(r'(Bearer\s+)[A-Za-z0-9._~+/=-]{8,}', re.IGNORECASE), r'\1***'),
+    (re.compile(r'''(api[_-]?key['"]?\s*[:=]\s*['"]?)[^'"\s,&}]+''', re.IGNORECASE), r'\1***'),
+]
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def redact(text: str) -> str:
+    """
+    Replaces API keys and other secrets in a text with `***`.
+    """
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def truncate(text: str, max_chars: Optional[int] = None) -> str:
+    """
+    Shortens a text to its first `max_chars` characters (`LOG_MAX_PAYLOAD_CHARS` by
+    default) and notes how many were left out.
+    """
+    max_chars = settings.LOG_MAX_PAYLOAD_CHARS if max_chars is None else max_chars
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [{len(text) - max_chars} more characters]"
+
+
+class RedactingFormatter(logging.Formatter):
+    """
+    Formats records with truncated messages and without secrets. It runs on the thread
+    of the queue listener, so the request that logged does not pay for it.
+    """
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = truncate(record.message)
+        return redact(super().formatMessage(record))
+
+    def formatException(self, ei) -> str:
+        return redact(super().formatException(ei))
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock handler formats the message on the logging thread before queueing it;
+    # the listener is in the same process, so the record is passed on as it is
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def log_payload(log: logging.Logger, label: str, payload: Any) -> None:
+    """
+    Logs a large payload, like a raw model response, at DEBUG level. Only a
+    `LOG_PAYLOAD_SAMPLE_RATE` fraction of the payloads is logged, truncated to
+    `LOG_MAX_PAYLOAD_CHARS`.
+
+    Args:
+        log (logging.Logger): The logger to log to.
+        label (str): What the payload is, e.g. "Raw LLM output".
+        payload (Any): The payload.
+    """
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+    rate = settings.LOG_PAYLOAD_SAMPLE_RATE
+    if rate < 1 and random.random() >= rate:
+        return
+    log.debug("%s: %s", label, payload)
+
+
+def configure_logging(level: Optional[str] = None) -> None:
+    """
+    Sets up the root logger to hand records to a queue, which a background listener
+    formats and writes to stderr, so that logging does not block request handling.
+
+    Calling it again only changes the level.
+
+    Args:
+        level (Optional[str]): The log level. Defaults to `LOG_LEVEL`.
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel((level or settings.LOG_LEVEL).upper())
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(RedactingFormatter(settings.LOG_FORMAT))
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
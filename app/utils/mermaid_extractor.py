@@ -0,0 +1,265 @@
+import re
+from typing import List, Optional
+
+# The supported diagram types
+DIAGRAM_TYPES = (
+    'class', 'erDiagram', 'flowchart', 'mindmap', 'sequenceDiagram', 'stateDiagram', 'timeline',
+    'journey', 'gantt', 'block-beta', 'quadrantChart', 'sankey-beta', 'requirementDiagram', 'zenuml',
+)
+DIAGRAM_TYPE_PATTERN = re.compile('|'.join(re.escape(t) for t in DIAGRAM_TYPES), re.IGNORECASE)
+MAX_DIAGRAM_TYPE_LENGTH = max(len(t) for t in DIAGRAM_TYPES)
+
+# Opening fence of a ```mermaid ... ``` (or bare ``` ... ```) block
+OPEN_FENCE_PATTERN = re.compile(r'```(?:mermaid)?\n', re.IGNORECASE)
+MAX_OPEN_FENCE_LENGTH = len('```mermaid\n')
+CLOSE_FENCE = '\n```'
+
+ARROW_LABEL_PATTERN = re.compile(r'\|(.*?)\|>')
+KEEP_NON_BLANK_PATTERN = re.compile(r'^(mindmap|block-beta)', re.IGNORECASE)
+VALID_VERIFY_METHODS = ('analysis', 'demonstration', 'inspection', 'test')
+BLOCK_OPENERS = ('block:', 'subgraph')
+
+
+class _LineProcessor:
+    """
+    Cleans diagram lines one at a time: balances block/subgraph `end`s, fixes
+    requirement `verifymethod` values, removes `>` after `|label|` and, for mindmap
+    and block-beta diagrams, drops blank lines.
+    """
+
+    def __init__(self):
+        self.block_stack: List[str] = []
+        self.output: List[str] = []
+        self._keep_non_blank: Optional[bool] = None
+
+    def feed(self, line: str) -> List[str]:
+        stripped_line = line.strip()
+
+        if stripped_line.startswith(BLOCK_OPENERS):
+            self.block_stack.append(stripped_line)
+        elif stripped_line == 'end' and self.block_stack:
+            self.block_stack.pop()
+
+        if 'verifymethod:' in line:
+            parts = line.split('verifymethod:', 1)
+            verify_method = parts[1].strip().lower()
+            if verify_method not in VALID_VERIFY_METHODS:
+                verify_method = 'inspection'
+            line = f"{parts[0]}verifymethod: {verify_method}"
+
+        emitted = self._emit(line)
+
+        # If we're at the end of a block and there's no 'end', add it
+        if stripped_line and not stripped_line.startswith(BLOCK_OPENERS + ('end',)) and self.block_stack:
+            indent = len(line) - len(line.lstrip())
+            if indent <= len(self.block_stack[-1]) - len(self.block_stack[-1].lstrip()):
+                emitted += self._emit(' ' * indent + 'end')
+                self.block_stack.pop()
+        return emitted
+
+    def finish(self) -> List[str]:
+        # Add any remaining 'end' statements
+        emitted = []
+        while self.block_stack:
+            emitted += self._emit('end')
+            self.block_stack.pop()
+        return emitted
+
+    def _emit(self, line: str) -> List[str]:
+        if '|>' in line:
+            line = ARROW_LABEL_PATTERN.sub(r'|\1|', line)
+        if self._keep_non_blank is None:
+            # For mindmap and block-beta, keep all lines that are not completely blank
+            self._keep_non_blank = bool(KEEP_NON_BLANK_PATTERN.match(line))
+        if self._keep_non_blank and not line.strip():
+            return []
+        self.output.append(line)
+        return [line]
+
+
+class MermaidExtractor:
+    """
+    Incrementally extracts and cleans Mermaid code from an LLM response.
+
+    Chunks are fed as they arrive. Once the opening code fence and the diagram type
+    have been seen, each completed line is cleaned immediately, so extraction overlaps
+    with generation. The result is identical to extracting from the full response:
+
+    - the first ```mermaid (or bare ```) block that is closed is used; without one,
+      everything from the first diagram type keyword onwards is used;
+    - text before the first diagram type keyword is removed;
+    - lines are cleaned by `_LineProcessor`.
+
+    Lines returned by `feed` before `closed` is True are provisional: if the response
+    ends without a closing fence, `close` recomputes the result from the full text.
+
+    Attributes:
+        closed (bool): Whether the closing fence has been received, i.e. the code is final.
+    """
+
+    def __init__(self):
+        self._text = ''
+        self._processor = _LineProcessor()
+        self._phase = 'seek_fence'
+        self._fence_scan = 0
+        self._content_start = 0
+        self._close_scan = 0
+        self._type_scan = 0
+        self._line_start = 0
+        self._pending: List[str] = []
+        self._result: Optional[str] = None
+        self._eof = False
+        self.closed = False
+
+    @property
+    def lines(self) -> List[str]:
+        """The cleaned lines produced so far."""
+        return self._processor.output
+
+    @property
+    def code(self) -> str:
+        """The cleaned code produced so far."""
+        return '\n'.join(self._processor.output)
+
+    def feed(self, chunk: str) -> List[str]:
+        """
+        Adds a chunk of the response.
+
+        Args:
+            chunk (str): The next piece of the LLM response.
+
+        Returns:
+            List[str]: The cleaned lines completed by this chunk.
+        """
+        if self.closed or not chunk:
+            return []
+        self._text += chunk
+        return self._advance()
+
+    def _advance(self) -> List[str]:
+        emitted = []
+        if self._phase == 'seek_fence':
+            self._seek_fence()
+        if self._phase == 'fence_head':
+            emitted += self._fence_head()
+        if self._phase == 'fence_body':
+            emitted += self._fence_body()
+        return emitted
+
+    def close(self) -> str:
+        """
+        Signals the end of the response.
+
+        Returns:
+            str: The extracted Mermaid code.
+        """
+        if self._result is not None:
+            return self._result
+        if not self.closed:
+            # Matches held back because they could still grow are now complete
+            self._eof = True
+            self._advance()
+        if not self.closed:
+            # No closed code fence: use everything from the first diagram type keyword
+            diagram_match = DIAGRAM_TYPE_PATTERN.search(self._text)
+            if diagram_match:
+                code = self._text[diagram_match.start():].strip()
+            else:
+                code = self._text.strip()
+            self._processor = _LineProcessor()
+            self._process_code(code)
+            self.closed = True
+        self._result = self.code
+        return self._result
+
+    def _seek_fence(self) -> None:
+        text = self._text
+        match = OPEN_FENCE_PATTERN.search(text, self._fence_scan)
+        # A fence starting earlier than the match could still be incomplete at the end of the text
+        if match and (self._eof or match.start() + MAX_OPEN_FENCE_LENGTH <= len(text)):
+            self._content_start = self._close_scan = self._type_scan = match.end()
+            self._phase = 'fence_head'
+        else:
+            # Only the last few positions can still start a fence once more text arrives
+            tail = len(text) - MAX_OPEN_FENCE_LENGTH + 1
+            self._fence_scan = max(self._fence_scan, tail if match is None else min(match.start(), tail))
+
+    def _find_close(self) -> int:
+        close = self._text.find(CLOSE_FENCE, self._close_scan)
+        if close == -1:
+            self._close_scan = max(self._close_scan, len(self._text) - len(CLOSE_FENCE) + 1)
+        return close
+
+    def _fence_head(self) -> List[str]:
+        text = self._text
+        close = self._find_close()
+        if close != -1:
+            code = text[self._content_start:close].strip()
+            # Remove any leading text before the diagram type
+            diagram_match = DIAGRAM_TYPE_PATTERN.search(code)
+            if diagram_match:
+                code = code[diagram_match.start():]
+            return self._finish_fence(code)
+
+        diagram_match = DIAGRAM_TYPE_PATTERN.search(text, self._type_scan)
+        if diagram_match and (self._eof or diagram_match.start() + MAX_DIAGRAM_TYPE_LENGTH <= len(text)):
+            self._line_start = diagram_match.start()
+            self._phase = 'fence_body'
+        else:
+            tail = len(text) - MAX_DIAGRAM_TYPE_LENGTH + 1
+            self._type_scan = max(self._type_scan, tail if diagram_match is None else min(diagram_match.start(), tail))
+        return []
+
+    def _fence_body(self) -> List[str]:
+        text = self._text
+        emitted = []
+        while True:
+            newline = text.find('\n', self._line_start)
+            if newline == -1:
+                return emitted
+            lookahead = text[newline:newline + len(CLOSE_FENCE)]
+            if lookahead == CLOSE_FENCE:
+                last_line = text[self._line_start:newline]
+                tail = '\n'.join(self._pending + [last_line]).rstrip()
+                self._pending = []
+                return emitted + self._finish_fence(tail)
+            if CLOSE_FENCE.startswith(lookahead) and not self._eof:
+                # Could still become the closing fence
+                return emitted
+            line = text[self._line_start:newline]
+            self._line_start = newline + 1
+            if line.strip():
+                # Trailing whitespace is only stripped from the code's last non-blank line,
+                # so lines are held back until a later non-blank line arrives
+                for pending in self._pending:
+                    emitted += self._processor.feed(pending)
+                self._pending = [line]
+            else:
+                self._pending.append(line)
+
+    def _finish_fence(self, code: str) -> List[str]:
+        emitted = self._process_code(code)
+        self.closed = True
+        self._phase = 'closed'
+        return emitted
+
+    def _process_code(self, code: str) -> List[str]:
+        emitted = []
+        for line in code.split('\n'):
+            emitted += self._processor.feed(line)
+        return emitted + self._processor.finish()
+
+
+def extract_mermaid_code(response: str) -> str:
+    """
+    Extracts and cleans the Mermaid code from a complete LLM response.
+
+    Args:
+        response (str): The raw LLM response.
+
+    Returns:
+        str: The extracted Mermaid code.
+    """
+    extractor = MermaidExtractor()
+    extractor.feed(response)
+    return extractor.close()
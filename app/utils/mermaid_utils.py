@@ -1,15 +1,28 @@
+from typing import Dict, Any, AsyncIterator, List, Optional
+from functools import lru_cache
+import time
 import asyncio
-from typing import Dict, Any, List
-import os
 import logging
-import time
-import re
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, RetryError
-from openai import AuthenticationError, RateLimitError, BadRequestError
-import inspect
+from openai import APIError
 from io import BytesIO
-
-logging.basicConfig(level=logging.DEBUG)
+from app.config import settings
+from app.llm.retry_policy import Deadline, retry_policy, is_auth_error, retry_after, status_code
+from app.llm.rate_limiter import RateLimitQueueError, rate_limiter
+from app.llm.hedging import hedge_policy
+from app.llm.latency_tracker import latency_tracker
+from app.llm.router import ProviderUnavailableError, is_provider_failure, provider_router
+from app.services.template_service import template_registry
+from app.services.prompt_compiler import CompiledPrompt, estimate_tokens, prompt_compiler
+from app.services.cache_service import result_cache, make_cache_key
+from app.services.coalescing_service import single_flight
+from app.services.metrics_service import count_cache_lookup, count_error, metric_labels, observe_stage, stage_timer
+from app.services.render_service import render_diagram
+from app.services.repair_service import repair_diagram
+from app.llm.llm_manager import hash_api_key
+from app.llm.prompt import Prompt, prompt_text
+from app.utils.mermaid_extractor import MermaidExtractor, extract_mermaid_code
+from app.utils.llm_utils import set_llm
+from app.utils.logging_utils import log_payload
 
 logger = logging.getLogger(__name__)
 
@@ -26,166 +39,77 @@ def render_mermaid(mermaid_code: str) -> str:
     return mermaid_code
 
 def export_svg(chart: str, name: str) -> BytesIO:
-    # In a real-world scenario, you'd convert the Mermaid syntax to SVG here
-    # For now, we'll just return the chart string as bytes
-    return BytesIO(chart.encode())
+    """
+    Renders Mermaid code as an SVG file.
+
+    Args:
+        chart (str): The Mermaid code.
+        name (str): The name of the exported file.
+
+    Returns:
+        BytesIO: The UTF-8 encoded SVG document.
+
+    Raises:
+        UnsupportedDiagramError: If the diagram type cannot be rendered server-side.
+    """
+    return BytesIO(render_diagram(chart).encode())
 
 def copy_mermaid_code(chart: str) -> str:
     return chart
 
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # Move up one directory level to 'app'
-SYNTAX_DIR_LOC = os.path.join(BASE_DIR, 'syntax')  # Correct path to the syntax directory
+@lru_cache(maxsize=64)
+def _system_prompt(selected_template: str, syntax: str, static_examples: Optional[str]) -> str:
+    # Only depends on the template (and the examples, when they do not depend on the input),
+    # so every request for a template starts with the same, provider-cacheable prefix
+    examples = f"\n\nExamples:\n{static_examples}" if static_examples is not None else ""
+    return f"""Create a {selected_template} diagram in Mermaid syntax about the topic given in the user message.
 
-if not os.path.exists(SYNTAX_DIR_LOC):
-    raise FileNotFoundError(f"The syntax directory does not exist at the expected path: {SYNTAX_DIR_LOC}")
+Use the following syntax and examples as a guide:
 
-def get_available_templates() -> List[str]:
-    # List comprehension to get all .md files in SYNTAX_DIR_LOC, removing the extension and converting to uppercase
-    return [file[:-3].upper() for file in os.listdir(SYNTAX_DIR_LOC) if file.endswith('.md')]
+Syntax:
+{syntax}{examples}
 
-def read_syntax_file(template: str) -> str:
-    # Construct the full path to the desired syntax file
-    file_path = os.path.join(SYNTAX_DIR_LOC, f"{template.lower()}.md")
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            
-        # Extract the syntax section
-        syntax_section = re.search(r'## Syntax\n\n(.*?)\n\n', content, re.DOTALL)
-        if syntax_section:
-            syntax = syntax_section.group(1)
-        else:
-            syntax = "Syntax section not found in the file."
-        
-        # Extract examples
-        examples = re.findall(r'```mermaid-example\n(.*?)```', content, re.DOTALL)
-        
-        return f"Syntax:\n{syntax}\n\nExamples:\n" + "\n\n".join(examples)
-    except FileNotFoundError:
-        raise ValueError(f"Syntax file not found for template: {template}")
-    except UnicodeDecodeError:
-        # If UTF-8 fails, try with ISO-8859-1 encoding
-        try:
-            with open(file_path, 'r', encoding='iso-8859-1') as file:
-                content = file.read()
-            
-            # Extract the syntax section
-            syntax_section = re.search(r'## Syntax\n\n(.*?)\n\n', content, re.DOTALL)
-            if syntax_section:
-                syntax = syntax_section.group(1)
-            else:
-                syntax = "Syntax section not found in the file."
-            
-            # Extract examples
-            examples = re.findall(r'```mermaid-example\n(.*?)```', content, re.DOTALL)
-            
-            return f"Syntax:\n{syntax}\n\nExamples:\n" + "\n\n".join(examples)
-        except Exception as e:
-            raise ValueError(f"Error reading syntax file for template {template}: {str(e)}")
-        
-def extract_mermaid_code(response: str) -> str:
-    # Define the supported diagram types
-    diagram_types = r'(class|erDiagram|flowchart|mindmap|sequenceDiagram|stateDiagram|timeline|journey|gantt|block-beta|quadrantChart|sankey-beta|requirementDiagram|zenuml)'
-    
-    # Look for Mermaid code enclosed in ```mermaid ... ``` or just the content starting with a valid diagram type
-    mermaid_pattern = r'```(?:mermaid)?\n([\s\S]*?)\n```'
-    diagram_pattern = rf'({diagram_types})[\s\S]*'
-    
-    mermaid_match = re.search(mermaid_pattern, response, re.IGNORECASE)
-    if mermaid_match:
-        code = mermaid_match.group(1).strip()
-    else:
-        diagram_match = re.search(diagram_pattern, response, re.IGNORECASE)
-        if diagram_match:
-            code = diagram_match.group(0).strip()
-        else:
-            code = response.strip()
-    
-    # Remove any leading text before the diagram type
-    code = re.sub(r'^.*?(' + diagram_types + ')', r'\1', code, flags=re.IGNORECASE | re.DOTALL)
-    
-    # Split the code into lines
-    lines = code.split('\n')
-    processed_lines = []
-    block_stack = []
-    valid_verify_methods = ['analysis', 'demonstration', 'inspection', 'test']
-
-
-    for line in lines:
-        stripped_line = line.strip()
-        
-        if stripped_line.startswith(('block:', 'subgraph')):
-            block_stack.append(stripped_line)
-        elif stripped_line == 'end' and block_stack:
-            block_stack.pop()
-
-        if 'verifymethod:' in line:
-            # Split the line at 'verifymethod:'
-            parts = line.split('verifymethod:', 1)
-            # Get the verify method value
-            verify_method = parts[1].strip().lower()
-            # Check if the verify method is valid
-            if verify_method not in valid_verify_methods:
-                # If not valid, replace with a default value
-                verify_method = 'inspection'
-            # Reconstruct the line with the correct verify method
-            line = f"{parts[0]}verifymethod: {verify_method}"
-        
-        processed_lines.append(line)
-        
-        # If we're at the end of a block and there's no 'end', add it
-        if stripped_line and not stripped_line.startswith(('block:', 'subgraph', 'end')) and block_stack:
-            indent = len(line) - len(line.lstrip())
-            if indent <= len(block_stack[-1]) - len(block_stack[-1].lstrip()):
-                processed_lines.append(' ' * indent + 'end')
-                block_stack.pop()
-
-    # Add any remaining 'end' statements
-    while block_stack:
-        processed_lines.append('end')
-        block_stack.pop()
-
-    processed_code = '\n'.join(processed_lines)
-    
-    # Define a more permissive regex pattern for valid Mermaid syntax
-    valid_syntax_pattern = rf"""
-        ^\s*({diagram_types}|
-        %%\{{init:.*?\}}%%|
-        \w+.*|
-        \s*subgraph.*|
-        \s*end.*|
-        \s*class\s+.*|
-        \s*classDef\s+.*|
-        \s*\w+.*(?:-->|--|==|::|:|<=|=|\+|-|\)|\(|\*).*|
-        \s*[\w\s"'\[\]]+(?:-->|---|===|~~~|:).*|
-        \s*\w+\s*\[.*?\].*|
-        \s*\w+\s*\(.*?\).*|
-        \s*\w+>.*?].*|
-        \s*\w+\s*:.*|
-        \s*section\s+.*|
-        \s*\d+\s*:.*|
-        \s*title\s+.*|
-        \s*[-+*]\s+.*|
-        \s*%%.*|
-        \s*)
+Additional Instructions:
+- Strictly follow the Mermaid syntax for {selected_template} diagrams.
+- Use the appropriate flow diagram symbols and connectors where applicable.
+- Long text should be wrapped by using "'<text>'" around the strings
+- To create bold text, use double asterisks ** before and after the text.
+- For italics, use single asterisks * before and after the text.
+- Do not add any explanations or notes outside the Mermaid code.
+- Ensure each line of the diagram is properly formatted according to the syntax.
+- Top to bottom is preferred for flow charts. Long charts are often best oriented top to bottom.
+- Do not use 'end' syntax unless it's explicitly part of the {selected_template} diagram syntax.
+- Use clear labels to avoid ambiguity and ensure all understand the information. Label all screens, actions, and decisions.
+- Make sure your user flows are complete and lead to a clear resolution.
+- Ensure the diagram is clear and easy to understand at a glance.
+- Always have a legend key if you are using colors or icons.
+- Use color with purpose in your user flows. Assign different colors to different elements to make the diagram easier to understand. For instance, use green for decisions, blue for screens, and yellow for entry points."""
+
+
+def build_prompt(input: str, selected_template: str, guide: CompiledPrompt) -> Prompt:
     """
+    Builds the generation prompt for a template.
 
-    if re.search(r'\|.*\|>', processed_code):
-        processed_code = re.sub(r'\|(.*?)\|>', r'|\1|', processed_code)
-    # Special handling for mindmap and block-beta
-    if re.match(r'^(mindmap|block-beta)', processed_code, re.IGNORECASE):
-        # For mindmap and block-beta, we want to keep all lines that are not completely blank
-        valid_lines = [line for line in processed_code.split('\n') if line.strip()]
-    else:
-        # For other diagrams, use the regex pattern
-        valid_lines = [line for line in processed_code.split('\n') 
-                       if re.match(valid_syntax_pattern, line, re.VERBOSE | re.IGNORECASE)]
-    
-    final_code = '\n'.join(valid_lines)
-    
-    print("Processed Mermaid Code:", final_code)
+    The instructions and the syntax section go into the system part, which is the same
+    for every request for the template; the examples selected for the input and the input
+    itself come last, in the user part.
+
+    Args:
+        input (str): What the diagram should be about.
+        selected_template (str): The diagram template.
+        guide (CompiledPrompt): The syntax and examples for the template.
 
-    return final_code
+    Returns:
+        Prompt: The prompt.
+    """
+    if guide.static:
+        system = _system_prompt(selected_template, guide.syntax, guide.example_text)
+        user = ""
+    else:
+        system = _system_prompt(selected_template, guide.syntax, None)
+        user = f"Examples:\n{guide.example_text}\n\n"
+    user += f"Generate the Mermaid code for the {selected_template} diagram about: {input}"
+    return Prompt(system=system, user=user)
 
 
 class LLMError(Exception):
@@ -195,89 +119,421 @@ class LLMError(Exception):
 class AuthError(LLMError):
     """Raised when there's an authentication error."""
     pass
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
-    retry=retry_if_exception_type((RateLimitError, BadRequestError)),
-    reraise=True
-)
-async def generate(input: str, selected_template: str, llm, selected_model: str, temperature: float, max_tokens: int, timeout: int = 300) -> Dict[str, Any]:
+
+def _llm_provider(llm) -> str:
+    return getattr(getattr(llm, 'config', None), 'provider', '')
+
+def _llm_model(llm) -> str:
+    return getattr(getattr(llm, 'config', None), 'model', '')
+
+def _user_supplied_key(llm) -> bool:
+    return getattr(getattr(llm, 'config', None), 'user_supplied_key', False)
+
+def _request_key(input: str, selected_template: str, llm, selected_model: str, temperature: float, max_tokens: int) -> str:
+    return make_cache_key(input, selected_template, _llm_provider(llm), selected_model,
+                          temperature, max_tokens, f"{template_registry.version}:{prompt_compiler.version}")
+
+def _result_cache_key(input: str, selected_template: str, llm, selected_model: str, temperature: float, max_tokens: int):
+    if not result_cache.enabled:
+        return None
+    return _request_key(input, selected_template, llm, selected_model, temperature, max_tokens)
+
+async def generate(input: str, selected_template: str, llm, selected_model: str, temperature: float, max_tokens: int, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Generates a diagram.
+
+    Args:
+        input (str): What the diagram should be about.
+        selected_template (str): The diagram template.
+        llm: The LLM instance.
+        selected_model (str): The model name.
+        temperature (float): The sampling temperature.
+        max_tokens (int): The maximum number of tokens to generate.
+        timeout (Optional[float]): The time budget of the LLM call including retries,
+            in seconds. Defaults to `settings.LLM_TIMEOUT`.
+
+    Returns:
+        Dict[str, Any]: {"text": <extracted Mermaid code>}. With `REPAIR_ENABLED`, invalid
+            lines of the code have been fixed with a repair prompt.
+
+    Raises:
+        TimeoutError: If the LLM did not respond in time.
+        AuthError: If the provider rejected the credentials (OpenAI-compatible providers
+            raise their own `AuthenticationError`).
+        LLMError: If the LLM call failed with an error that is not a provider API error.
+    """
     start_time = time.time()
+    deadline = Deadline(settings.LLM_TIMEOUT if timeout is None else timeout)
+    labels = {"provider": _llm_provider(llm), "model": selected_model, "template": selected_template}
     try:
-        logger.info(f"Starting generation for input: '{input}', template: {selected_template}, model: {selected_model}, temperature: {temperature}, max_tokens: {max_tokens}")
+        logger.info("Starting generation for input: '%s', template: %s, model: %s, temperature: %s, max_tokens: %s",
+                    input, selected_template, selected_model, temperature, max_tokens)
         
-        available_templates = get_available_templates()
-        if selected_template not in available_templates:
-            raise ValueError(f"Invalid template: {selected_template}. Available templates: {', '.join(available_templates)}")
-
-        syntax_doc = read_syntax_file(selected_template)
-
-        prompt = f"""
-        Create a {selected_template} diagram in Mermaid syntax about: {input}
-
-        Use the following syntax and examples as a guide:
-
-        {syntax_doc}
-
-         Additional Instructions:
-        - Strictly follow the Mermaid syntax for {selected_template} diagrams.
-        - Use the appropriate flow diagram symbols and connectors where applicable.
-        - Long text should be wrapped by using "'<text>'" around the strings
-        - To create bold text, use double asterisks ** before and after the text.
-        - For italics, use single asterisks * before and after the text.
-        - Do not add any explanations or notes outside the Mermaid code.
-        - Ensure each line of the diagram is properly formatted according to the syntax.
-        - Top to bottom is preferred for flow charts. Long charts are often best oriented top to bottom. 
-        - Do not use 'end' syntax unless it's explicitly part of the {selected_template} diagram syntax.
-        - Use clear labels to avoid ambiguity and ensure all understand the information. Label all screens, actions, and decisions. 
-        - Make sure your user flows are complete and lead to a clear resolution.
-        - Ensure the diagram is clear and easy to understand at a glance.
-        - Always have a legend key if you are using colors or icons.
-        - Use color with purpose in your user flows. Assign different colors to different elements to make the diagram easier to understand. For instance, use green for decisions, blue for screens, and yellow for entry points. 
-        Generate the Mermaid code for the {selected_template} diagram:
-        """
+        cache_key = _result_cache_key(input, selected_template, llm, selected_model, temperature, max_tokens)
+        if cache_key is not None:
+            cached = result_cache.get(cache_key)
+            count_cache_lookup(cached is not None)
+            if cached is not None:
+                logger.info("Result cache hit for template: %s, model: %s", selected_template, selected_model)
+                return dict(cached)
+
+        # Only the syntax examples relevant to the input, within the prompt token budget
+        with stage_timer("template_lookup", **labels):
+            guide = prompt_compiler.compile(selected_template, input)
 
+        with stage_timer("prompt_build", **labels):
+            prompt = build_prompt(input, selected_template, guide)
+
+        # Identical requests in flight at the same time share one LLM call. The API key is
+        # part of the key so that a caller never receives the outcome of someone else's key.
+        flight_key = (cache_key or _request_key(input, selected_template, llm, selected_model, temperature, max_tokens),
+                      hash_api_key(getattr(getattr(llm, 'config', None), 'api_key', None)))
         try:
-            response = await call_llm(llm, prompt, temperature, max_tokens, timeout)
-        except RetryError as retry_error:
-            if isinstance(retry_error.last_attempt.exception(), AuthenticationError):
-                raise AuthError("Authentication failed. Please check your API key.")
-            elif isinstance(retry_error.last_attempt.exception(), RateLimitError):
-                raise RateLimitError("Rate limit exceeded. Please try again later.")
-            elif isinstance(retry_error.last_attempt.exception(), BadRequestError):
-                raise BadRequestError(f"Bad request: {str(retry_error.last_attempt.exception())}")
-            else:
-                raise LLMError(f"Unexpected error calling LLM: {str(retry_error.last_attempt.exception())}")
+            # The labels reach the stages recorded during the call, like the rate limit wait
+            with metric_labels(**labels), stage_timer("llm_total", **labels):
+                response = await single_flight.do(flight_key, lambda: call_llm_routed(llm, prompt, temperature, max_tokens, deadline))
         except Exception as e:
-            raise LLMError(f"Unexpected error calling LLM: {str(e)}")
+            error = _llm_error(e)
+            if error is e:
+                raise
+            raise error from e
 
-        logger.debug(f"Raw LLM output: {response}")
+        log_payload(logger, "Raw LLM output", response)
         
         # Extract Mermaid code from the response
-        mermaid_code = extract_mermaid_code(response)
-        logger.debug(f"Extracted Mermaid code: {mermaid_code}")
-        return {"text": mermaid_code}
+        with stage_timer("extraction", **labels):
+            mermaid_code = extract_mermaid_code(response)
+        log_payload(logger, "Extracted Mermaid code", mermaid_code)
+        if mermaid_code and settings.REPAIR_ENABLED:
+            code = mermaid_code
+            with metric_labels(**labels), stage_timer("repair", **labels):
+                mermaid_code = await single_flight.do(
+                    (flight_key, "repair"), lambda: _repair(code, selected_template, llm, deadline))
+        result = {"text": mermaid_code}
+        if cache_key is not None and mermaid_code:
+            result_cache.set(cache_key, result)
+        return result
 
     except Exception as e:
-        logger.error(f"Error in generate function: {str(e)}", exc_info=True)
+        logger.error("Error in generate function: %s", e, exc_info=True)
+        count_error(e, **labels)
         raise
     finally:
         end_time = time.time()
-        logger.info(f"Total execution time: {end_time - start_time:.2f} seconds")
-
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-async def call_llm(llm, prompt: str, temperature: float, max_tokens: int, timeout: int):
-    loop = asyncio.get_event_loop()
-    
-    # Inspect the get_response method of the LLM instance
-    params = inspect.signature(llm.get_response).parameters
-    
-    # Prepare kwargs based on available parameters
-    kwargs = {'prompt': prompt}
-    if 'temperature' in params:
+        logger.info("Total execution time: %.2f seconds", end_time - start_time)
+
+async def generate_stream(input: str, selected_template: str, llm, selected_model: str, temperature: float, max_tokens: int) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Generates a diagram while streaming the LLM output.
+
+    Yields events as dictionaries:
+        {"type": "token", "text": ...} for every chunk received from the provider,
+        {"type": "code", "text": ...} once, with the extracted code, as soon as the closing code fence arrives,
+        {"type": "done", "text": ...} last, with the final extracted code, repaired like in `generate`.
+
+    Args:
+        input (str): What the diagram should be about.
+        selected_template (str): The diagram template.
+        llm: The LLM instance.
+        selected_model (str): The model name.
+        temperature (float): The sampling temperature.
+        max_tokens (int): The maximum number of tokens to generate.
+    """
+    start_time = time.time()
+    # Passed explicitly: context variables set here do not outlive a step of the generator
+    labels = {"provider": _llm_provider(llm), "model": selected_model, "template": selected_template}
+    try:
+        logger.info("Starting streaming generation for template: %s, model: %s", selected_template, selected_model)
+
+        cache_key = _result_cache_key(input, selected_template, llm, selected_model, temperature, max_tokens)
+        if cache_key is not None:
+            cached = result_cache.get(cache_key)
+            count_cache_lookup(cached is not None)
+            if cached is not None:
+                yield {"type": "done", **cached}
+                return
+
+        with stage_timer("template_lookup", **labels):
+            guide = prompt_compiler.compile(selected_template, input)
+        with stage_timer("prompt_build", **labels):
+            prompt = build_prompt(input, selected_template, guide)
+
+        # Output cannot be taken back once sent, so a stream is only rerouted before it starts
+        llm = _stream_llm(llm)
+        route = (_llm_provider(llm), _llm_model(llm))
+        labels.update(provider=route[0], model=route[1])
+        kwargs = _generation_kwargs(llm, temperature, max_tokens)
+        deadline = Deadline(settings.LLM_TIMEOUT)
+        extractor = MermaidExtractor()
+        code_sent = False
+        extraction_seconds = 0.0
+        llm_start_time = time.perf_counter()
+        first_token = True
+        try:
+            async for chunk in retry_policy.stream(
+                    lambda: _rate_limited_stream(llm, prompt, kwargs, deadline, template=selected_template),
+                    route[0], deadline):
+                if not chunk:
+                    continue
+                if first_token:
+                    first_token = False
+                    observe_stage("llm_first_token", time.perf_counter() - llm_start_time, **labels)
+                yield {"type": "token", "text": chunk}
+                # Lines are cleaned while the rest of the response is still being generated
+                extraction_start_time = time.perf_counter()
+                extractor.feed(chunk)
+                extraction_seconds += time.perf_counter() - extraction_start_time
+                if extractor.closed and not code_sent:
+                    code_sent = True
+                    yield {"type": "code", "text": extractor.code}
+        except Exception as e:
+            provider_router.record(route, e, _user_supplied_key(llm))
+            raise
+        except BaseException:
+            provider_router.breaker(*route).release()
+            raise
+        provider_router.record(route)
+        observe_stage("llm_total", time.perf_counter() - llm_start_time, **labels)
+
+        extraction_start_time = time.perf_counter()
+        mermaid_code = extractor.close()
+        observe_stage("extraction", extraction_seconds + time.perf_counter() - extraction_start_time, **labels)
+        log_payload(logger, "Extracted Mermaid code", mermaid_code)
+        if mermaid_code and settings.REPAIR_ENABLED:
+            with metric_labels(**labels), stage_timer("repair", **labels):
+                mermaid_code = await _repair(mermaid_code, selected_template, llm, deadline)
+        result = {"text": mermaid_code}
+        if cache_key is not None and mermaid_code:
+            result_cache.set(cache_key, result)
+        yield {"type": "done", **result}
+    except Exception as e:
+        count_error(e, **labels)
+        raise
+    finally:
+        logger.info("Total streaming execution time: %.2f seconds", time.time() - start_time)
+
+
+async def _repair(mermaid_code: str, selected_template: str, llm, deadline: Deadline) -> str:
+    """
+    Fixes the invalid lines of a generated diagram with a small follow-up call to the same
+    LLM, within the deadline of the request.
+    """
+    return await repair_diagram(
+        mermaid_code, selected_template,
+        lambda prompt: call_llm(llm, prompt, 0.0, settings.REPAIR_MAX_TOKENS, deadline))
+
+
+def _stream_llm(llm):
+    """
+    Returns the LLM to stream from: the selected one while its circuit breaker allows it,
+    otherwise the first fallback route whose breaker does.
+
+    Raises:
+        ProviderUnavailableError: If the breakers of all routes are open.
+    """
+    provider, model = _llm_provider(llm), _llm_model(llm)
+    for route in provider_router.candidates(provider, model):
+        if not provider_router.breaker(*route).allow():
+            continue
+        if route == (provider, model):
+            return llm
+        provider_router.rerouted_to(provider, model, route)
+        try:
+            return _route_llm(llm, route)
+        except LLMError:
+            provider_router.breaker(*route).release()
+    raise provider_router.unavailable(provider, model)
+
+
+def _generation_kwargs(llm, temperature: float, max_tokens: int) -> Dict[str, Any]:
+    # Only pass the generation parameters the provider declares support for
+    kwargs = {}
+    if 'temperature' in llm.supported_params:
         kwargs['temperature'] = temperature
-    if 'max_tokens' in params:
+    if 'max_tokens' in llm.supported_params:
         kwargs['max_tokens'] = max_tokens
-    
-    return await loop.run_in_executor(None, lambda: llm.get_response(**kwargs))
-    
+    return kwargs
+
+
+def _llm_error(e: Exception) -> Exception:
+    # Provider API errors and timeouts keep their type so callers can map them to a status;
+    # only unexpected errors are wrapped
+    if isinstance(e, (APIError, TimeoutError, LLMError, ProviderUnavailableError, RateLimitQueueError)):
+        return e
+    if is_auth_error(e):
+        return AuthError("Authentication failed. Please check your API key.")
+    return LLMError(f"Unexpected error calling LLM: {str(e)}")
+
+
+async def _acquire_rate_limit(llm, prompt: Prompt, max_tokens: Optional[int], deadline: Deadline,
+                              template: Optional[str] = None) -> None:
+    # Providers count the prompt and the requested completion tokens against the limit
+    remaining = deadline.remaining()
+    max_wait = settings.RATE_LIMIT_MAX_WAIT if remaining is None else min(settings.RATE_LIMIT_MAX_WAIT, remaining)
+    tokens = estimate_tokens(prompt_text(prompt)) + (max_tokens or 0)
+    waited = await rate_limiter.acquire(llm.rate_limit_key(), tokens, max_wait)
+    observe_stage("queue_wait", waited, provider=_llm_provider(llm), model=_llm_model(llm), template=template)
+
+
+def _observe_rate_limit_error(llm, error: Exception) -> None:
+    rate_limiter.observe(llm.rate_limit_key(), getattr(getattr(error, 'response', None), 'headers', None))
+    if status_code(error) == 429:
+        rate_limiter.penalize(llm.rate_limit_key(), retry_after(error))
+
+
+async def _rate_limited_response(llm, prompt: Prompt, kwargs: Dict[str, Any], deadline: Deadline) -> str:
+    with rate_limiter.settlement():
+        await _acquire_rate_limit(llm, prompt, kwargs.get('max_tokens'), deadline)
+        try:
+            return await llm.aget_response(prompt, **kwargs)
+        except Exception as e:
+            _observe_rate_limit_error(llm, e)
+            raise
+
+
+async def _rate_limited_stream(llm, prompt: Prompt, kwargs: Dict[str, Any], deadline: Deadline,
+                               template: Optional[str] = None) -> AsyncIterator[str]:
+    with rate_limiter.settlement():
+        await _acquire_rate_limit(llm, prompt, kwargs.get('max_tokens'), deadline, template)
+        try:
+            async for chunk in llm.astream_response(prompt, **kwargs):
+                yield chunk
+        except Exception as e:
+            _observe_rate_limit_error(llm, e)
+            raise
+
+
+async def call_llm(llm, prompt: Prompt, temperature: float, max_tokens: int, deadline: Deadline):
+    """
+    Calls the LLM, retrying retryable errors within the deadline. Every attempt first
+    waits for the client-side rate limit of the provider, model and API key.
+
+    Args:
+        llm: The LLM instance.
+        prompt (Prompt): The prompt.
+        temperature (float): The sampling temperature.
+        max_tokens (int): The maximum number of tokens to generate.
+        deadline (Deadline): The deadline of the request; every attempt is cut off at it.
+
+    Returns:
+        str: The raw LLM response.
+    """
+    kwargs = _generation_kwargs(llm, temperature, max_tokens)
+    route = (_llm_provider(llm), _llm_model(llm))
+    start_time = time.perf_counter()
+    try:
+        response = await retry_policy.call(lambda: _rate_limited_response(llm, prompt, kwargs, deadline),
+                                           route[0], deadline)
+    except asyncio.CancelledError:
+        # A call cancelled for being slower than its hedge took at least this long; leaving it
+        # out would hide the tail the hedge delay is derived from
+        latency_tracker.record(*route, time.perf_counter() - start_time)
+        provider_router.breaker(*route).release()
+        raise
+    except Exception as e:
+        provider_router.record(route, e, _user_supplied_key(llm))
+        raise
+    latency_tracker.record(*route, time.perf_counter() - start_time)
+    provider_router.record(route)
+    return response
+
+
+def _route_llm(llm, route):
+    """
+    Returns the LLM for another route than the one the request selected. The user's API key
+    is only reused for the same provider; other providers use the server's keys.
+    """
+    provider, model = route
+    api_key = getattr(llm.config, 'api_key', None) if provider == _llm_provider(llm) else None
+    route_llm = set_llm(provider, model, api_key)
+    if route_llm is None:
+        raise LLMError(f"Failed to initialize LLM for provider: {provider}, model: {model}")
+    return route_llm
+
+
+async def call_llm_routed(llm, prompt: Prompt, temperature: float, max_tokens: int, deadline: Deadline):
+    """
+    Calls the LLM like `call_llm_hedged`, unless its circuit breaker is open, and falls back
+    to the routes of `ROUTING_FALLBACKS` when it is unavailable or fails because of the provider.
+
+    Args:
+        llm: The LLM instance.
+        prompt (Prompt): The prompt.
+        temperature (float): The sampling temperature.
+        max_tokens (int): The maximum number of tokens to generate.
+        deadline (Deadline): The deadline of the request, shared by all routes.
+
+    Returns:
+        str: The raw LLM response.
+
+    Raises:
+        ProviderUnavailableError: If the breakers of all routes are open.
+    """
+    provider, model = _llm_provider(llm), _llm_model(llm)
+    error = None
+    for route in provider_router.candidates(provider, model):
+        if deadline.expired or not provider_router.breaker(*route).allow():
+            continue
+        if route == (provider, model):
+            route_llm = llm
+        else:
+            provider_router.rerouted_to(provider, model, route)
+            try:
+                route_llm = _route_llm(llm, route)
+            except LLMError as e:
+                provider_router.breaker(*route).release()
+                error = error or e
+                continue
+        try:
+            return await call_llm_hedged(route_llm, prompt, temperature, max_tokens, deadline)
+        except Exception as e:
+            # A rate limited user key is not moved onto the server's keys of the fallbacks
+            if not is_provider_failure(e, route[0], _user_supplied_key(route_llm)):
+                raise
+            error = e
+    if error is not None:
+        raise error
+    raise provider_router.unavailable(provider, model)
+
+
+async def call_llm_hedged(llm, prompt: Prompt, temperature: float, max_tokens: int, deadline: Deadline):
+    """
+    Calls the LLM like `call_llm`, sending a backup request to the route configured in
+    `HEDGE_ROUTES` when the call is slower than usual. The first response a diagram can be
+    extracted from wins.
+
+    Args:
+        llm: The LLM instance.
+        prompt (Prompt): The prompt.
+        temperature (float): The sampling temperature.
+        max_tokens (int): The maximum number of tokens to generate.
+        deadline (Deadline): The deadline of the request, shared by both calls.
+
+    Returns:
+        str: The raw LLM response.
+    """
+    provider, model = _llm_provider(llm), _llm_model(llm)
+    backup_route = hedge_policy.backup_for(provider, model)
+    if backup_route is None:
+        return await call_llm(llm, prompt, temperature, max_tokens, deadline)
+
+    backup_breaker = provider_router.breaker(*backup_route)
+    if not backup_breaker.available():
+        return await call_llm(llm, prompt, temperature, max_tokens, deadline)
+
+    async def backup():
+        if not backup_breaker.allow():
+            raise ProviderUnavailableError(f"{backup_route[0]} ({backup_route[1]}) is temporarily unavailable.")
+        try:
+            backup_llm = _route_llm(llm, backup_route)
+        except LLMError:
+            backup_breaker.release()
+            raise
+        return await call_llm(backup_llm, prompt, temperature, max_tokens, deadline)
+
+    return await hedge_policy.call(
+        (provider, model),
+        lambda: call_llm(llm, prompt, temperature, max_tokens, deadline),
+        backup,
+        lambda response: bool(extract_mermaid_code(response)),
+    )
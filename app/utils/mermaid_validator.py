@@ -0,0 +1,504 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple
+
+from app.utils.mermaid_extractor import VALID_VERIFY_METHODS
+
+
+@dataclass(frozen=True)
+class LineError:
+    """
+    An invalid line of a diagram.
+
+    Attributes:
+        line (int): The 1-based line number in the code.
+        text (str): The line.
+        message (str): Why it is invalid.
+    """
+    line: int
+    text: str
+    message: str
+
+
+@dataclass(frozen=True)
+class ValidationResult:
+    """
+    The outcome of validating a diagram.
+
+    Attributes:
+        template (str): The template the diagram was validated as.
+        errors (Tuple[LineError, ...]): The invalid lines, in order.
+        header_ok (bool): Whether the diagram starts with the header of its template. A
+            diagram without it is not worth repairing line by line.
+    """
+    template: str
+    errors: Tuple[LineError, ...] = ()
+    header_ok: bool = True
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+
+NUMBER = r'-?\d+(?:\.\d+)?'
+DIRECTION = r'(?:TB|TD|BT|RL|LR)'
+STYLE_STATEMENTS = re.compile(r'^(?:classDef|class|style|linkStyle|cssClass|click|callback|link|links)\s+\S')
+COMMON_STATEMENTS = re.compile(r'^(?:title|accTitle|accDescr)\b')
+QUOTED = re.compile(r'"[^"]*"')
+
+
+def _strip_quoted(text: str) -> str:
+    return QUOTED.sub('""', text)
+
+
+def _statements(*patterns: str, flags: int = 0) -> Tuple[Pattern, ...]:
+    return tuple(re.compile(pattern, flags) for pattern in patterns)
+
+
+class DiagramValidator:
+    """
+    Checks the lines of one diagram type against the statements its syntax allows.
+
+    A line is valid if it matches one of `statements` (or, inside a `{ ... }` block, one
+    of `block_statements`). Blocks closed by `end` start with a statement matching
+    `end_blocks`; `{` / `}` blocks are tracked when `brace_blocks` is set. The rules only
+    cover what the syntax guides describe and are lenient about free text, so that a
+    diagram Mermaid renders is not reported.
+
+    Attributes:
+        name (str): The diagram type, used in messages.
+        header (Pattern): The first statement of the diagram.
+    """
+    name = 'diagram'
+    header: Pattern = re.compile(r'^$')
+    header_text = ''
+    statements: Tuple[Pattern, ...] = ()
+    block_statements: Tuple[Pattern, ...] = ()
+    end_blocks: Optional[Pattern] = None
+    mid_blocks: Optional[Pattern] = None
+    brace_blocks = False
+    any_statement = False
+
+    def check_statement(self, text: str, in_braces: bool) -> Optional[str]:
+        """Returns why a statement (a stripped, non-empty line) is invalid, or None."""
+        if COMMON_STATEMENTS.match(text) or STYLE_STATEMENTS.match(text) or self.any_statement:
+            return None
+        patterns = self.block_statements if in_braces and self.block_statements else self.statements
+        if any(pattern.match(text) for pattern in patterns):
+            return None
+        return f"not a valid {self.name} statement"
+
+    def structural_text(self, text: str) -> str:
+        """The part of a statement whose braces open and close blocks."""
+        return _strip_quoted(text)
+
+    def finish(self, lines: Sequence[Tuple[int, str]]) -> List[LineError]:
+        """Checks that concern several lines. `lines` are the numbered statements."""
+        return []
+
+    def validate(self, lines: Sequence[Tuple[int, str]]) -> List[LineError]:
+        """
+        Validates the statements of a diagram after its header.
+
+        Args:
+            lines (Sequence[Tuple[int, str]]): The line numbers and lines.
+        """
+        errors: List[LineError] = []
+        end_stack: List[int] = []
+        brace_stack: List[int] = []
+        statements = []
+        for number, line in lines:
+            text = line.strip()
+            if not text or text.startswith('%%'):
+                continue
+            statements.append((number, line))
+            message = self.check_statement(text, bool(brace_stack))
+            if message is None and self.end_blocks is not None:
+                if text == 'end' or text == 'end;':
+                    if end_stack:
+                        end_stack.pop()
+                    else:
+                        message = "`end` without an open block"
+                elif self.mid_blocks is not None and self.mid_blocks.match(text) and not end_stack:
+                    message = f"`{text.split()[0]}` outside of a block"
+                elif self.end_blocks.match(text):
+                    end_stack.append(number)
+            if message is None and self.brace_blocks:
+                for char in self.structural_text(text):
+                    if char == '{':
+                        brace_stack.append(number)
+                    elif char == '}':
+                        if brace_stack:
+                            brace_stack.pop()
+                        else:
+                            message = "`}` without an open `{`"
+                            break
+            if message is not None:
+                errors.append(LineError(number, line, message))
+
+        lines_by_number = dict(lines)
+        for number in end_stack:
+            errors.append(LineError(number, lines_by_number[number], "block is never closed with `end`"))
+        for number in sorted(set(brace_stack)):
+            errors.append(LineError(number, lines_by_number[number], "`{` is never closed with `}`"))
+        errors.extend(self.finish(statements))
+        return sorted(errors, key=lambda error: error.line)
+
+
+class FlowchartValidator(DiagramValidator):
+    name = 'flowchart'
+    header = re.compile(rf'^(?:flowchart|graph)(?:\s+{DIRECTION})?\s*;?$')
+    header_text = 'flowchart TD'
+    statements = _statements(r'^subgraph\b', r'^end;?$', rf'^direction\s+{DIRECTION}$')
+    end_blocks = re.compile(r'^subgraph\b')
+
+    NODE_ID = r'[\w.$-]+'
+    # Shapes, innermost first; the text inside them is free
+    SHAPE = re.compile(r'\[[^\[\]]*\]|\([^()]*\)|\{[^{}]*\}|@\{[^{}]*\}')
+    ASYMMETRIC_SHAPE = re.compile(r'(?<=[\w])>[^\]]*\]')
+    LINK_LABEL = re.compile(r'\|[^|]*\|')
+    TEXT_LINK = re.compile(r'(?:--|==|-\.)\s[^|]*?\s(?:-{2,}[>ox]|={2,}>|\.-+>|-{3,}|={3,}|\.-+)')
+    LINK = r'(?:<|x|o)?(?:-{2,}|={2,}|-\.+-|~{3,})(?:>|x|o)?'
+    STATEMENT = None
+
+    def __init__(self):
+        node = rf'{self.NODE_ID}(?::::\w+)?'
+        nodes = rf'{node}(?:\s*&\s*{node})*'
+        self.STATEMENT = re.compile(rf'^{nodes}(?:\s*{self.LINK}\s*{nodes})*\s*;?$')
+
+    def _normalize(self, text: str) -> Optional[str]:
+        text = QUOTED.sub('', text)
+        text = self.TEXT_LINK.sub(' --> ', text)
+        text = self.LINK_LABEL.sub('', text)
+        text = self.ASYMMETRIC_SHAPE.sub('', text)
+        previous = None
+        while previous != text:
+            previous, text = text, self.SHAPE.sub('', text)
+        if any(char in text for char in '[](){}'):
+            return None
+        return text.strip()
+
+    def check_statement(self, text: str, in_braces: bool) -> Optional[str]:
+        if super().check_statement(text, in_braces) is None:
+            return None
+        normalized = self._normalize(text)
+        if normalized is None:
+            return "unbalanced brackets in a node shape"
+        if self.STATEMENT.match(normalized):
+            return None
+        return "not a valid flowchart node or link statement"
+
+
+class SequenceValidator(DiagramValidator):
+    name = 'sequence diagram'
+    header = re.compile(r'^sequenceDiagram\s*$')
+    header_text = 'sequenceDiagram'
+    ARROW = r'(?:<<-->>|<<->>|-->>|->>|-->|->|--x|-x|--\)|-\))'
+    statements = _statements(
+        r'^(?:create\s+)?(?:participant|actor)\s+\S',
+        r'^destroy\s+\S',
+        r'^(?:loop|alt|else|opt|par|par_over|and|critical|option|break|rect|box)\b',
+        r'^end$',
+        r'^(?:activate|deactivate)\s+\S',
+        r'^autonumber\b',
+        r'^note\s+(?:left of|right of|over)\s+[^:]+:',
+        rf'^[^\s:]+?\s*{ARROW}\s*[+-]?\s*[^\s:]+\s*(?::.*)?$',
+        flags=re.IGNORECASE,
+    )
+    end_blocks = re.compile(r'^(?:loop|alt|opt|par|par_over|critical|break|rect|box)\b')
+    mid_blocks = re.compile(r'^(?:else|and|option)\b')
+
+
+class ClassValidator(DiagramValidator):
+    name = 'class diagram'
+    header = re.compile(r'^classDiagram(?:-v2)?\s*$')
+    header_text = 'classDiagram'
+    CLASS = r'(?:`[^`]+`|[\w.]+)(?:~[^~]*~)?'
+    CARDINALITY = r'(?:"[^"]*"\s*)?'
+    RELATION = r'(?:<\||\*|o|<|\(\))?(?:--|\.\.)(?:\|>|\*|o|>|\(\))?'
+    statements = _statements(
+        r'^class\s+\S',
+        r'^namespace\s+\S',
+        r'^\}$',
+        r'^<<[^>]+>>\s*\S+$',
+        r'^note\b',
+        r'^direction\s+\w+$',
+        rf'^{CLASS}\s*{CARDINALITY}{RELATION}\s*{CARDINALITY}{CLASS}\s*(?::.*)?$',
+        rf'^{CLASS}\s*:\s*\S.*$',
+        rf'^{CLASS}\s*\{{$',
+    )
+    # Members inside `class X { ... }` are free text
+    block_statements = _statements(r'.')
+    brace_blocks = True
+
+
+class StateValidator(DiagramValidator):
+    name = 'state diagram'
+    header = re.compile(r'^stateDiagram(?:-v2)?\s*$')
+    header_text = 'stateDiagram-v2'
+    STATE = r'(?:\[\*\]|[\w.-]+(?::::\w+)?)'
+    statements = _statements(
+        rf'^{STATE}\s*-->\s*{STATE}\s*(?::.*)?$',
+        r'^state\s+\S',
+        r'^[\w.-]+\s*:.*$',
+        r'^[\w.-]+(?::::\w+)?$',
+        r'^\}$',
+        r'^--$',
+        r'^direction\s+\w+$',
+        r'^note\s+(?:left|right)\s+of\s+\S+',
+        r'^end note$',
+    )
+    brace_blocks = True
+    NOTE_BLOCK = re.compile(r'^note\s+(?:left|right)\s+of\s+[^:]+$')
+
+    def validate(self, lines: Sequence[Tuple[int, str]]) -> List[LineError]:
+        # The lines of a multi-line note are free text
+        kept, in_note = [], False
+        for number, line in lines:
+            text = line.strip()
+            if in_note:
+                in_note = text != 'end note'
+                continue
+            in_note = bool(self.NOTE_BLOCK.match(text))
+            kept.append((number, line))
+        return super().validate(kept)
+
+
+class EntityRelationshipValidator(DiagramValidator):
+    name = 'entity relationship diagram'
+    header = re.compile(r'^erDiagram\s*$')
+    header_text = 'erDiagram'
+    ENTITY = r'(?:"[^"]*"|[\w-]+)'
+    LEFT = r'(?:\|o|\|\||\}o|\}\|)'
+    RIGHT = r'(?:o\||\|\||o\{|\|\{)'
+    CARDINALITY_WORDS = r'(?:one or zero|zero or one|one or more|one or many|many\(\d+\)|\d+\+?|zero or more|zero or many|many|only one|1)'
+    RELATIONSHIP = re.compile(rf'{LEFT}(?:--|\.\.){RIGHT}')
+    statements = _statements(
+        rf'^{ENTITY}\s*{LEFT}(?:--|\.\.){RIGHT}\s*{ENTITY}\s*:\s*\S.*$',
+        rf'^{ENTITY}\s+{CARDINALITY_WORDS}\s+(?:to|optionally to)\s+{CARDINALITY_WORDS}\s+{ENTITY}\s*:\s*\S.*$',
+        rf'^{ENTITY}(?:\["[^"]*"\])?\s*\{{$',
+        rf'^{ENTITY}(?:\["[^"]*"\])?$',
+        r'^\}$',
+        r'^direction\s+\w+$',
+    )
+    block_statements = _statements(
+        r'^[\w\-\[\]()<>,~]+\s+[\w\-*]+(?:\s+(?:PK|FK|UK)(?:\s*,\s*(?:PK|FK|UK))*)?(?:\s+"[^"]*")?$',
+        r'^\}$',
+    )
+    brace_blocks = True
+
+    def structural_text(self, text: str) -> str:
+        return self.RELATIONSHIP.sub('', super().structural_text(text))
+
+    def check_statement(self, text: str, in_braces: bool) -> Optional[str]:
+        message = super().check_statement(text, in_braces)
+        if message is not None and in_braces:
+            return "not a valid attribute, expected `type name [PK|FK|UK] [\"comment\"]`"
+        if message is not None and re.search(r'--|\.\.', text):
+            return "invalid relationship, expected e.g. `A ||--o{ B : label`"
+        return message
+
+
+class GanttValidator(DiagramValidator):
+    name = 'gantt chart'
+    header = re.compile(r'^gantt\s*$')
+    header_text = 'gantt'
+    statements = _statements(
+        r'^(?:dateFormat|axisFormat|tickInterval|excludes|includes|todayMarker|weekday|displayMode|'
+        r'inclusiveEndDates|topAxis|weekend)\b',
+        r'^section\s+\S',
+        r'^[^:]+:\s*\S.*$',
+    )
+
+    def check_statement(self, text: str, in_braces: bool) -> Optional[str]:
+        message = super().check_statement(text, in_braces)
+        if message is not None:
+            return "not a valid gantt statement, tasks are written as `Task name : [id,] start, end`"
+        return None
+
+
+class JourneyValidator(DiagramValidator):
+    name = 'user journey'
+    header = re.compile(r'^journey\s*$')
+    header_text = 'journey'
+    statements = _statements(r'^section\s+\S', rf'^[^:]+:\s*{NUMBER}\s*(?::.*)?$')
+
+    def check_statement(self, text: str, in_braces: bool) -> Optional[str]:
+        message = super().check_statement(text, in_braces)
+        if message is not None:
+            return "not a valid journey statement, tasks are written as `Task name: score: actor, actor`"
+        return None
+
+
+class MindmapValidator(DiagramValidator):
+    name = 'mindmap'
+    header = re.compile(r'^mindmap\s*$')
+    header_text = 'mindmap'
+    any_statement = True
+
+    def finish(self, lines: Sequence[Tuple[int, str]]) -> List[LineError]:
+        nodes = [(number, line) for number, line in lines if not line.strip().startswith('::')]
+        if not nodes:
+            return []
+        root_indent = min(len(line) - len(line.lstrip()) for _, line in nodes)
+        roots = [(number, line) for number, line in nodes if len(line) - len(line.lstrip()) == root_indent]
+        return [LineError(number, line, "a mindmap has a single root node, indent this node below it")
+                for number, line in roots[1:]]
+
+
+class TimelineValidator(DiagramValidator):
+    name = 'timeline'
+    header = re.compile(r'^timeline\s*$')
+    header_text = 'timeline'
+    any_statement = True
+
+
+class QuadrantValidator(DiagramValidator):
+    name = 'quadrant chart'
+    header = re.compile(r'^quadrantChart\s*$')
+    header_text = 'quadrantChart'
+    POINT = re.compile(rf'^[^:\[\]]+?(?::::\w+)?\s*:\s*\[\s*({NUMBER})\s*,\s*({NUMBER})\s*\](?:\s+[\w-]+\s*:\s*\S+)*\s*$')
+    statements = _statements(r'^[xy]-axis\s+\S', r'^quadrant-[1-4]\s+\S', POINT.pattern)
+
+    def check_statement(self, text: str, in_braces: bool) -> Optional[str]:
+        message = super().check_statement(text, in_braces)
+        if message is not None:
+            return "not a valid quadrant chart statement, points are written as `Name: [x, y]`"
+        point = self.POINT.match(text)
+        if point and not all(0 <= float(value) <= 1 for value in point.groups()):
+            return "point coordinates must be between 0 and 1"
+        return None
+
+
+class SankeyValidator(DiagramValidator):
+    name = 'sankey diagram'
+    header = re.compile(r'^sankey-beta\s*$')
+    header_text = 'sankey-beta'
+    FIELD = r'(?:"(?:[^"]|"")*"|[^,"]*)'
+    statements = _statements(rf'^{FIELD},{FIELD},\s*{NUMBER}\s*$')
+
+    def check_statement(self, text: str, in_braces: bool) -> Optional[str]:
+        if any(pattern.match(text) for pattern in self.statements):
+            return None
+        return "not a valid sankey row, expected `source,target,value` with a numeric value"
+
+
+class RequirementValidator(DiagramValidator):
+    name = 'requirement diagram'
+    header = re.compile(r'^requirementDiagram\s*$')
+    header_text = 'requirementDiagram'
+    RELATIONSHIPS = r'(?:contains|copies|derives|satisfies|verifies|refines|traces)'
+    statements = _statements(
+        r'^(?:requirement|functionalRequirement|interfaceRequirement|performanceRequirement|'
+        r'physicalRequirement|designConstraint|element)\s+\S.*\{$',
+        r'^\}$',
+        rf'^\S+\s*-\s*{RELATIONSHIPS}\s*->\s*\S+$',
+        rf'^\S+\s*<-\s*{RELATIONSHIPS}\s*-\s*\S+$',
+        r'^direction\s+\w+$',
+    )
+    FIELD = re.compile(r'^(id|text|risk|verifymethod|type|docref)\s*:\s*(.*)$', re.IGNORECASE)
+    block_statements = (FIELD, re.compile(r'^\}$'))
+    brace_blocks = True
+
+    def check_statement(self, text: str, in_braces: bool) -> Optional[str]:
+        message = super().check_statement(text, in_braces)
+        if message is not None:
+            return message
+        field = self.FIELD.match(text) if in_braces else None
+        if field:
+            name, value = field.group(1).lower(), field.group(2).strip().lower()
+            if name == 'risk' and value not in ('low', 'medium', 'high'):
+                return "risk must be low, medium or high"
+            if name == 'verifymethod' and value not in VALID_VERIFY_METHODS:
+                return f"verifymethod must be one of {', '.join(VALID_VERIFY_METHODS)}"
+        return None
+
+
+class BlockValidator(DiagramValidator):
+    name = 'block diagram'
+    header = re.compile(r'^block(?:-beta)?\s*$')
+    header_text = 'block-beta'
+    statements = _statements(
+        r'^columns\s+(?:\d+|auto)$',
+        r'^block(?::[\w-]+)?(?::\d+)?\b',
+        r'^end$',
+        r'^space(?::\d+)?$',
+        r'^\S',
+    )
+    end_blocks = re.compile(r'^block\b')
+
+
+class ZenUMLValidator(DiagramValidator):
+    name = 'ZenUML diagram'
+    header = re.compile(r'^zenuml\s*$')
+    header_text = 'zenuml'
+    any_statement = True
+    brace_blocks = True
+
+
+VALIDATORS: Dict[str, DiagramValidator] = {
+    'FLOWCHART': FlowchartValidator(),
+    'CLASS': ClassValidator(),
+    'MINDMAP': MindmapValidator(),
+    'TIMELINE': TimelineValidator(),
+    'USERJOURNEY': JourneyValidator(),
+    'ENTITYRELATIONSHIP': EntityRelationshipValidator(),
+    'SEQUENCE': SequenceValidator(),
+    'STATE': StateValidator(),
+    'GANTT': GanttValidator(),
+    'QUADRANT': QuadrantValidator(),
+    'SANKEY': SankeyValidator(),
+    'REQUIREMENT': RequirementValidator(),
+    'BLOCK': BlockValidator(),
+    'ZENUML': ZenUMLValidator(),
+}
+
+
+def _diagram_lines(code: str) -> List[Tuple[int, str]]:
+    # Numbered statements without a leading front matter block (--- ... ---). A markdown
+    # string (`...`) spanning several lines is one statement numbered by its first line
+    lines = list(enumerate(code.split('\n'), start=1))
+    content = [index for index, (_, line) in enumerate(lines) if line.strip()]
+    if content and lines[content[0]][1].strip() == '---':
+        closing = next((index for index in range(content[0] + 1, len(lines)) if lines[index][1].strip() == '---'),
+                       content[0])
+        lines = lines[closing + 1:]
+
+    statements: List[Tuple[int, str]] = []
+    for number, line in lines:
+        if statements and statements[-1][1].count('`') % 2:
+            statements[-1] = (statements[-1][0], f"{statements[-1][1]} {line.strip()}")
+        else:
+            statements.append((number, line))
+    return statements
+
+
+def validate_diagram(code: str, template: str) -> ValidationResult:
+    """
+    Validates Mermaid code as a diagram of a template and reports the invalid lines.
+
+    Args:
+        code (str): The Mermaid code, e.g. as returned by `extract_mermaid_code`.
+        template (str): The template name, e.g. "FLOWCHART".
+
+    Returns:
+        ValidationResult: The invalid lines and why they are invalid. Templates without a
+            validator always validate.
+    """
+    template = template.upper()
+    validator = VALIDATORS.get(template)
+    if validator is None:
+        return ValidationResult(template)
+
+    lines = _diagram_lines(code)
+    statements = [(number, line) for number, line in lines if line.strip() and not line.strip().startswith('%%')]
+    if not statements:
+        return ValidationResult(template, (LineError(1, '', f"the diagram is empty, expected `{validator.header_text}`"),),
+                                header_ok=False)
+    number, header = statements[0]
+    if not validator.header.match(header.strip()):
+        return ValidationResult(
+            template, (LineError(number, header, f"expected the diagram to start with `{validator.header_text}`"),),
+            header_ok=False)
+    body = [(line_number, line) for line_number, line in lines if line_number > number]
+    return ValidationResult(template, tuple(validator.validate(body)))
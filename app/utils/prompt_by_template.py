@@ -1,20 +1,4 @@
-from enum import Enum
-
-class TemplateEnum(Enum):
-    FLOWCHART = "FLOWCHART"
-    CLASS = "CLASS"
-    MINDMAP = "MINDMAP"
-    TIMELINE = "TIMELINE"
-    USERJOURNEY = "USERJOURNEY"
-    ENTITYRELATIONSHIP = "ENTITYRELATIONSHIP"
-    SEQUENCE = "SEQUENCE"
-    STATE = "STATE"
-    GANTT = "GANTT"
-    QUADRANT = "QUADRANT"
-    SANKEY = "SANKEY"
-    REQUIREMENT = "REQUIREMENT"
-    BLOCK = "BLOCK" 
-    ZENUML = "ZENUML"  
+from app.utils.template_utils import TemplateEnum
 
 common_rules = """
 - Strict rules: Do not add Note and do not explain the code.
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the diagram generation pipeline.
+
+Run with `python -m benchmarks.run`; see benchmarks/README.md.
+"""
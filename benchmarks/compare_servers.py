@@ -0,0 +1,112 @@
+"""
+Compares the throughput of the Flask app and the ASGI app under the same load.
+
+    python -m benchmarks.compare_servers --rps 50 --duration 30 --workers 1
+
+Each server is started in turn on a free port with the `simulated` provider, driven with
+`benchmarks.load` at the same open-loop request rate and stopped again. The settings of
+the simulated provider (`SIMULATED_LATENCY_MEAN`, `SIMULATED_TOKENS_PER_SECOND`, ...)
+are taken from the environment.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.load import run_load
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_commands(port: int, workers: int) -> Dict[str, List[str]]:
+    return {
+        'flask': [sys.executable, '-m', 'flask', '--app', 'app:create_app()', 'run', '--port', str(port)],
+        'asgi': [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--workers', str(workers),
+                 '--log-level', 'warning'],
+    }
+
+
+def _wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            if httpx.get(f"{url}/api/models", params={"provider": "simulated"}, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start within {timeout} seconds")
+
+
+def run_server(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Starts one server, runs the load against it and stops it.
+
+    Returns:
+        Dict[str, Any]: The load test report of the server.
+    """
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {
+        'SIMULATED_REPLAY_DIR': os.path.join('benchmarks', 'corpus'),
+        'LOG_LEVEL': 'WARNING',
+        **os.environ,
+        'SIMULATED_ENABLED': 'true',
+    }
+    process = subprocess.Popen(server_commands(port, args.workers)[name], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_until_ready(url, process)
+        return asyncio.run(run_load(url, args.rps, args.duration, args.max_in_flight, 'simulated', 'simulated',
+                                    args.stream, poisson=False, timeout=args.timeout))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rps', type=float, default=50, help="Target requests per second.")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to send requests for.")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes of the ASGI server.")
+    parser.add_argument('--max-in-flight', type=int, default=512, help="Outstanding requests before arrivals are dropped.")
+    parser.add_argument('--stream', action='store_true', help="Use /api/ask/stream.")
+    parser.add_argument('--timeout', type=float, default=120, help="Client timeout per request in seconds.")
+    parser.add_argument('--only', choices=('flask', 'asgi'), action='append', help="Only run these servers.")
+    parser.add_argument('--output', help="Also write the reports as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    reports = {name: run_server(name, args) for name in (args.only or ['flask', 'asgi'])}
+
+    print(f"{'server':<8} {'sent':>6} {'ok':>6} {'dropped':>8} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, report in reports.items():
+        latency = report["latency_ms"]
+        print(f"{name:<8} {report['sent']:>6} {report['ok']:>6} {report['dropped']:>8} "
+              f"{report['throughput_rps']:>8} {latency['p50'] or '-':>9} {latency['p95'] or '-':>9} "
+              f"{latency['p99'] or '-':>9}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(reports, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
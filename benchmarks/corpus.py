@@ -0,0 +1,79 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.utils.template_utils import TemplateEnum
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'corpus')
+
+VARIANTS = ('clean', 'messy')
+
+# The keyword a correctly extracted diagram of each template starts with
+DIAGRAM_KEYWORDS: Dict[str, tuple] = {
+    TemplateEnum.FLOWCHART.value: ('flowchart', 'graph'),
+    TemplateEnum.CLASS.value: ('classDiagram',),
+    TemplateEnum.MINDMAP.value: ('mindmap',),
+    TemplateEnum.TIMELINE.value: ('timeline',),
+    TemplateEnum.USERJOURNEY.value: ('journey',),
+    TemplateEnum.ENTITYRELATIONSHIP.value: ('erDiagram',),
+    TemplateEnum.SEQUENCE.value: ('sequenceDiagram',),
+    TemplateEnum.STATE.value: ('stateDiagram',),
+    TemplateEnum.GANTT.value: ('gantt',),
+    TemplateEnum.QUADRANT.value: ('quadrantChart',),
+    TemplateEnum.SANKEY.value: ('sankey-beta',),
+    TemplateEnum.REQUIREMENT.value: ('requirementDiagram',),
+    TemplateEnum.BLOCK.value: ('block-beta',),
+    TemplateEnum.ZENUML.value: ('zenuml',),
+}
+
+
+@dataclass(frozen=True)
+class Sample:
+    """
+    A raw LLM response for one template.
+
+    Attributes:
+        template (str): The template the response was generated for, e.g. "FLOWCHART".
+        variant (str): "clean" for a well-formed response, "messy" for one with
+            surrounding prose, missing fences or syntax mistakes.
+        text (str): The raw response.
+    """
+    template: str
+    variant: str
+    text: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.variant}.{self.template.lower()}"
+
+
+def load_corpus(variant: Optional[str] = None) -> List[Sample]:
+    """
+    Loads the raw responses in the corpus directory.
+
+    Args:
+        variant (Optional[str]): Only load samples of this variant.
+
+    Returns:
+        List[Sample]: One sample per template and variant, in `TemplateEnum` order.
+
+    Raises:
+        FileNotFoundError: If a template has no sample for a variant.
+    """
+    samples = []
+    for variant_name in VARIANTS:
+        if variant is not None and variant_name != variant:
+            continue
+        for template in TemplateEnum:
+            path = os.path.join(CORPUS_DIR, f"{template.value.lower()}.{variant_name}.txt")
+            with open(path, 'r', encoding='utf-8') as file:
+                samples.append(Sample(template=template.value, variant=variant_name, text=file.read()))
+    return samples
+
+
+def is_valid_extraction(template: str, code: str) -> bool:
+    """
+    Checks that extracted code starts with the diagram keyword of its template.
+    """
+    first_line = code.lstrip().split('\n', 1)[0].strip()
+    return first_line.startswith(DIAGRAM_KEYWORDS[template.upper()])
@@ -0,0 +1,167 @@
+"""
+Drives `/api/ask` (or `/api/ask/stream`) of a running server at a target request rate
+and reports latency percentiles and throughput.
+
+    SIMULATED_ENABLED=true SIMULATED_LATENCY_MEAN=1.5 SIMULATED_RATE_LIMIT_RATE=0.02 flask --app "app:create_app()" run
+    python -m benchmarks.load --url http://127.0.0.1:5000 --rps 20 --duration 60
+
+Requests are sent open-loop: arrivals follow the target rate whether or not earlier
+requests have finished, up to `--max-in-flight` outstanding requests. Arrivals that
+find the limit reached are counted as dropped, so a saturated server shows up as
+dropped requests and growing latency rather than a silently lower request rate.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.utils.template_utils import TemplateEnum
+
+MAX_KEEPALIVE_CONNECTIONS = 20
+
+LOAD_INPUT = "the checkout process of an online shop, from cart review to order confirmation"
+
+
+def percentile(ordered: List[float], fraction: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def _send(client: httpx.AsyncClient, path: str, payload: Dict[str, Any],
+                stream: bool) -> Dict[str, Any]:
+    start = time.perf_counter()
+    first_byte = None
+    try:
+        if stream:
+            async with client.stream('POST', path, json=payload) as response:
+                status = response.status_code
+                async for line in response.aiter_lines():
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - start
+                    if line and json.loads(line).get("type") == "error":
+                        status = json.loads(line).get("status", 500)
+        else:
+            response = await client.post(path, json=payload)
+            status = response.status_code
+    except httpx.TimeoutException:
+        status = 'timeout'
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return {"status": status, "latency": time.perf_counter() - start, "first_byte": first_byte}
+
+
+async def run_load(url: str, rps: float, duration: float, max_in_flight: int, provider: str,
+                   model: str, stream: bool, poisson: bool, timeout: float) -> Dict[str, Any]:
+    """
+    Sends requests at `rps` for `duration` seconds and collects their outcomes.
+
+    Returns:
+        Dict[str, Any]: The load test report.
+    """
+    path = '/api/ask/stream' if stream else '/api/ask'
+    templates = [template.value for template in TemplateEnum]
+    # httpx's pool gets slow with hundreds of idle connections, which would make the client
+    # the bottleneck at high rates
+    limits = httpx.Limits(max_connections=max_in_flight,
+                          max_keepalive_connections=min(max_in_flight, MAX_KEEPALIVE_CONNECTIONS))
+    results: List[Dict[str, Any]] = []
+    dropped = 0
+    in_flight = 0
+    tasks = set()
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        async def fire(payload):
+            nonlocal in_flight
+            try:
+                results.append(await _send(client, path, payload, stream))
+            finally:
+                in_flight -= 1
+
+        start = time.perf_counter()
+        next_arrival = 0.0
+        sent = 0
+        while next_arrival < duration:
+            delay = start + next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if in_flight >= max_in_flight:
+                dropped += 1
+            else:
+                in_flight += 1
+                payload = {
+                    "input": LOAD_INPUT,
+                    "selectedTemplate": templates[sent % len(templates)],
+                    "provider": provider,
+                    "model": model,
+                    "temperature": 0.2,
+                    "maxTokens": 1024,
+                }
+                task = asyncio.create_task(fire(payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                sent += 1
+            next_arrival += random.expovariate(rps) if poisson else 1 / rps
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    ok = sorted(r["latency"] for r in results if r["status"] == 200)
+    first_bytes = sorted(r["first_byte"] for r in results if r["status"] == 200 and r["first_byte"] is not None)
+    report = {
+        "url": url,
+        "endpoint": path,
+        "target_rps": rps,
+        "duration_s": round(elapsed, 3),
+        "sent": len(results),
+        "dropped": dropped,
+        "ok": len(ok),
+        "statuses": {str(status): count for status, count in Counter(r["status"] for r in results).items()},
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            name: round(value * 1000, 1) if value is not None else None
+            for name, value in (("p50", percentile(ok, 0.50)), ("p95", percentile(ok, 0.95)),
+                                ("p99", percentile(ok, 0.99)), ("max", ok[-1] if ok else None))
+        },
+    }
+    if stream:
+        report["first_byte_ms"] = {
+            name: round(value * 1000, 1) if value is not None else None
+            for name, value in (("p50", percentile(first_bytes, 0.50)), ("p95", percentile(first_bytes, 0.95)),
+                                ("p99", percentile(first_bytes, 0.99)))
+        }
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Base URL of the server.")
+    parser.add_argument('--rps', type=float, default=10, help="Target requests per second.")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to send requests for.")
+    parser.add_argument('--max-in-flight', type=int, default=256, help="Outstanding requests before arrivals are dropped.")
+    parser.add_argument('--provider', default='simulated')
+    parser.add_argument('--model', default='simulated')
+    parser.add_argument('--stream', action='store_true', help="Use /api/ask/stream and report time to first byte.")
+    parser.add_argument('--poisson', action='store_true', help="Poisson arrivals instead of a constant rate.")
+    parser.add_argument('--timeout', type=float, default=120, help="Client timeout per request in seconds.")
+    parser.add_argument('--output', help="Also write the report as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args.url, args.rps, args.duration, args.max_in_flight, args.provider,
+                                  args.model, args.stream, args.poisson, args.timeout))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
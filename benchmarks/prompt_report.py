@@ -0,0 +1,95 @@
+"""
+Reports the prompt size per template with the whole syntax guide and with the
+examples selected by the prompt compiler, and the size of the static system prefix
+that providers can cache.
+
+    python -m benchmarks.prompt_report
+    python -m benchmarks.prompt_report --budget 400 --max-examples 3 --output prompts.json
+"""
+import sys
+import json
+import logging
+import argparse
+from typing import Any, Dict, List, Optional
+
+from app.services.prompt_compiler import PromptCompiler, estimate_tokens
+from app.services.template_service import template_registry
+from app.utils.mermaid_utils import build_prompt
+from app.utils.template_utils import TemplateEnum
+
+# A typical request per template, matching the topics of the benchmark corpus
+REPORT_INPUTS: Dict[str, str] = {
+    TemplateEnum.FLOWCHART.value: "user login with a decision for valid credentials and an error path",
+    TemplateEnum.CLASS.value: "a library system with books, members and loans, with inheritance and interfaces",
+    TemplateEnum.MINDMAP.value: "renewable energy sources and storage",
+    TemplateEnum.TIMELINE.value: "history of the web by decade",
+    TemplateEnum.USERJOURNEY.value: "ordering coffee with a mobile app",
+    TemplateEnum.ENTITYRELATIONSHIP.value: "customers placing orders with line items and products, with keys",
+    TemplateEnum.SEQUENCE.value: "browser login against a server and database, with an alternative for invalid passwords",
+    TemplateEnum.STATE.value: "a job that is idle, processing, succeeded or failed, with retries",
+    TemplateEnum.GANTT.value: "website redesign plan with discovery, design and build phases",
+    TemplateEnum.QUADRANT.value: "feature prioritisation by effort and impact",
+    TemplateEnum.SANKEY.value: "monthly budget flows from income to expenses",
+    TemplateEnum.REQUIREMENT.value: "login and password reset requirements satisfied by a login page",
+    TemplateEnum.BLOCK.value: "frontend, backend, cache and database blocks",
+    TemplateEnum.ZENUML.value: "a client creating an order through a controller, service and database",
+}
+
+
+def report(compiler: PromptCompiler, inputs: Dict[str, str]) -> List[Dict[str, Any]]:
+    whole_guide = PromptCompiler(compiler.registry, token_budget=0)
+    rows = []
+    for template in TemplateEnum:
+        name = template.value
+        input = inputs[name]
+        compiled = compiler.compile(name, input)
+        before = build_prompt(input, name, whole_guide.compile(name, input)).text
+        prompt = build_prompt(input, name, compiled)
+        after = prompt.text
+        rows.append({
+            "template": name,
+            "input": input,
+            "before_chars": len(before),
+            "after_chars": len(after),
+            "before_tokens": estimate_tokens(before),
+            "after_tokens": estimate_tokens(after),
+            "prefix_tokens": estimate_tokens(prompt.system),
+            "reduction": round(1 - len(after) / len(before), 3),
+            "examples": compiled.examples,
+            "total_examples": compiled.total_examples,
+        })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget', type=int, help="Token budget of the syntax guide (default: PROMPT_TOKEN_BUDGET).")
+    parser.add_argument('--max-examples', type=int, help="Maximum number of examples (default: PROMPT_MAX_EXAMPLES).")
+    parser.add_argument('--input', help="Use this input for every template instead of the built-in ones.")
+    parser.add_argument('--output', help="Also write the report as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    template_registry.load()
+    compiler = PromptCompiler(template_registry, token_budget=args.budget, max_examples=args.max_examples)
+    inputs = {name: args.input for name in REPORT_INPUTS} if args.input else REPORT_INPUTS
+    rows = report(compiler, inputs)
+
+    print(f"{'template':<20} {'before_tok':>10} {'after_tok':>10} {'prefix_tok':>10} {'reduction':>9}  examples")
+    for row in rows:
+        print(f"{row['template']:<20} {row['before_tokens']:>10} {row['after_tokens']:>10} {row['prefix_tokens']:>10}"
+              f" {row['reduction']:>9.0%}  {len(row['examples'])}/{row['total_examples']}")
+    before = sum(row['before_tokens'] for row in rows)
+    after = sum(row['after_tokens'] for row in rows)
+    prefix = sum(row['prefix_tokens'] for row in rows)
+    print(f"{'total':<20} {before:>10} {after:>10} {prefix:>10} {1 - after / before:>9.0%}")
+    print(f"compiler: {compiler.version}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({"compiler": compiler.version, "templates": rows}, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Runs the generation pipeline benchmarks and writes the results as JSON.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --baseline benchmarks/results/main.json --threshold 0.2
+
+With `--baseline`, every benchmark whose median got slower than the baseline by more
+than the threshold is reported and the run exits with status 1.
+"""
+import os
+import sys
+import json
+import time
+import timeit
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from app import create_app
+from app.config import update_settings
+from app.services.cache_service import result_cache
+from app.services.template_service import template_registry
+from app.services.prompt_compiler import prompt_compiler
+from app.utils.mermaid_extractor import MermaidExtractor, extract_mermaid_code
+from app.utils.mermaid_utils import build_prompt
+from app.utils.template_utils import TemplateEnum
+
+from benchmarks.corpus import VARIANTS, is_valid_extraction, load_corpus
+from benchmarks.stub_llm import stub_provider
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+DEFAULT_OUTPUT = os.path.join(RESULTS_DIR, 'latest.json')
+DEFAULT_THRESHOLD = 0.2
+STREAM_CHUNK_SIZE = 16
+BENCH_INPUT = "the checkout process of an online shop, from cart review to order confirmation"
+
+
+def _summarize(per_op_ns: List[float]) -> Dict[str, Any]:
+    ordered = sorted(per_op_ns)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "median_us": round(statistics.median(ordered) / 1000, 3),
+        "mean_us": round(statistics.fmean(ordered) / 1000, 3),
+        "min_us": round(ordered[0] / 1000, 3),
+        "p95_us": round(p95 / 1000, 3),
+        "samples": len(ordered),
+    }
+
+
+def time_micro(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """
+    Times a fast function in batches sized to take at least 0.2 seconds each.
+
+    Args:
+        fn (Callable[[], Any]): The function to time.
+        repeat (int): The number of batches.
+
+    Returns:
+        Dict[str, Any]: Per-call timing statistics in microseconds.
+    """
+    timer = timeit.Timer(fn, timer=time.perf_counter_ns)
+    number, _ = timer.autorange()
+    batches = timer.repeat(repeat=repeat, number=number)
+    result = _summarize([batch / number for batch in batches])
+    result["calls_per_sample"] = number
+    return result
+
+
+def time_calls(fn: Callable[[], Any], rounds: int, warmup: int = 3) -> Dict[str, Any]:
+    """
+    Times each call of a slower function individually.
+
+    Args:
+        fn (Callable[[], Any]): The function to time.
+        rounds (int): The number of timed calls.
+        warmup (int): The number of untimed calls made first.
+
+    Returns:
+        Dict[str, Any]: Per-call timing statistics in microseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter_ns()
+        fn()
+        timings.append(time.perf_counter_ns() - start)
+    return _summarize(timings)
+
+
+def _stream_extract(text: str) -> str:
+    extractor = MermaidExtractor()
+    for start in range(0, len(text), STREAM_CHUNK_SIZE):
+        extractor.feed(text[start:start + STREAM_CHUNK_SIZE])
+    return extractor.close()
+
+
+def bench_extraction(repeat: int) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for variant in VARIANTS:
+        samples = load_corpus(variant)
+        for sample in samples:
+            results[f"extract.{sample.name}"] = time_micro(lambda text=sample.text: extract_mermaid_code(text), repeat)
+
+        texts = [sample.text for sample in samples]
+        results[f"extract.corpus.{variant}"] = time_micro(
+            lambda: [extract_mermaid_code(text) for text in texts], repeat)
+        results[f"extract.streamed.{variant}"] = time_micro(
+            lambda: [_stream_extract(text) for text in texts], repeat)
+    return results
+
+
+def bench_prompt(repeat: int) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for template in TemplateEnum:
+        def assemble(template=template.value):
+            return build_prompt(BENCH_INPUT, template, prompt_compiler.compile(template, BENCH_INPUT))
+        results[f"prompt.{template.value.lower()}"] = time_micro(assemble, repeat)
+    return results
+
+
+def bench_end_to_end(rounds: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Times `/api/ask` and `/api/ask/stream` through the Flask test client, with the
+    stub LLM answering from the corpus and the result cache disabled.
+    """
+    app = create_app()
+    client = app.test_client()
+    templates = [template.value for template in TemplateEnum]
+    results = {}
+
+    with stub_provider() as provider:
+        for variant in VARIANTS:
+            for endpoint, name in (('/api/ask', 'ask'), ('/api/ask/stream', 'ask_stream')):
+                position = 0
+
+                def request_once():
+                    nonlocal position
+                    template = templates[position % len(templates)]
+                    position += 1
+                    response = client.post(endpoint, json={
+                        "input": BENCH_INPUT,
+                        "selectedTemplate": template,
+                        "provider": provider,
+                        "model": variant,
+                        "temperature": 0.2,
+                        "maxTokens": 1024,
+                    })
+                    response.get_data()
+                    if response.status_code != 200:
+                        raise RuntimeError(f"{endpoint} returned {response.status_code}: {response.get_data(as_text=True)}")
+
+                results[f"e2e.{name}.{variant}"] = time_calls(request_once, rounds)
+    return results
+
+
+def check_corpus() -> Dict[str, Any]:
+    """
+    Extracts every corpus sample and reports which ones do not start with the
+    diagram keyword of their template.
+    """
+    samples = load_corpus()
+    invalid = [sample.name for sample in samples
+               if not is_valid_extraction(sample.template, extract_mermaid_code(sample.text))]
+    return {
+        "samples": len(samples),
+        "valid": len(samples) - len(invalid),
+        "invalid": invalid,
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[Dict[str, Any]]:
+    """
+    Compares the median of every benchmark present in both runs.
+
+    Args:
+        results (Dict[str, Dict[str, Any]]): The benchmarks of this run.
+        baseline (Dict[str, Dict[str, Any]]): The benchmarks of the baseline run.
+        threshold (float): The allowed relative slowdown, e.g. 0.2 for 20%.
+
+    Returns:
+        List[Dict[str, Any]]: The benchmarks that regressed beyond the threshold.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("median_us"):
+            continue
+        ratio = result["median_us"] / base["median_us"]
+        if ratio > 1 + threshold:
+            regressions.append({
+                "name": name,
+                "baseline_us": base["median_us"],
+                "current_us": result["median_us"],
+                "ratio": round(ratio, 3),
+            })
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_table(results: Dict[str, Dict[str, Any]], regressions: List[Dict[str, Any]]) -> None:
+    regressed = {regression["name"]: regression for regression in regressions}
+    width = max(len(name) for name in results)
+    print(f"{'benchmark':<{width}}  {'median_us':>12}  {'p95_us':>12}")
+    for name, result in results.items():
+        note = f"  REGRESSION x{regressed[name]['ratio']}" if name in regressed else ""
+        print(f"{name:<{width}}  {result['median_us']:>12.3f}  {result['p95_us']:>12.3f}{note}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="Where to write the JSON results.")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed relative slowdown of a median before the run fails (default 0.2).")
+    parser.add_argument('--repeat', type=int, default=7, help="Timed batches per micro-benchmark.")
+    parser.add_argument('--rounds', type=int, default=100, help="Timed requests per end-to-end benchmark.")
+    parser.add_argument('--only', choices=('extract', 'prompt', 'e2e'), action='append',
+                        help="Only run these benchmark groups (repeatable).")
+    args = parser.parse_args(argv)
+
+    # Keep the pipeline's per-request logging out of the measurements
+    update_settings(LOG_LEVEL="WARNING")
+    logging.getLogger().setLevel(logging.WARNING)
+    result_cache.configure(enabled=False)
+    template_registry.load()
+
+    groups = args.only or ['extract', 'prompt', 'e2e']
+    results: Dict[str, Dict[str, Any]] = {}
+    if 'extract' in groups:
+        results.update(bench_extraction(args.repeat))
+    if 'prompt' in groups:
+        results.update(bench_prompt(args.repeat))
+    if 'e2e' in groups:
+        results.update(bench_end_to_end(args.rounds))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline.get("benchmarks", {}), args.threshold)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "baseline": args.baseline,
+            "threshold": args.threshold if args.baseline else None,
+        },
+        "corpus": check_corpus(),
+        "benchmarks": results,
+        "regressions": regressions,
+    }
+
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+
+    _print_table(results, regressions)
+    corpus = report["corpus"]
+    print(f"\ncorpus: {corpus['valid']}/{corpus['samples']} samples extract to a valid diagram header")
+    print(f"results written to {args.output}")
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import re
+import asyncio
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Iterator
+
+from app.llm.llm_manager import BaseLLM, LLMFactory
+from app.llm.prompt import prompt_text
+
+from benchmarks.corpus import load_corpus
+
+STUB_PROVIDER = 'benchmark-stub'
+
+TEMPLATE_IN_PROMPT_PATTERN = re.compile(r'Create a (\w+) diagram')
+
+
+class StubLLM(BaseLLM):
+    """
+    LLM that answers from the benchmark corpus instead of calling a provider.
+
+    The template is read from the prompt and the model name selects the corpus
+    variant ("clean" or "messy"), so the rest of the pipeline runs unchanged.
+    """
+
+    supported_params = frozenset({"temperature", "max_tokens"})
+    supports_streaming = True
+    chunk_size = 16
+
+    def __init__(self, config):
+        super().__init__(config)
+        variant = config.model if config.model in ('clean', 'messy') else 'clean'
+        self.responses: Dict[str, str] = {sample.template: sample.text for sample in load_corpus(variant)}
+
+    def _create_client(self):
+        return None
+
+    def _response_for(self, prompt) -> str:
+        match = TEMPLATE_IN_PROMPT_PATTERN.search(prompt_text(prompt))
+        template = match.group(1).upper() if match else 'FLOWCHART'
+        return self.responses.get(template, self.responses['FLOWCHART'])
+
+    def get_response(self, prompt, **kwargs) -> str:
+        return self._response_for(prompt)
+
+    async def aget_response(self, prompt, **kwargs) -> str:
+        return self._response_for(prompt)
+
+    async def astream_response(self, prompt, **kwargs) -> AsyncIterator[str]:
+        text = self._response_for(prompt)
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+            await asyncio.sleep(0)
+
+
+@contextmanager
+def stub_provider() -> Iterator[str]:
+    """
+    Registers `StubLLM` with the LLM factory for the duration of the block.
+
+    Yields:
+        str: The provider name to select the stub with.
+    """
+    LLMFactory.llm_classes[STUB_PROVIDER] = StubLLM
+    try:
+        yield STUB_PROVIDER
+    finally:
+        LLMFactory.llm_classes.pop(STUB_PROVIDER, None)
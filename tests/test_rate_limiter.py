@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from app.llm.rate_limiter import RateLimiter, RateLimitQueueError, report_usage
+
+KEY = ("openai", "gpt-4o", "keyhash")
+# A default call: a short prompt plus the default maxTokens of 4096
+CALL_TOKENS = 500 + 4096
+
+
+def _limiter(tpm: int) -> RateLimiter:
+    limiter = RateLimiter()
+    limiter.observe(KEY, {"x-ratelimit-limit-requests": "500", "x-ratelimit-limit-tokens": str(tpm)})
+    return limiter
+
+
+@pytest.mark.parametrize("tpm", [10000, 30000])
+def test_first_call_on_idle_key_does_not_wait(tpm):
+    # The call costs more than the bucket holds, which must not throttle an idle key
+    waited = asyncio.run(_limiter(tpm).acquire(KEY, CALL_TOKENS, max_wait=10))
+    assert waited == 0.0
+
+
+def test_oversized_calls_are_still_paced():
+    limiter = _limiter(10000)
+    asyncio.run(limiter.acquire(KEY, CALL_TOKENS, max_wait=10))
+    with pytest.raises(RateLimitQueueError):
+        asyncio.run(limiter.acquire(KEY, CALL_TOKENS, max_wait=10))
+
+
+def test_unused_reservation_is_given_back():
+    limiter = _limiter(10000)
+    bucket = limiter._keys[KEY].tokens
+
+    async def call(used):
+        with limiter.settlement():
+            await limiter.acquire(KEY, CALL_TOKENS, max_wait=10)
+            if used is not None:
+                report_usage(used)
+
+    asyncio.run(call(600))
+    assert bucket.level == pytest.approx(bucket.capacity - 600, abs=1)
+    # A call that reports no usage, e.g. because it failed, keeps its reservation
+    asyncio.run(call(None))
+    assert bucket.level == pytest.approx(bucket.capacity - 600 - CALL_TOKENS, abs=1)